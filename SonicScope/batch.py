@@ -0,0 +1,306 @@
+"""
+batch.py
+Headless batch processing of many WAV files in parallel.
+
+Applies a declared chain of operations (scale, shift, Butterworth/FIR filter,
+FFT) to every input file with a ProcessPoolExecutor. Filter designs are made
+once in the parent and shared with the workers, the number of files in flight
+is bounded, and per-file timings are reported.
+
+Example:
+    python batch.py recordings/ -o processed/ --scale 0.8 --butter lowpass:1000 --fft
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+
+import dsp
+import filter_design as design
+import pipeline
+import spectrum
+import wav_decode
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+_designs = {}  # (step index, rate) -> sos or taps, set in each worker
+
+
+# === Chain ===
+class _ChainAction(argparse.Action):
+
+    """
+    Append (step, value) to args.chain so steps keep their command-line order.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        chain = getattr(namespace, 'chain', None) or []
+        chain.append((self.dest, values))
+        namespace.chain = chain
+
+
+def parse_filter_spec(spec):
+
+    """
+    Parse a filter spec 'btype:cutoff[:order]'.
+    The cutoff is a frequency in Hz, or 'low-high' for band filters.
+    output:
+        (btype, cutoff, order or None)
+    """
+
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"Invalid filter spec '{spec}', expected btype:cutoff[:order]")
+    btype, cutoff = parts[0], parts[1]
+    if '-' in cutoff:
+        cutoff = tuple(float(c) for c in cutoff.split('-'))
+    else:
+        cutoff = float(cutoff)
+    order = int(parts[2]) if len(parts) == 3 else None
+    return btype, cutoff, order
+
+
+def parse_shift_spec(spec):
+
+    """
+    Parse a shift spec 'ms' or 'ms,ms,...' (one delay per channel).
+    output:
+        float, or tuple of floats
+    """
+
+    values = tuple(float(v) for v in spec.split(','))
+    return values[0] if len(values) == 1 else values
+
+
+def design_chain(chain, rates):
+
+    """
+    Design every filter in the chain for every sample rate.
+    output:
+        dict (step index, rate) -> sos (Butterworth) or taps (FIR)
+    """
+
+    designs = {}
+    for i, (step, value) in enumerate(chain):
+        if step not in ('butter', 'fir'):
+            continue
+        btype, cutoff, order = value
+        for rate in rates:
+            if step == 'butter':
+                designs[i, rate] = design.butter_sos(order or 5, cutoff, btype, rate)
+            else:
+                numtaps = dsp.fir_numtaps(order or 101, btype)
+                designs[i, rate] = design.fir_taps(numtaps, cutoff, btype, rate)
+    return designs
+
+
+# === Worker ===
+def _init_worker(designs):
+    global _designs
+    _designs = designs
+
+
+def build_pipeline(chain, rate, output_filename):
+
+    """
+    Build the Pipeline for one file from the chain and the shared designs.
+    """
+
+    chain_pipeline = pipeline.Pipeline().sink(output_filename)
+    for i, (step, value) in enumerate(chain):
+        if step == 'scale':
+            chain_pipeline.scale(value)
+        elif step == 'shift':
+            chain_pipeline.shift(value)
+        elif step == 'butter':
+            btype, cutoff, order = value
+            chain_pipeline.butter(cutoff, btype, order, sos=_designs[i, rate])
+        elif step == 'fir':
+            btype, cutoff, _ = value
+            chain_pipeline.fir(cutoff, btype, taps=_designs[i, rate])
+        elif step == 'fft':
+            chain_pipeline.tap(lambda x, r: _save_spectrum(x, r, output_filename), 'fft')
+    return chain_pipeline
+
+
+def _save_spectrum(data, rate, output_filename):
+    result = spectrum.compute(data, rate, window='hamming')
+    np.savez(os.path.splitext(output_filename)[0] + '_fft.npz',
+             freq=result.freq, magnitude=result.magnitude)
+
+
+def process_file(input_filename, output_filename, chain):
+
+    """
+    Apply the chain to one file and write the result.
+    output:
+        dict with the file names, sample count and per-step timings in seconds
+    """
+
+    timings = {}
+    start = time.perf_counter()
+    rate, data = pipeline.load(input_filename)
+    timings['read'] = time.perf_counter() - start
+
+    chain_pipeline = build_pipeline(chain, rate, output_filename)
+    chain_pipeline.run(data, rate, timings)
+    return {
+        'input': input_filename,
+        'output': output_filename,
+        'samples': len(data),
+        'rate': rate,
+        'timings': timings,
+        'total': time.perf_counter() - start,
+    }
+
+
+# === Driver ===
+def output_names(files, output_dir):
+
+    """
+    Output path of every input: its base name in output_dir, with a _2, _3, ...
+    suffix when inputs (e.g. from different directories) share a base name.
+    output:
+        list of output paths, in the order of files
+    """
+
+    names = []
+    taken = set()
+    for f in files:
+        stem, ext = os.path.splitext(os.path.basename(f))
+        name, count = stem + ext, 1
+        while name.lower() in taken:
+            count += 1
+            name = f"{stem}_{count}{ext}"
+        if count > 1:
+            log.warning("%s: output name %s is already used, writing %s", f, stem + ext, name)
+        taken.add(name.lower())
+        names.append(os.path.join(output_dir, name))
+    return names
+
+
+def _failure(f, e):
+    # Called from an except block: the traceback is logged with the error
+    log.exception("Failed to process %s", f)
+    return {'input': f, 'error': str(e)}
+
+
+def run_batch(files, output_dir, chain, workers=None, max_in_flight=None):
+
+    """
+    Process files in parallel.
+    input:
+        files: list of input WAV paths
+        output_dir: directory for the processed files (same base names, see output_names)
+        chain: list of (step, value) pairs, see parse_args
+        workers: number of worker processes (default: CPU count)
+        max_in_flight: maximum number of submitted, unfinished files
+    output:
+        list of per-file result dicts (failures have an 'error' entry)
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * MAX_IN_FLIGHT_PER_WORKER
+
+    # Read the headers and design the filters file by file, so an unreadable
+    # file or a cutoff its rate cannot take fails that file, not the batch
+    results = []
+    rates = {}
+    designs = {}
+    for f in files:
+        try:
+            rate = wav_decode.inspect(f).rate
+            if rate not in rates.values():
+                designs.update(design_chain(chain, [rate]))
+            rates[f] = rate
+        except Exception as e:
+            results.append(_failure(f, e))
+
+    queue = [f for f in files if f in rates]
+    queue = list(zip(queue, output_names(queue, output_dir)))
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(designs,)) as pool:
+        while queue or pending:
+            while queue and len(pending) < max_in_flight:
+                f, out = queue.pop(0)
+                pending[pool.submit(process_file, f, out, chain)] = f
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                f = pending.pop(future)
+                try:
+                    result = future.result()
+                    print(f"{f}: {result['samples']} samples in {result['total']:.3f} s")
+                except Exception as e:
+                    result = _failure(f, e)
+                results.append(result)
+    return results
+
+
+def collect_inputs(paths):
+
+    """
+    Expand directories into the WAV files they contain.
+    """
+
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(sorted(glob.glob(os.path.join(p, '*.wav'))))
+        else:
+            files.append(p)
+    return files
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Apply a SonicScope processing chain to many WAV files.')
+    parser.add_argument('inputs', nargs='+', help='WAV files or directories of WAV files')
+    parser.add_argument('-o', '--output-dir', required=True, help='directory for processed files')
+    parser.add_argument('--scale', type=float, action=_ChainAction, help='scale by a factor')
+    parser.add_argument('--shift', type=parse_shift_spec, action=_ChainAction, metavar='MS[,MS...]',
+                        help='time shift in ms (fractional allowed), or one per channel')
+    parser.add_argument('--butter', type=parse_filter_spec, action=_ChainAction, metavar='BTYPE:CUTOFF[:ORDER]',
+                        help='Butterworth filter, e.g. lowpass:1000 or bandpass:300-3000:4')
+    parser.add_argument('--fir', type=parse_filter_spec, action=_ChainAction, metavar='BTYPE:CUTOFF[:TAPS]',
+                        help='FIR filter, e.g. highpass:200:1001')
+    parser.add_argument('--fft', nargs=0, action=_ChainAction, help='save the spectrum as <name>_fft.npz')
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    parser.add_argument('--max-in-flight', type=int, help='maximum files submitted at once')
+    parser.add_argument('--report', help='write per-file timings to this JSON file')
+    parser.set_defaults(chain=[])
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Results and the summary are printed; diagnostics go to the log (SONICSCOPE_LOG=INFO for more)
+    logging.basicConfig(level=os.environ.get('SONICSCOPE_LOG', 'WARNING'),
+                        format='%(levelname)s %(name)s: %(message)s')
+    files = collect_inputs(args.inputs)
+    if not files:
+        log.error("No input files found.")
+        return 1
+    chain = [(step, value if value != [] else None) for step, value in args.chain]
+
+    start = time.perf_counter()
+    results = run_batch(files, args.output_dir, chain, args.workers, args.max_in_flight)
+    elapsed = time.perf_counter() - start
+    failed = sum('error' in r for r in results)
+    print(f"Processed {len(results) - failed}/{len(results)} files in {elapsed:.2f} s")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'chain': chain, 'elapsed': elapsed, 'files': results}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,554 @@
+"""
+benchmarks.py
+Reproducible benchmarks of the SonicScope and signal generator hot paths.
+
+Inputs are synthesized, never recorded: for every length, sample rate and
+channel count of the grid a WAV file of tones and noise is written once
+(block by block, so an hour of audio never sits in memory) and every case
+runs against it through a benchmark session, headless: no audio device,
+no browser. Caches (signal store, spectra, plot pyramids) and figures are
+reset before each run, so each run pays the full cost of the operation.
+
+Per case the wall time (minimum and median of --repeat runs) and the peak
+of Python/NumPy allocations (tracemalloc, one extra run) are recorded. With
+--rss every case runs in a fresh process that also reports its peak RSS
+growth, which includes memory-mapped pages tracemalloc does not see.
+
+Results are written as JSON and compared with a baseline saved by an
+earlier run (--save-baseline). A case regresses when it is slower than
+the baseline by more than --threshold (and MIN_SECONDS), or allocates more
+by more than --memory-threshold (and MIN_BYTES). Baselines are only
+meaningful on the machine that produced them; without one, nothing is
+compared.
+
+Before the cases, every module of IMPORT_MODULES (import_budget.py) is imported alone in a fresh
+interpreter: it must load within --import-budget and without any of
+HEAVY_MODULES (scipy.signal, plotly, sounddevice, ...), which the DSP core
+only imports on first use. --imports-only runs just this check.
+
+Example:
+    python benchmarks.py --save-baseline
+    python benchmarks.py --cases 'fir*' 'fft' --lengths 1 60 -o results.json
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import gc
+import importlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, NamedTuple, Optional
+import numpy as np
+import scipy
+
+import session
+import signal_processing as sp
+import signal_store as store
+import signal_tools as tools
+import spectrum
+import trace_lod
+from sample_format import quantize
+from wav_io import WavWriter
+from import_budget import IMPORT_MODULES, IMPORT_BUDGET, HEAVY_MODULES
+
+# === Constants ===
+LENGTHS = (1, 10, 60)                  # seconds, default grid
+FULL_LENGTHS = (1, 10, 60, 600, 3600)  # seconds, with --full
+RATES = (44100, 48000)                 # in Hz
+CHANNELS = (1, 2)
+REPEAT = 3
+THRESHOLD = 0.25         # relative slowdown that counts as a regression
+MEMORY_THRESHOLD = 0.25  # relative growth of peak allocations that counts as a regression
+MIN_SECONDS = 0.005      # smaller slowdowns are timer noise
+MIN_BYTES = 1 << 20      # smaller memory growth is allocator noise
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+GENERATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'signal-generator-app')
+CUTOFF = 1000  # in Hz, for the filter cases
+
+
+# === Inputs ===
+def synthesize(filename, seconds, rate, channels, seed=0):
+
+    """
+    Write a test WAV file: a tone per channel plus a sweep and low-level noise,
+    16-bit PCM, one second at a time.
+    """
+
+    rng = np.random.default_rng(seed)
+    tones = 220.0 * (1 + np.arange(channels))
+    with WavWriter(filename, rate, channels) as writer:
+        for start in range(0, int(seconds * rate), rate):
+            n = min(rate, int(seconds * rate) - start)
+            t = (start + np.arange(n)) / rate
+            sweep = np.sin(2 * np.pi * (50 + 10 * (t % 100)) * t)
+            block = 0.4 * np.sin(2 * np.pi * np.outer(t, tones)) + 0.2 * sweep[:, None]
+            block += 0.05 * rng.standard_normal((n, channels))
+            writer.write(quantize(block, dither=False))
+
+
+def input_dir(workdir, seconds, rate, channels):
+
+    """
+    Directory holding the synthesized input.wav of one grid point, created on first use.
+    """
+
+    directory = os.path.join(workdir, f"{seconds}s-{rate}Hz-{channels}ch")
+    filename = os.path.join(directory, 'input.wav')
+    if not os.path.exists(filename):
+        os.makedirs(directory, exist_ok=True)
+        synthesize(filename + '.part', seconds, rate, channels)
+        os.replace(filename + '.part', filename)
+    return directory
+
+
+# === Cases ===
+class Case(NamedTuple):
+
+    """
+    One benchmarked operation.
+    run: run(session, seconds, rate), timed
+    setup: optional setup(session, seconds, rate), run before each run, not timed
+    mono: True for cases that do not read the input (run for one channel only)
+    """
+
+    run: Callable
+    setup: Optional[Callable] = None
+    mono: bool = False
+
+
+def _apply_filter(s, seconds, rate):
+    rate, data = tools.open_signal(s.input_filename, mmap=True)
+    sp.apply_filter(data, rate, CUTOFF, 'lowpass', output_filename=s.output_filename)
+
+
+def _zoom_setup(s, seconds, rate):
+    tools.plot_Input_signal()
+
+
+def _zoom(s, seconds, rate):
+    tools.update_time_window(0.25 * seconds, 0.5 * seconds)
+
+
+def _generators():
+    # signals.py lives in the signal generator app next to SonicScope
+    if GENERATOR_DIR not in sys.path:
+        sys.path.insert(0, GENERATOR_DIR)
+    return importlib.import_module('signals')
+
+
+def _generator(name, *args, **kwargs):
+    # signals.py generators take (..., duration, fs[, extra]) after their own parameters
+    def run(s, seconds, rate):
+        getattr(_generators(), name)(*args, seconds, rate, **kwargs)
+    return Case(run, mono=True)
+
+
+CASES = {
+    'open_signal': Case(lambda s, seconds, rate: tools.open_signal(s.input_filename)),
+    'open_signal_mmap': Case(lambda s, seconds, rate: tools.open_signal(s.input_filename, mmap=True)),
+    'apply_filter': Case(_apply_filter),
+    'apply_filter_stream': Case(lambda s, seconds, rate: sp.apply_filter_stream(
+        s.input_filename, CUTOFF, 'lowpass', output_filename=s.output_filename)),
+    'fir': Case(lambda s, seconds, rate: sp.FIR(
+        s.input_filename, CUTOFF, 'lowpass', output_filename=s.output_filename)),
+    'fir_stream': Case(lambda s, seconds, rate: sp.FIR(
+        s.input_filename, CUTOFF, 'lowpass', stream=True, output_filename=s.output_filename)),
+    'fft': Case(lambda s, seconds, rate: sp.fft(s.input_filename, window='hamming')),
+    'add_fft_trace': Case(lambda s, seconds, rate: tools.add_fft_trace('FFT', s.input_filename)),
+    'add_psd_trace': Case(lambda s, seconds, rate: tools.add_psd_trace('PSD', s.input_filename)),
+    'plot_input': Case(lambda s, seconds, rate: tools.plot_Input_signal()),
+    'time_window': Case(_zoom, setup=_zoom_setup),
+    'generate_sine': _generator('generate_sine', 440.0, 0.8, 0.0, 0.0),
+    'generate_square': _generator('generate_square', 440.0, 0.8, 0.0, 0.0),
+    'generate_triangle': _generator('generate_triangle', 440.0, 0.8, 0.0, 0.0),
+    'generate_sawtooth': _generator('generate_sawtooth', 440.0, 0.8, 0.0, 0.0),
+    'generate_custom': _generator('generate_custom', 440.0, 0.8, 0.0, 0.0, harmonics=[1, 0.5, 0.33, 0.25]),
+    'generate_noise': _generator('generate_noise', 0.8, 0.0, color='pink', seed=0),
+}
+
+
+def select_cases(patterns=None):
+
+    """
+    Names of the cases matching any of the glob patterns (all cases for None).
+    """
+
+    if not patterns:
+        return list(CASES)
+    return [name for name in CASES if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+
+# === Measurement ===
+def _reset(s):
+    # Every run starts cold: no cached signals, spectra, pyramids or traces
+    store.clear()
+    spectrum.clear()
+    trace_lod.clear()
+    s.fig_time.data = []
+    s.fig_freq.data = []
+    session.call(s, tools.clear_time_traces)
+    gc.collect()
+
+
+class _ErrorLog(logging.Handler):
+
+    """
+    Collects the errors logged during a run.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _call(s, func, seconds, rate):
+    # The library logs failures (or prints [ERROR] lines) and carries on; turn them into exceptions
+    out = io.StringIO()
+    errors = _ErrorLog()
+    root = logging.getLogger()
+    root.addHandler(errors)
+    try:
+        with contextlib.redirect_stdout(out):
+            session.call(s, func, s, seconds, rate)
+    finally:
+        root.removeHandler(errors)
+    errors.messages += [line for line in out.getvalue().splitlines() if line.startswith('[ERROR]')]
+    if errors.messages:
+        raise RuntimeError(errors.messages[0])
+
+
+def _max_rss():
+    # Peak resident set size of this process in bytes, or None where unavailable
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(name, directory, seconds, rate, channels, repeat=REPEAT):
+
+    """
+    Run one case on one grid point.
+    output:
+        result dict (key, case, grid point, time_min, time_median, peak_bytes
+        and rss_bytes, or error)
+    """
+
+    case = CASES[name]
+    result = {'key': f"{name}/{seconds}s/{rate}Hz/{channels}ch", 'case': name,
+              'seconds': seconds, 'rate': rate, 'channels': channels}
+    s = session.Session(f"benchmark-{name}", directory)
+    rss_before = _max_rss()
+    try:
+        times = []
+        for _ in range(repeat):
+            _reset(s)
+            if case.setup is not None:
+                _call(s, case.setup, seconds, rate)
+            start = time.perf_counter()
+            _call(s, case.run, seconds, rate)
+            times.append(time.perf_counter() - start)
+        result['time_min'] = min(times)
+        result['time_median'] = statistics.median(times)
+        result['runs'] = times
+
+        # Allocations are traced in a separate run: tracemalloc slows allocations down
+        _reset(s)
+        if case.setup is not None:
+            _call(s, case.setup, seconds, rate)
+        tracemalloc.start()
+        try:
+            _call(s, case.run, seconds, rate)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        _reset(s)
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.close()
+    rss_after = _max_rss()
+    if rss_before is not None:
+        result['rss_bytes'] = rss_after - rss_before
+    return result
+
+
+def _measure_isolated(args):
+    # Runs in a fresh process: the RSS growth is this case's alone
+    return measure(*args)
+
+
+def run_benchmarks(names, lengths=LENGTHS, rates=RATES, channels=CHANNELS, repeat=REPEAT,
+                   workdir=None, isolate=False):
+
+    """
+    Run the selected cases over the grid.
+    input:
+        names: case names (see CASES)
+        lengths, rates, channels: grid of synthesized inputs
+        repeat: timed runs per case
+        workdir: directory for the synthesized inputs (kept), or None for a temporary one
+        isolate: run every case in a fresh process, so rss_bytes is meaningful
+    output:
+        dict with 'meta' and 'results'
+    """
+
+    temporary = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='sonicscope-bench-')
+    results = []
+    pool = multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) if isolate else None
+    try:
+        for seconds in lengths:
+            for rate in rates:
+                for count in channels:
+                    todo = [n for n in names if not (CASES[n].mono and count != min(channels))]
+                    if not todo:
+                        continue
+                    directory = input_dir(workdir, seconds, rate, count)
+                    for name in todo:
+                        args = (name, directory, seconds, rate, count, repeat)
+                        result = pool.apply(_measure_isolated, (args,)) if pool else measure(*args)
+                        if not isolate:
+                            result.pop('rss_bytes', None)  # the process peak of all cases so far
+                        results.append(result)
+                        print(_format(result), flush=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if temporary:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {'meta': metadata(repeat), 'results': results}
+
+
+def metadata(repeat=REPEAT):
+
+    """
+    Description of the machine and library versions the results come from.
+    """
+
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+    }
+
+
+# === Baseline ===
+def compare(results, baseline, threshold=THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+
+    """
+    Compare results with a baseline, case by case.
+    output:
+        list of dicts with key, time_ratio, memory_ratio and regression
+        (None, 'time', 'memory' or 'time+memory'), for the keys found in both
+    """
+
+    base = {r['key']: r for r in baseline['results'] if 'error' not in r}
+    rows = []
+    for r in results['results']:
+        b = base.get(r['key'])
+        if b is None or 'error' in r:
+            continue
+        row = {'key': r['key'], 'time': r['time_min'], 'baseline_time': b['time_min'],
+               'time_ratio': r['time_min'] / b['time_min'] if b['time_min'] > 0 else None}
+        slow = (r['time_min'] > b['time_min'] * (1 + threshold)
+                and r['time_min'] - b['time_min'] > MIN_SECONDS)
+        heavy = False
+        if 'peak_bytes' in r and 'peak_bytes' in b:
+            row['memory_ratio'] = r['peak_bytes'] / b['peak_bytes'] if b['peak_bytes'] > 0 else None
+            heavy = (r['peak_bytes'] > b['peak_bytes'] * (1 + memory_threshold)
+                     and r['peak_bytes'] - b['peak_bytes'] > MIN_BYTES)
+        row['regression'] = '+'.join(k for k, v in (('time', slow), ('memory', heavy)) if v) or None
+        rows.append(row)
+    return rows
+
+
+def load_baseline(filename):
+
+    """
+    Load a saved baseline, or return None if there is none.
+    """
+
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_baseline(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Baseline saved to {filename}")
+
+# === Import time ===
+_IMPORT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))
+'''
+
+
+def import_times(modules=IMPORT_MODULES, budget=IMPORT_BUDGET):
+
+    """
+    Import each module alone in a fresh interpreter and check it against the budget.
+    A module fails when it takes longer than budget or loads one of HEAVY_MODULES,
+    which are only meant to be imported on first use (see lazy.py).
+    input:
+        modules: module names, importable from this directory
+        budget: seconds allowed per module
+    output:
+        list of dicts with module, seconds, heavy and error (None when within budget)
+    """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for module in modules:
+        probe = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        proc = subprocess.run([sys.executable, '-c', probe], cwd=here, capture_output=True, text=True)
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines() or [f"exit status {proc.returncode}"]
+            result = {'module': module, 'seconds': None, 'heavy': [], 'error': lines[-1]}
+        else:
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            result['module'] = module
+            result['error'] = None
+            if result['heavy']:
+                result['error'] = f"loads {', '.join(result['heavy'])} at import"
+            elif result['seconds'] > budget:
+                result['error'] = f"{result['seconds']:.3f} s over the {budget} s budget"
+        results.append(result)
+        print(_format_import(result), flush=True)
+    return results
+
+
+# === Report ===
+def _format(result):
+    if 'error' in result:
+        return f"{result['key']:<48} [ERROR] {result['error']}"
+    text = f"{result['key']:<48} {result['time_min'] * 1000:10.2f} ms {result['peak_bytes'] / 1e6:9.2f} MB"
+    if 'rss_bytes' in result:
+        text += f" {result['rss_bytes'] / 1e6:9.2f} MB RSS"
+    return text
+
+
+def _format_import(result):
+    name = f"import {result['module']}"
+    if result['seconds'] is None:
+        return f"{name:<48} [ERROR] {result['error']}"
+    text = f"{name:<48} {result['seconds'] * 1000:10.2f} ms"
+    if result['error']:
+        text += f"  OVER BUDGET ({result['error']})"
+    return text
+
+
+def _report(rows):
+    for row in rows:
+        ratio = row['time_ratio']
+        text = f"{row['key']:<48} x{ratio:.2f} time" if ratio is not None else f"{row['key']:<48}"
+        if row.get('memory_ratio') is not None:
+            text += f" x{row['memory_ratio']:.2f} memory"
+        if row['regression']:
+            text += f"  REGRESSION ({row['regression']})"
+        print(text)
+
+
+# === Command line ===
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', metavar='PATTERN', help="case names or glob patterns")
+    parser.add_argument('--list', action='store_true', help="list the cases and exit")
+    parser.add_argument('--lengths', nargs='+', type=float, default=LENGTHS, metavar='SECONDS')
+    parser.add_argument('--full', action='store_true', help=f"lengths {FULL_LENGTHS}")
+    parser.add_argument('--rates', nargs='+', type=int, default=RATES, metavar='HZ')
+    parser.add_argument('--channels', nargs='+', type=int, default=CHANNELS)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timed runs per case")
+    parser.add_argument('--rss', action='store_true', help="run each case in a fresh process and record its RSS")
+    parser.add_argument('--workdir', help="keep the synthesized inputs here, to reuse them")
+    parser.add_argument('-o', '--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', default=BASELINE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET, metavar='SECONDS',
+                        help="time allowed to import each of IMPORT_MODULES alone")
+    parser.add_argument('--imports-only', action='store_true', help="only check the import times")
+    parser.add_argument('--no-imports', action='store_true', help="skip the import-time check")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        print('\n'.join(CASES))
+        return 0
+    names = select_cases(args.cases)
+    if not names:
+        print(f"[ERROR] No case matches {args.cases}.")
+        return 1
+    lengths = FULL_LENGTHS if args.full else args.lengths
+    lengths = [int(x) if float(x).is_integer() else x for x in lengths]
+
+    imports = [] if args.no_imports else import_times(budget=args.import_budget)
+    slow_imports = sum(r['error'] is not None for r in imports)
+    if args.imports_only:
+        return 1 if slow_imports else 0
+
+    results = run_benchmarks(names, lengths, args.rates, args.channels, args.repeat,
+                             args.workdir, args.rss)
+    results['imports'] = imports
+    failed = sum('error' in r for r in results['results']) + slow_imports
+
+    regressions = 0
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; nothing compared (use --save-baseline).")
+    elif not args.save_baseline:
+        rows = compare(results, baseline, args.threshold, args.memory_threshold)
+        results['comparison'] = {'baseline': args.baseline, 'baseline_meta': baseline.get('meta'),
+                                 'threshold': args.threshold,
+                                 'memory_threshold': args.memory_threshold, 'cases': rows}
+        if baseline.get('meta', {}).get('platform') != results['meta']['platform']:
+            print("[WARNING] The baseline comes from another platform; ratios are not comparable.")
+        _report(rows)
+        regressions = sum(row['regression'] is not None for row in rows)
+        print(f"{regressions} regressions in {len(rows)} compared cases")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,9 +1,17 @@
-import plotly.graph_objects as go
-
 INPUT_FILENAME = "assets/input.wav"
 OUTPUT_FILENAME = "assets/output.wav"
 logo = "assets/ANF_logo.png"
+OUTPUT_FLOAT32 = False  # write output.wav as 32-bit float instead of 16-bit PCM
+DITHER = True  # TPDF dither when quantizing the output to 16 bits
+REDUCED_RATE = True  # run band-limited analysis at a decimated rate; filters opt in with reduce=True (see resampling.py)
 # === Plotly ===
+# fig_time and fig_freq are created on first access, so importing config does not load plotly
+_FIGURES = ('fig_time', 'fig_freq')
+
 
-fig_time = go.Figure()
-fig_freq = go.Figure()
\ No newline at end of file
+def __getattr__(name):
+    if name in _FIGURES:
+        import plotly.graph_objects as go
+        globals()[name] = figure = go.Figure()
+        return figure
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
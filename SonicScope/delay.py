@@ -0,0 +1,279 @@
+"""
+delay.py
+Integer, fractional and FFT phase-shift delays.
+
+All delays are linear: the signal is shifted inside a window of the same
+length, samples shifted out are lost and zeros are shifted in (no np.roll
+wrap-around). Delays are in samples, may be fractional or negative
+(an advance), and can differ per channel:
+
+    data (N,)    with one delay      -> (N,)
+    data (N,)    with D delays       -> (N, D)   one signal, many steering delays
+    data (N, C)  with one delay      -> (N, C)
+    data (N, C)  with C delays       -> (N, C)   one delay per channel
+
+Methods:
+    'integer'  whole-sample shift by slicing (per-channel shifts by one gather)
+    'sinc'     windowed-sinc fractional delay, SINC_TAPS taps, overlap-add convolution
+    'farrow'   cubic Lagrange (Farrow) interpolation, cheapest, rolls off near Nyquist
+    'fft'      linear phase shift in one rfft/irfft for all delays, exact for band-limited signals
+
+'auto' uses 'integer' when every delay is whole, otherwise the cheaper of
+'fft' (short signals) and 'sinc' (long signals). stream() applies one delay
+block by block, for files that are not loaded into memory.
+"""
+
+import itertools
+import numpy as np
+
+from sample_format import gain, to_float32
+from stream_filter import BlockFilter
+from wav_io import iter_blocks, BLOCK_SIZE
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+scipy_fft = lazy.module('scipy.fft')
+
+# === Constants ===
+SINC_TAPS = 64               # windowed-sinc kernel length
+FFT_MAX_SAMPLES = 1 << 14    # 'auto' uses the FFT up to this length, sinc above (measured crossover)
+_INTEGER_TOL = 1e-9          # delays this close to a whole sample are integer
+
+
+def delay_samples(shift_ms, rate):
+
+    """
+    Convert a delay in milliseconds to (fractional) samples.
+    """
+
+    return np.asarray(shift_ms, dtype=np.float64) * rate / 1000
+
+
+def select_method(length, delays):
+
+    """
+    Pick the cheapest correct method for a request, see the module docstring.
+    """
+
+    delays = np.asarray(delays, dtype=np.float64)
+    if np.all(np.abs(delays - np.round(delays)) < _INTEGER_TOL):
+        return 'integer'
+    return 'fft' if length <= FFT_MAX_SAMPLES else 'sinc'
+
+
+def delay(data, delays, method='auto'):
+
+    """
+    Delay a signal by one or more (fractional) sample counts.
+    input:
+        data: signal, shape (N,) or (N, C)
+        delays: delay in samples, a scalar or one per output column
+        method: 'auto', 'integer', 'sinc', 'farrow' or 'fft'
+    output:
+        delayed signal (float32), shape as listed in the module docstring
+    """
+
+    x, d, squeeze = _prepare(data, delays)
+    if method == 'auto':
+        method = select_method(len(x), d)
+    if method == 'integer':
+        y = _integer(x, np.round(d).astype(np.int64))
+    elif method == 'sinc':
+        y = _sinc(x, d)
+    elif method == 'farrow':
+        y = _farrow(x, d)
+    elif method == 'fft':
+        y = _fft(x, d)
+    else:
+        raise ValueError(f"Unknown delay method '{method}'")
+    return y[:, 0] if squeeze else y
+
+
+def fractional_kernel(frac):
+
+    """
+    Blackman-windowed sinc kernels for fractional delays in [0, 1).
+    input:
+        frac: fractional delay(s), shape (K,)
+    output:
+        (kernel of shape (SINC_TAPS, K), centre): convolving with the kernel
+        delays by centre + frac samples
+    """
+
+    frac = np.asarray(frac, dtype=np.float32)
+    centre = SINC_TAPS // 2 - 1
+    m = np.arange(SINC_TAPS, dtype=np.float32)[:, None]
+    kernel = np.sinc(m - centre - frac[None, :]) * np.blackman(SINC_TAPS).astype(np.float32)[:, None]
+    kernel /= kernel.sum(axis=0, keepdims=True)  # unit gain at DC
+    return kernel.astype(np.float32), centre
+
+
+def segments(length, samples):
+
+    """
+    Describe an integer delay as pieces of the original signal, so writers can
+    stream views instead of building the shifted array.
+    input:
+        length: number of samples
+        samples: integer delay (negative for an advance)
+    output:
+        (leading zeros, start, stop, trailing zeros): the output is
+        zeros, then data[start:stop], then zeros
+    """
+
+    samples = int(np.clip(samples, -length, length))
+    if samples >= 0:
+        return samples, 0, length - samples, 0
+    return 0, -samples, length, -samples
+
+
+def stream(data, samples, block_size=BLOCK_SIZE):
+
+    """
+    Delay a signal block by block, with the same result as delay(data, samples)
+    using 'integer' or 'sinc'. Memory stays bounded by the block size.
+    input:
+        data: array or memory-mapped view, shape (N,) or (N, C)
+        samples: one delay in samples, may be fractional or negative
+        block_size: samples per block
+    output:
+        yields blocks in order; whole-sample delays yield views of data and
+        zeros of its type, fractional ones yield float32 in [-1, 1]
+    """
+
+    n = len(data)
+    k, frac = _split(np.atleast_1d(np.asarray(samples, dtype=np.float64)))
+    k, frac = int(k[0]), float(frac[0])
+    if frac > 1 - _INTEGER_TOL:
+        k, frac = k + 1, 0.0
+    lead, start, stop, trail = segments(n, k)
+
+    if frac < _INTEGER_TOL:
+        dtype, body = data.dtype, iter_blocks(data, block_size, start, stop)
+    else:
+        # Causal sinc filter; its output y[i] is the delayed signal at i - centre
+        kernel, centre = fractional_kernel([frac])
+        dtype = np.float32
+        body = _filtered_range(data, kernel[:, 0], centre + start, centre + stop, block_size)
+
+    yield from iter_blocks(np.zeros((lead,) + data.shape[1:], dtype=dtype), block_size)
+    yield from body
+    yield from iter_blocks(np.zeros((trail,) + data.shape[1:], dtype=dtype), block_size)
+
+
+def _filtered_range(data, taps, lo, hi, block_size):
+
+    """
+    Yield samples lo..hi of the FIR-filtered signal (the input followed by
+    len(taps) zeros), filtering block by block.
+    """
+
+    fir = BlockFilter(taps=taps)
+    scale = gain(data.dtype)
+    tail = np.zeros((len(taps),) + data.shape[1:], dtype=np.float32)
+    pos = 0
+    for block in itertools.chain(iter_blocks(data, block_size), [tail]):
+        if pos >= hi:
+            break
+        y = fir.process(block * scale if scale != 1.0 else block)
+        a, b = max(lo - pos, 0), min(hi - pos, len(y))
+        if a < b:
+            yield y[a:b].astype(np.float32)
+        pos += len(y)
+
+
+# === Helpers ===
+def _prepare(data, delays):
+    # Returns float32 (N, K), delays (K,) and whether to drop the column axis
+    x = to_float32(data)
+    d = np.atleast_1d(np.asarray(delays, dtype=np.float64))
+    if x.ndim == 1:
+        return x[:, None], d, np.ndim(delays) == 0
+    if d.size not in (1, x.shape[1]):
+        raise ValueError(f"Expected 1 or {x.shape[1]} delays, got {d.size}")
+    return x, np.broadcast_to(d, (x.shape[1],)), False
+
+
+def _integer(x, k):
+
+    """
+    Whole-sample shift with zero fill; x (N, 1 or K), k (K,) integers.
+    """
+
+    n = len(x)
+    if k.size == 1 or np.all(k == k[0]):
+        lead, start, stop, _ = segments(n, k[0])
+        out = np.zeros((n, max(x.shape[1], k.size)), dtype=np.float32)
+        out[lead:lead + stop - start] = x[start:stop]
+        return out
+    # Different shift per column: one vectorized gather
+    idx = np.arange(n)[:, None] - k[None, :]
+    valid = (idx >= 0) & (idx < n)
+    cols = np.arange(x.shape[1]) if x.shape[1] == k.size else np.zeros(k.size, dtype=np.int64)
+    out = x[np.clip(idx, 0, n - 1), cols[None, :]]
+    out[~valid] = 0
+    return out
+
+
+def _split(d):
+    # Integer part and fractional part in [0, 1)
+    k = np.floor(d).astype(np.int64)
+    return k, (d - k).astype(np.float32)
+
+
+def _sinc(x, d):
+
+    """
+    Windowed-sinc fractional delay: a Blackman-windowed kernel per column for
+    the fractional part, then a whole-sample shift.
+    """
+
+    k, frac = _split(d)
+    kernel, centre = fractional_kernel(frac)
+    if x.shape[1] != kernel.shape[1]:
+        x = np.broadcast_to(x, (len(x), kernel.shape[1]))
+    y = signal.oaconvolve(x, kernel, mode='full', axes=0)
+    return _integer(y[centre:centre + len(x)].astype(np.float32, copy=False), k)
+
+
+def _farrow(x, d):
+
+    """
+    Cubic Lagrange fractional delay in Farrow form: the four taps are
+    polynomials in the fractional delay, evaluated once per column.
+    """
+
+    k, mu = _split(d)
+    # Lagrange weights for taps x[n+1], x[n], x[n-1], x[n-2] at delay mu
+    w = np.stack([
+        -mu * (mu - 1) * (mu - 2) / 6,
+        (mu + 1) * (mu - 1) * (mu - 2) / 2,
+        -(mu + 1) * mu * (mu - 2) / 2,
+        (mu + 1) * mu * (mu - 1) / 6,
+    ])
+    n = len(x)
+    padded = np.zeros((n + 3, x.shape[1]), dtype=np.float32)
+    padded[2:n + 2] = x
+    y = np.zeros((n, mu.size), dtype=np.float32)
+    for tap in range(4):
+        # tap 0 reads x[n+1], tap 3 reads x[n-2]
+        y += w[tap] * padded[3 - tap:3 - tap + n]
+    return _integer(y, k)
+
+
+def _fft(x, d):
+
+    """
+    Linear phase shift: one rfft of the zero-padded signal, one phase ramp per
+    delay, one irfft for all of them.
+    """
+
+    n = len(x)
+    pad = int(np.ceil(np.max(np.abs(d)))) + SINC_TAPS  # room so nothing wraps into the window
+    nfft = scipy_fft.next_fast_len(n + pad, real=True)
+    spec = scipy_fft.rfft(x, nfft, axis=0, workers=-1)
+    freq = scipy_fft.rfftfreq(nfft)
+    spec = spec * np.exp(-2j * np.pi * freq[:, None] * d[None, :]).astype(np.complex64)
+    y = scipy_fft.irfft(spec, nfft, axis=0, workers=-1)
+    # Advanced samples wrap to the end of the padded frame, outside the first n
+    return y[:n].astype(np.float32, copy=False)
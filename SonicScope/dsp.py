@@ -0,0 +1,141 @@
+"""
+dsp.py
+Pure array-in/array-out signal operations.
+
+Nothing here reads or writes files or touches the GUI; the file-based
+functions in signal_processing.py and the Pipeline in pipeline.py are
+built on top of these. Signals are (N,) mono or (N, C) multi-channel arrays
+and every operation works along axis 0. Samples are float32 in [-1, 1];
+integer PCM input is converted first (see sample_format.py).
+"""
+
+import numpy as np
+
+import delay
+import filter_design as design
+from sample_format import to_float32
+from stream_filter import fft_filtfilt
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+
+# === Constants ===
+FIR_FFT_MIN_TAPS = 192  # below this the direct form is faster
+FIR_FFT_MIN_WORK = 10_000_000  # taps x samples
+
+
+def scale_signal(data, scale, inplace=False):
+
+    """
+    Multiply a signal by a constant factor.
+    input:
+        data: signal array
+        scale: factor
+        inplace: overwrite data when it is already a writable float32 array
+    output:
+        scaled signal (float32)
+    """
+
+    x = to_float32(data)
+    if x is data and not (inplace and x.flags.writeable):
+        return np.multiply(x, np.float32(scale))
+    return np.multiply(x, np.float32(scale), out=x)  # x is a fresh copy or may be overwritten
+
+
+def shift_signal(data, rate, shift_ms=None, samples=None, method='auto'):
+
+    """
+    Delay a signal in time, zero-filling instead of wrapping around.
+    Fractional and per-channel delays are supported, see delay.py.
+    input:
+        data: signal array
+        rate: sample rate in Hz
+        shift_ms: shift in milliseconds, a scalar or one per channel
+        samples: shift in (fractional) samples (overrides shift_ms)
+        method: delay method, see delay.delay
+    output:
+        shifted signal (float32)
+    """
+
+    if samples is None:
+        samples = delay.delay_samples(shift_ms, rate)
+    return delay.delay(data, samples, method)
+
+
+def fir_numtaps(numtaps, btype):
+
+    """
+    Return a valid tap count for a firwin design.
+    Highpass and bandstop filters need an odd count to pass Nyquist.
+    """
+
+    numtaps = int(numtaps)
+    if btype in ('highpass', 'bandstop') and numtaps % 2 == 0:
+        numtaps += 1
+    return numtaps
+
+
+def select_fir_engine(numtaps, length):
+
+    """
+    Pick the cheaper way to apply an FIR filter.
+    input:
+        numtaps: number of filter taps
+        length: number of samples to filter
+    output:
+        'direct' for direct-form lfilter/filtfilt, 'fft' for overlap-add convolution
+    """
+
+    if numtaps >= FIR_FFT_MIN_TAPS and numtaps * length >= FIR_FFT_MIN_WORK:
+        return 'fft'
+    return 'direct'
+
+
+def butter_filter(data, rate, cutoff, btype, order=2, sos=None):
+
+    """
+    Zero-phase Butterworth filtering (sosfiltfilt).
+    input:
+        data: signal array
+        rate: sample rate in Hz
+        cutoff: cutoff frequency or frequencies
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        order: order of the filter
+        sos: precomputed second-order sections (skips the design)
+    output:
+        filtered signal (float32)
+    """
+
+    if sos is None:
+        sos = design.butter_sos(order, cutoff, btype, rate)
+    # The sections run in float64 for stability; only the result is stored as float32
+    filtered = signal.sosfiltfilt(sos, to_float32(data), axis=0).astype(np.float32)
+    if np.isnan(filtered).any():
+        raise ValueError("Filtered data contains NaNs")
+    return filtered
+
+
+def fir_filter(data, rate, cutoff, btype, numtaps=101, engine='auto', taps=None):
+
+    """
+    Zero-phase FIR filtering with a Hamming-window firwin design.
+    input:
+        data: signal array
+        rate: sample rate in Hz
+        cutoff: cutoff frequency or frequencies
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        numtaps: number of taps (see fir_numtaps)
+        engine: 'direct', 'fft' or 'auto' (see select_fir_engine)
+        taps: precomputed taps (skips the design)
+    output:
+        filtered signal (float32)
+    """
+
+    if taps is None:
+        taps = design.fir_taps(fir_numtaps(numtaps, btype), cutoff, btype, rate, window='hamming')
+    if engine == 'auto':
+        engine = select_fir_engine(len(taps), len(data))
+    x = to_float32(data)
+    if engine == 'fft':
+        return fft_filtfilt(taps, x).astype(np.float32)
+    return signal.filtfilt(taps, 1.0, x, axis=0).astype(np.float32)
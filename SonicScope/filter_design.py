@@ -0,0 +1,107 @@
+"""
+filter_design.py
+Memoized filter design shared by the IIR and FIR filtering paths.
+
+Designs are cached by (family, order, normalized cutoff, btype, rate, window)
+so sweeping a cutoff slider back to a value already used skips the design.
+Cached coefficients are stored read-only and callers get a copy, since
+scipy's sosfilt rejects read-only coefficient buffers.
+"""
+
+from functools import lru_cache
+import numpy as np
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+
+# === Constants ===
+CACHE_SIZE = 128  # designs kept before least-recently-used eviction
+
+
+def normalize_cutoff(cutoff, rate):
+
+    """
+    Normalize cutoff frequencies by the Nyquist frequency.
+    input:
+        cutoff: cutoff frequency or (low, high) frequencies in Hz
+        rate: sample rate in Hz
+    output:
+        tuple of normalized cutoffs in (0, 1)
+    """
+
+    normal_cutoff = tuple(float(c) / (0.5 * rate) for c in np.atleast_1d(cutoff))
+    if any(c <= 0 or c >= 1 for c in normal_cutoff):
+        raise ValueError(f"Invalid normalized cutoff: {normal_cutoff}")
+    return normal_cutoff
+
+
+def iir_sos(order, cutoff, btype, rate, family='butter'):
+
+    """
+    Design an IIR filter as second-order sections.
+    input:
+        order: order of the filter
+        cutoff: cutoff frequency or frequencies in Hz
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        rate: sample rate in Hz
+        family: IIR family passed to scipy.signal.iirfilter ('butter', 'bessel')
+    output:
+        sos: array of second-order sections
+    """
+
+    return _design(family, int(order), normalize_cutoff(cutoff, rate), btype, float(rate), None).copy()
+
+
+def butter_sos(order, cutoff, btype, rate):
+
+    """
+    Design a Butterworth filter as second-order sections (see iir_sos).
+    """
+
+    return iir_sos(order, cutoff, btype, rate, family='butter')
+
+
+def fir_taps(numtaps, cutoff, btype, rate, window='hamming'):
+
+    """
+    Design a windowed-sinc FIR filter with scipy.signal.firwin.
+    input:
+        numtaps: number of taps
+        cutoff: cutoff frequency or frequencies in Hz
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        rate: sample rate in Hz
+        window: window used by firwin
+    output:
+        taps: array of filter taps
+    """
+
+    return _design('firwin', int(numtaps), normalize_cutoff(cutoff, rate), btype, float(rate), window).copy()
+
+
+def cache_info():
+
+    """
+    Return the hit/miss counters and size of the design cache.
+    """
+
+    return _design.cache_info()
+
+
+def cache_clear():
+
+    """
+    Drop every cached design and reset the counters.
+    """
+
+    _design.cache_clear()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _design(family, order, normal_cutoff, btype, rate, window):
+    wn = normal_cutoff[0] if len(normal_cutoff) == 1 else list(normal_cutoff)
+    if family == 'firwin':
+        coeffs = signal.firwin(numtaps=order, cutoff=wn, window=window, pass_zero=btype)
+    else:
+        coeffs = signal.iirfilter(order, wn, btype=btype, analog=False, ftype=family, output='sos')
+    coeffs.setflags(write=False)
+    return coeffs
@@ -1,259 +1,536 @@
-from nicegui import app, ui, context, run
+import logging
+import os
+from fastapi.responses import PlainTextResponse
+from nicegui import app, ui, run, Client
 import signal_tools as tools 
 import plotly.graph_objects as go
 import signal_processing as sp
 import config
-import asyncio
-
-INPUT_FILENAME, OUTPUT_FILENAME = config.INPUT_FILENAME, config.OUTPUT_FILENAME
-fig_time, fig_freq = config.fig_time, config.fig_freq
-
-# === Functions ===
-def clear_plots():
-    print("Cleaning plots")
-    fig_time.data = []
-    fig_freq.data = []
-    plot_time.update()
-    plot_freq.update()
-    print("Plots cleared")
-
-async def record_audio():
-    await asyncio.to_thread(tools.record_audio)
-
-async def play_input():
-    await asyncio.to_thread(tools.play_signal, INPUT_FILENAME)
-
-async def play_output():
-    await asyncio.to_thread(tools.play_signal, OUTPUT_FILENAME)
-
-async def plot_input():
-    await asyncio.to_thread(tools.plot_Input_signal)
-    plot_time.update()
-
-async def plot_output():
-    await asyncio.to_thread(tools.add_output)
-    plot_time.update()
-
-async def generate_output(scale, shift):
-    await asyncio.to_thread(sp.time_shift, shift)
-    if shift > 0:
-        print(f"TIME SHIFTING {shift}")
-    await asyncio.to_thread(sp.scaling, scale)
-    if scale != 1:
-        print(f"SCALING {scale}")
-    await asyncio.to_thread(tools.add_output)
-    plot_time.update()
-
-async def run_fft():
-    print("Running FFT task...")
-    freq, magnitude = await asyncio.to_thread(sp.fft, INPUT_FILENAME)
-    if freq is None:
-        return
-    tools.add_fft_trace('FFT Input', INPUT_FILENAME)
-    plot_freq.update()
-    print("FFT plotted.")
-
-async def apply_filter_dialog(cutoff, btype, dialog, label_prefix):
-    try:
-        rate, data = tools.open_signal(INPUT_FILENAME)
-        filtered = sp.apply_filter(data, rate, cutoff, btype, 5)
-        filter_dialog.close()
-        tools.save_signal(filtered, rate)
-        tools.add_fft_trace(f'{label_prefix} {cutoff} Hz', OUTPUT_FILENAME)
-        plot_freq.update()
-    except Exception as e:
-        print(f"[ERROR] Failed to apply {btype} filter: {e}")
-        
+import realtime
+import jobs
+import session
+import plot_transport
+import instrumentation
+import signal_store as store
+from pipeline import Pipeline
+
+# === Jobs ===
+job_manager = jobs.JobManager()
+
+def busy(s):
+    # Sessions of connected clients, or with queued or running jobs, are never evicted
+    return s.id in Client.instances or job_manager.pending(s.id) > 0
+
+session.start_reaper(busy)
+
+# === Logging and metrics ===
+logging.basicConfig(level=os.environ.get('SONICSCOPE_LOG', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger('gui')
+
+def gauges():
+    return {'sessions': session.stats()['sessions'], 'jobs_pending': job_manager.pending(),
+            'store_bytes': store.usage()}
+
+@app.get('/metrics')
+def metrics():
+    # Prometheus scrape endpoint: stage timings plus server gauges
+    return PlainTextResponse(instrumentation.prometheus(gauges()))
+
+@app.get('/metrics/profiles')
+def metrics_profiles():
+    return instrumentation.profiles()
+
+# === Page ===
+@ui.page('/')
+def index(client: Client):
+    # Every client gets its own files, figures and job queues
+    sess = session.open_session(client.id, busy=busy)
+    INPUT_FILENAME, OUTPUT_FILENAME = sess.input_filename, sess.output_filename
+    fig_time, fig_freq = sess.fig_time, sess.fig_freq
+
+    def submit(kind, func, *args, **options):
+        # Every operation runs on the job pool, never on the event loop
+        return job_manager.submit(sess.id, kind, session.call, sess, func, *args, **options)
+
+    def refresh_jobs():
+        sess.touch()
+        running = job_manager.progress(sess.id)
+        job_row.visible = bool(running)
+        if running:
+            kind, fraction = running[-1]
+            job_label.text = f'{kind.replace("_", " ").capitalize()}...'
+            job_progress.value = fraction
+
+    def cancel_jobs():
+        if job_manager.cancel(sess.id):
+            ui.notify('Cancelled')
+
+    # === Metrics ===
+    def set_metrics(e):
+        instrumentation.enable(e.value)
+
+    def set_profiler(e):
+        instrumentation.enable_profiling(None if e.value == 'Off' else e.value)
+
+    def refresh_metrics():
+        if not metrics_panel.value:
+            return
+        metrics_table.rows = [
+            {'stage': stage, 'calls': m['calls'], 'total': f"{m['seconds'] * 1000:.1f}",
+             'mean': f"{m['mean'] * 1000:.2f}", 'max': f"{m['max'] * 1000:.2f}",
+             'rate': f"{m['samples_per_second'] / 1e6:.1f}", 'mb': f"{m['bytes'] / 1e6:.1f}"}
+            for stage, m in instrumentation.summary().items()]
+        profiles = instrumentation.profiles()
+        if profiles:
+            latest = profiles[-1]
+            profile_view.text = f"# {latest['name']} ({latest['profiler']})\n{latest['report']}"
+
+    # === Functions ===
+    def clear_plots():
+        log.debug("Cleaning plots")
+        fig_time.data = []
+        fig_freq.data = []
+        session.call(sess, tools.clear_time_traces)
+        time_sync.sync()
+        freq_sync.sync()
+        log.debug("Plots cleared")
+
+    async def on_time_relayout(e):
+        # Re-query the level-of-detail traces for the new visible window
+        args = e.args or {}
+        if 'xaxis.range[0]' in args and 'xaxis.range[1]' in args:
+            window = (float(args['xaxis.range[0]']), float(args['xaxis.range[1]']))
+        elif 'xaxis.range' in args:
+            window = tuple(float(v) for v in args['xaxis.range'])
+        elif args.get('xaxis.autorange'):
+            window = (None, None)
+        else:
+            return
+        # Zooming fires many events; only the newest window is queried
+        job = submit('zoom', tools.update_time_window, *window, lane='view')
+        await job
+        if job.status == 'done':
+            time_sync.sync()
+
+    async def toggle_recording():
+        if sess.active_recorder is None:
+            await submit('record', tools.start_recording, lane='control')
+            if sess.active_recorder is not None:
+                record_button.props('icon=stop color=negative')
+                record_button.text = 'Stop'
+            return
+        frames = await submit('record', tools.stop_recording, lane='control')
+        record_button.props('icon=mic color=primary')
+        record_button.text = 'Record'
+        if frames is not None:
+            ui.notify(f'Recorded {frames / tools.SAMPLE_RATE:.1f} s')
+
+    async def toggle_live():
+        if sess.live_session is not None:
+            live_timer.deactivate()
+            await submit('live', tools.stop_live, lane='control')
+            live_button.props('icon=graphic_eq color=primary')
+            return
+        live_filter = None
+        if live_filter_check.value:
+            cutoff = selected_cutoff()
+            if cutoff is None:
+                return
+            live_filter = realtime.make_filter(realtime.SAMPLE_RATE, cutoff, filter_type,
+                                               filter_design, numtaps=int(fir_numtaps_input.value))
+        await submit('live', tools.start_live, live_filter, lane='control')
+        if sess.live_session is None:
+            ui.notify('Could not start the live stream', type='negative')
+            return
+        ui.notify(f'Live: {sess.live_session.latency * 1000:.1f} ms latency')
+        live_button.props('icon=stop color=negative')
+        live_timer.activate()
+
+    def refresh_live():
+        if not session.call(sess, tools.update_live_plots):
+            live_timer.deactivate()
+        time_sync.sync()
+        freq_sync.sync()
+
+    async def play_file(filename):
+        # Playback streams in the background; the job only opens the file and the device
+        await submit('play', tools.start_playback, filename, loop_check.value, lane='audio')
+        refresh_playback()
+
+    async def play_input():
+        await play_file(INPUT_FILENAME)
+
+    async def play_output():
+        await play_file(OUTPUT_FILENAME)
+
+    async def stop_playback():
+        await submit('play', tools.stop_playback, lane='audio')
+        refresh_playback()
+
+    def set_loop(e):
+        if sess.player is not None:
+            sess.player.loop = e.value
+
+    def seek_playback(e):
+        session.call(sess, tools.seek_playback, float(e.args))
+
+    def refresh_playback():
+        status = session.call(sess, tools.playback_status)
+        playback_row.visible = bool(status and status['active'])
+        if playback_row.visible:
+            playback_slider.props(f'max={max(status["duration"], 0.01):.2f}')
+            playback_slider.value = round(status['position'], 2)
+            text = f'{status["position"]:.1f} / {status["duration"]:.1f} s'
+            if status['underruns']:
+                text += f' ({status["underruns"]} underruns)'
+            playback_label.text = text
+
+    async def plot_input():
+        job = submit('plot_input', tools.plot_Input_signal, files=[INPUT_FILENAME])
+        await job
+        if job.status == 'done':
+            time_sync.sync()
+
+    async def plot_output():
+        job = submit('plot_output', tools.add_output, files=[OUTPUT_FILENAME])
+        await job
+        if job.status == 'done':
+            time_sync.sync()
+
+    def generate(scale, shift):
+        # One in-memory chain, so the scaling applies to the shifted signal
+        chain = Pipeline().source(INPUT_FILENAME).shift(shift).scale(scale).sink(OUTPUT_FILENAME)
+        chain.run()
+        log.info("Generated output: shift %s ms, scale %s", shift, scale)
+        tools.add_output()
+
+    async def generate_output(scale, shift):
+        # A newer Generate replaces the running one: only the latest settings are written
+        job = submit('generate', generate, scale, shift, files=[INPUT_FILENAME, OUTPUT_FILENAME],
+                     supersede=True)
+        await job
+        if job.status == 'done':
+            time_sync.sync()
 
-# === Unified Filter Dialog ===
-filter_dialog = ui.dialog().props('persistent')
-filter_slider_single = None
-filter_slider_range = None
-filter_title_label = None
-filter_type = 'highpass'
-filter_label_prefix = 'High-Pass'
-
-def update_slider_visibility():
-    if filter_type in ['highpass', 'lowpass']:
-        filter_slider_single.visible = True
-        filter_slider_range.visible = False
-        range_min_label.visible = False
-        range_min_input.visible = False
-        range_max_label.visible = False
-        range_max_input.visible = False
-        f.visible = True
-        f_label.visible = True
+    def max_freq():
+        # Analysis band from the Plot Settings tab; None for the whole band
+        return float(max_freq_input.value) if max_freq_input.value else None
+
+    async def run_fft():
+        job = submit('fft', sp.fft, INPUT_FILENAME, 'hamming', max_freq(), files=[INPUT_FILENAME])
+        result = await job
+        if job.status != 'done' or result[0] is None:
+            return
+        await submit('fft', tools.add_fft_trace, 'FFT Input', INPUT_FILENAME, max_freq(), files=[INPUT_FILENAME])
+        freq_sync.sync()
+
+    async def run_welch():
+        job = submit('welch', tools.add_psd_trace, 'Welch PSD Input', INPUT_FILENAME, max_freq(),
+                     files=[INPUT_FILENAME])
+        await job
+        if job.status == 'done':
+            freq_sync.sync()
+
+    async def run_spectrogram():
+        job = submit('spectrogram', tools.add_spectrogram_trace, 'Spectrogram Input', INPUT_FILENAME,
+                     max_freq(), files=[INPUT_FILENAME])
+        await job
+        if job.status == 'done':
+            freq_sync.sync()
+
+    def run_filter(cutoff, btype, label_prefix, design, numtaps):
+        # Runs on the job pool: reading, filtering and the spectrum of the result
+        plan = None
+        if design == 'fir':
+            # The taps, engine and rate FIR picks for this input, for the notification
+            rate, data = tools.open_signal(INPUT_FILENAME, mmap=True)
+            plan = sp.fir_plan(rate, len(data), cutoff, btype, numtaps)
+            written = sp.FIR(INPUT_FILENAME, cutoff, btype, numtaps, stream=True, engine='auto',
+                             output_filename=OUTPUT_FILENAME)
+        else:
+            written = sp.apply_filter_stream(INPUT_FILENAME, cutoff, btype, 5,
+                                             output_filename=OUTPUT_FILENAME)
+        jobs.checkpoint()  # a newer filter replaced this one, skip its trace
+        if written is not None:
+            tools.add_fft_trace(f'{label_prefix} {cutoff} Hz', OUTPUT_FILENAME)
+        return written, plan
+
+    async def apply_filter_dialog(cutoff, btype, dialog, label_prefix, design='butter', numtaps=101):
+        try:
+            # Repeated applies (e.g. while moving the slider) keep only the newest filter
+            job = submit('filter', run_filter, cutoff, btype, label_prefix, design, int(numtaps),
+                         files=[INPUT_FILENAME, OUTPUT_FILENAME], supersede=True)
+            result = await job
+            if job.status != 'done':
+                return
+            written, plan = result
+            if plan is not None:
+                ui.notify(f'FIR: {plan.numtaps} taps, {plan.engine} engine at {plan.rate:g} Hz')
+            dialog.close()
+            if written is None:
+                return
+            freq_sync.sync()
+        except Exception:
+            log.exception("Failed to apply %s filter", btype)
+
+    async def upload_input(e):
+        await submit('upload', tools.upload_signal, e, files=[INPUT_FILENAME])
         
-    else:
-        filter_slider_single.visible = False
-        filter_slider_range.visible = True
-        range_min_label.visible = True
-        range_min_input.visible = True
-        range_max_label.visible = True
-        range_max_input.visible = True
-        f_label.visible = False
-        f.visible = False
+
+    # === Unified Filter Dialog ===
+    filter_dialog = ui.dialog().props('persistent')
+    filter_slider_single = None
+    filter_slider_range = None
+    filter_title_label = None
+    filter_type = 'highpass'
+    filter_label_prefix = 'High-Pass'
+    filter_design = 'butter'
+
+    def update_slider_visibility():
+        if filter_type in ['highpass', 'lowpass']:
+            filter_slider_single.visible = True
+            filter_slider_range.visible = False
+            range_min_label.visible = False
+            range_min_input.visible = False
+            range_max_label.visible = False
+            range_max_input.visible = False
+            f.visible = True
+            f_label.visible = True
         
-    filter_title_label.text = f'{filter_label_prefix} Filter – Cutoff Frequency (Hz)'
-
-def open_filter_dialog(ftype: str, prefix: str):
-    global filter_type, filter_label_prefix
-    filter_type = ftype
-    filter_label_prefix = prefix
-    update_slider_visibility()
-    filter_dialog.open()
-    dropdown_btn.close()
-
-def apply_selected_filter():
-    if filter_type in ['highpass', 'lowpass']:
-        cutoff = filter_slider_single.value
-    else:
+        else:
+            filter_slider_single.visible = False
+            filter_slider_range.visible = True
+            range_min_label.visible = True
+            range_min_input.visible = True
+            range_max_label.visible = True
+            range_max_input.visible = True
+            f_label.visible = False
+            f.visible = False
+
+        fir_btype_select.visible = filter_design == 'fir'
+        fir_numtaps_input.visible = filter_design == 'fir'
+        filter_title_label.text = f'{filter_label_prefix} Filter – Cutoff Frequency (Hz)'
+
+    def open_filter_dialog(ftype: str, prefix: str, design: str = 'butter'):
+        nonlocal filter_type, filter_label_prefix, filter_design
+        filter_type = ftype
+        filter_label_prefix = prefix
+        filter_design = design
+        update_slider_visibility()
+        filter_dialog.open()
+        dropdown_btn.close()
+
+    def selected_cutoff():
+        if filter_type in ['highpass', 'lowpass']:
+            return filter_slider_single.value
         low = model["range"]["min"]
         high = model["range"]["max"]
-        print(f"Selected range: {low} - {high}")
+        log.debug("Selected range: %s - %s", low, high)
         if low >= high:
             ui.notify("[ERROR] Band filter range is invalid. Ensure Min < Max.", type='negative')
+            return None
+        return (low, high)
+
+    def apply_selected_filter():
+        cutoff = selected_cutoff()
+        if cutoff is None:
             return
-        cutoff = (low, high)
-    asyncio.create_task(apply_filter_dialog(cutoff, filter_type, filter_dialog, filter_label_prefix))
+        return apply_filter_dialog(cutoff, filter_type, filter_dialog, filter_label_prefix,
+                                   filter_design, fir_numtaps_input.value)
+
+    def set_fir_btype(e):
+        nonlocal filter_type
+        filter_type = e.value
+        update_slider_visibility()
     
-def update_range_slider(min_val: int, max_val: int):
-    if filter_slider_range.value != [min_val, max_val]:
-        filter_slider_range.set_value([0, 0])  # force redraw
-        filter_slider_range.set_value([min_val, max_val])
-
-with filter_dialog:
-    with ui.card():
-        model = {"range": {"min": 0, "max": 20000}}
+    def update_range_slider(min_val: int, max_val: int):
+        if filter_slider_range.value != [min_val, max_val]:
+            filter_slider_range.set_value([0, 0])  # force redraw
+            filter_slider_range.set_value([min_val, max_val])
+
+    with filter_dialog:
+        with ui.card():
+            model = {"range": {"min": 0, "max": 20000}}
         
-        filter_title_label = ui.label(f'{filter_label_prefix} Filter \u2013 Cutoff Frequency (Hz)').classes('text-subtitle2 q-mb-md')
-        filter_slider_single = ui.slider(min=0, max=20000, value=1000, step=1).props('label-always input')
-        filter_slider_range = ui.range(min=model["range"]["min"], max=model["range"]["max"]).bind_value(model, "range").props('label-always input')
-        #filter_slider_range = ui.range(min=0, max=20000, value=[1000, 5000], step=1).props('label-always input')
-        #filter_slider_range.set_value([1000, 5000])  # explicit init
-
-        with ui.row().classes('items-center justify-between'):
-            f_label = ui.label('Cutoff Frequency').classes('text-caption')
-            f = ui.number(label='Cutoff Frequency', min=0, max=20000, value=1000, step=1)
-        # Two-way binding
-        filter_slider_single.bind_value_to(f, 'value')
-        filter_slider_single.bind_value_from(f, 'value')
+            filter_title_label = ui.label(f'{filter_label_prefix} Filter \u2013 Cutoff Frequency (Hz)').classes('text-subtitle2 q-mb-md')
+            with ui.row().classes('items-center justify-between'):
+                fir_btype_select = ui.select({'lowpass': 'Low-Pass', 'highpass': 'High-Pass',
+                                              'bandpass': 'Band-Pass', 'bandstop': 'Band-Stop'},
+                                             value='lowpass', label='Type', on_change=set_fir_btype)
+                fir_numtaps_input = ui.number(label='Taps', value=101, min=3, max=65535, step=2)
+            filter_slider_single = ui.slider(min=0, max=20000, value=1000, step=1).props('label-always input')
+            filter_slider_range = ui.range(min=model["range"]["min"], max=model["range"]["max"]).bind_value(model, "range").props('label-always input')
+            #filter_slider_range = ui.range(min=0, max=20000, value=[1000, 5000], step=1).props('label-always input')
+            #filter_slider_range.set_value([1000, 5000])  # explicit init
+
+            with ui.row().classes('items-center justify-between'):
+                f_label = ui.label('Cutoff Frequency').classes('text-caption')
+                f = ui.number(label='Cutoff Frequency', min=0, max=20000, value=1000, step=1)
+            # Two-way binding
+            filter_slider_single.bind_value_to(f, 'value')
+            filter_slider_single.bind_value_from(f, 'value')
         
         
-        with ui.row().classes('items-center justify-between'):
-            range_min_label = ui.label('Min Frequency').classes('text-caption')
-            range_min_input = ui.number(label='Min Frequency').bind_value(
-                model,
-                "range",
-                backward=lambda x: x["min"],
-                forward=lambda x: {"min": x, "max": model["range"]["max"]},
-            )
+            with ui.row().classes('items-center justify-between'):
+                range_min_label = ui.label('Min Frequency').classes('text-caption')
+                range_min_input = ui.number(label='Min Frequency').bind_value(
+                    model,
+                    "range",
+                    backward=lambda x: x["min"],
+                    forward=lambda x: {"min": x, "max": model["range"]["max"]},
+                )
             
-        with ui.row().classes('items-center justify-between'):
-            range_max_label = ui.label('Max Frequency').classes('text-caption')
-            range_max_input = ui.number(label='Max Frequency').bind_value(
-                model,
-                "range",
-                backward=lambda x: x["max"],
-                forward=lambda x: {"min": model["range"]["min"], "max": x},
-            )
+            with ui.row().classes('items-center justify-between'):
+                range_max_label = ui.label('Max Frequency').classes('text-caption')
+                range_max_input = ui.number(label='Max Frequency').bind_value(
+                    model,
+                    "range",
+                    backward=lambda x: x["max"],
+                    forward=lambda x: {"min": model["range"]["min"], "max": x},
+                )
 
         
 
-        with ui.row().classes('items-center justify-end q-gutter-sm'):
-            ui.button('Apply', on_click=apply_selected_filter, icon='check').classes('q-mr-sm')
-            ui.button('Close', icon='close', on_click=filter_dialog.close)
+            with ui.row().classes('items-center justify-end q-gutter-sm'):
+                ui.button('Apply', on_click=apply_selected_filter, icon='check').classes('q-mr-sm')
+                ui.button('Close', icon='close', on_click=filter_dialog.close)
             
-# === GUI ===
-with ui.row().classes('items-center justify-center'):
-    ui.image(config.logo).classes('w-20 h-20')
-    ui.label('SonicScope').classes('text-h6')
-
-with ui.row().classes('items-start'):
-    with ui.column().classes('items-left justify-center q-pa-md gap-4'):
-        with ui.tabs() as tabs:
-            ui.tab('Input', icon='input')
-            ui.tab('Output', icon='output')
-            ui.tab('Plot Settings', icon='settings')
-
-        with ui.tab_panels(tabs, value='Input'):
-            with ui.tab_panel('Input'):
-                with ui.row().classes('items-center justify-center'):
-                    ui.label('Input').classes('text-h6')
-                with ui.row().classes('items-center justify-center'):
-                    ui.button('Record', icon='mic', on_click=lambda: asyncio.create_task(record_audio())).classes('gap-0.5 items-center')
-                    ui.button('Play', icon='play_arrow', on_click=lambda: asyncio.create_task(play_input())).classes('gap-0.5 items-center')
-                    ui.button('Plot', icon='timeline', on_click=lambda: asyncio.create_task(plot_input())).classes('gap-0.5 items-center')
-                '''
-                with ui.row().classes('items-center justify-center'):
-                    a = ui.audio(INPUT_FILENAME, autoplay=False, controls=True).classes('w-full')
-                    a.on('play', lambda _: ui.notify('Playing input'))
-                    a.on('ended', lambda _: ui.notify('Completed'))
-                '''
-                with ui.row().classes('items-center justify-center'):
-                    ui.upload(on_upload=tools.upload_signal, label='🎵 Load WAV File')
-
-            with ui.tab_panel('Output'):
-                with ui.row().classes('items-left justify-center'):
-                    ui.label('Output').classes('text-h6')
-                with ui.row().classes('items-center justify-center'):
-                    ui.button('Play', icon='play_arrow', on_click=lambda: asyncio.create_task(play_output()))
-                    ui.button('Plot', icon='timeline', on_click=lambda: asyncio.create_task(plot_output()))
-                    ui.button('Generate', icon='add', on_click=lambda: asyncio.create_task(generate_output(scale_in.value, t_shift_in.value)))
-                with ui.row().classes('items-center justify-center'):
-                    dropdown_btn = ui.dropdown_button(text='Filters', split=True)
+    # === GUI ===
+    with ui.row().classes('items-center justify-center'):
+        ui.image(config.logo).classes('w-20 h-20')
+        ui.label('SonicScope').classes('text-h6')
+
+    with ui.row().classes('items-start'):
+        with ui.column().classes('items-left justify-center q-pa-md gap-4'):
+            with ui.tabs() as tabs:
+                ui.tab('Input', icon='input')
+                ui.tab('Output', icon='output')
+                ui.tab('Plot Settings', icon='settings')
+
+            with ui.tab_panels(tabs, value='Input'):
+                with ui.tab_panel('Input'):
                     with ui.row().classes('items-center justify-center'):
-                        with dropdown_btn:
-                            ui.item('High-Pass', on_click=lambda: open_filter_dialog('highpass', 'High-Pass'))
-                            ui.item('Low-Pass', on_click=lambda: open_filter_dialog('lowpass', 'Low-Pass'))
-                            ui.item('Band-Pass', on_click=lambda: open_filter_dialog('bandpass', 'Band-Pass'))
-                            ui.item('Band-Stop', on_click=lambda: open_filter_dialog('bandstop', 'Band-Stop'))
-                            ui.item('FIR', on_click=lambda: ui.notify('FIR not implemented yet'))
-                            ui.item('IIR', on_click=lambda: ui.notify('IIR not implemented yet'))
-
-                        ui.button('FFT', icon='timeline', on_click=lambda: asyncio.create_task(run_fft()))
-                with ui.row().classes('items-center justify-center'):
-                    scale_in = ui.number(label='Scale', value=1, min=0, max=2, step=0.1)
-                    t_shift_in = ui.number(label='Time shifting [ms]', value=0, min=0, step=1)
+                        ui.label('Input').classes('text-h6')
+                    with ui.row().classes('items-center justify-center'):
+                        record_button = ui.button('Record', icon='mic', on_click=toggle_recording).classes('gap-0.5 items-center')
+                        ui.button('Play', icon='play_arrow', on_click=play_input).classes('gap-0.5 items-center')
+                        ui.button('Plot', icon='timeline', on_click=plot_input).classes('gap-0.5 items-center')
+                    with ui.row().classes('items-center justify-center'):
+                        live_button = ui.button('Live', icon='graphic_eq', on_click=toggle_live).classes('gap-0.5 items-center')
+                        live_filter_check = ui.checkbox('Filter live audio').tooltip('Uses the settings of the last filter dialog')
+                        live_timer = ui.timer(0.1, refresh_live, active=False)
+                    '''
+                    with ui.row().classes('items-center justify-center'):
+                        a = ui.audio(INPUT_FILENAME, autoplay=False, controls=True).classes('w-full')
+                        a.on('play', lambda _: ui.notify('Playing input'))
+                        a.on('ended', lambda _: ui.notify('Completed'))
+                    '''
+                    with ui.row().classes('items-center justify-center'):
+                        ui.upload(on_upload=upload_input, label='🎵 Load WAV File')
+
+                with ui.tab_panel('Output'):
+                    with ui.row().classes('items-left justify-center'):
+                        ui.label('Output').classes('text-h6')
+                    with ui.row().classes('items-center justify-center'):
+                        ui.button('Play', icon='play_arrow', on_click=play_output)
+                        ui.button('Plot', icon='timeline', on_click=plot_output)
+                        ui.button('Generate', icon='add', on_click=lambda: generate_output(scale_in.value, t_shift_in.value))
+                    with ui.row().classes('items-center justify-center'):
+                        dropdown_btn = ui.dropdown_button(text='Filters', split=True)
+                        with ui.row().classes('items-center justify-center'):
+                            with dropdown_btn:
+                                ui.item('High-Pass', on_click=lambda: open_filter_dialog('highpass', 'High-Pass'))
+                                ui.item('Low-Pass', on_click=lambda: open_filter_dialog('lowpass', 'Low-Pass'))
+                                ui.item('Band-Pass', on_click=lambda: open_filter_dialog('bandpass', 'Band-Pass'))
+                                ui.item('Band-Stop', on_click=lambda: open_filter_dialog('bandstop', 'Band-Stop'))
+                                ui.item('FIR', on_click=lambda: open_filter_dialog(fir_btype_select.value, 'FIR', 'fir'))
+                                ui.item('IIR', on_click=lambda: ui.notify('IIR not implemented yet'))
+
+                            ui.button('FFT', icon='timeline', on_click=run_fft)
+                            ui.button('Welch', icon='show_chart', on_click=run_welch)
+                            ui.button('Spectrogram', icon='grid_on', on_click=run_spectrogram)
+                    with ui.row().classes('items-center justify-center'):
+                        scale_in = ui.number(label='Scale', value=1, min=0, max=2, step=0.1)
+                        t_shift_in = ui.number(label='Time shifting [ms]', value=0, min=0, step=0.01)
                 
-                '''
-                with ui.row().classes('items-center justify-center'):
-                    a = ui.audio(OUTPUT_FILENAME, autoplay=False, controls=True).classes('w-full')
-                    a.on('play', lambda _: ui.notify('Playing output'))
-                    a.on('ended', lambda _: ui.notify('Completed'))
-                '''
+                    '''
+                    with ui.row().classes('items-center justify-center'):
+                        a = ui.audio(OUTPUT_FILENAME, autoplay=False, controls=True).classes('w-full')
+                        a.on('play', lambda _: ui.notify('Playing output'))
+                        a.on('ended', lambda _: ui.notify('Completed'))
+                    '''
             
-            with ui.tab_panel('Plot Settings'):
-                with ui.row().classes('items-left justify-center'):
-                    ui.label('Plot Settings').classes('text-h6')
-                with ui.row().classes('items-center justify-center'):
-                    ui.button('Clear Plots', icon='cleaning_services', on_click=clear_plots).classes('gap-0.5 items-center')
-                    ui.button('Refresh Plots', icon='refresh', on_click=lambda: (plot_time.update(), plot_freq.update())).classes('gap-0.5 items-center')
+                with ui.tab_panel('Plot Settings'):
+                    with ui.row().classes('items-left justify-center'):
+                        ui.label('Plot Settings').classes('text-h6')
+                    with ui.row().classes('items-center justify-center'):
+                        ui.button('Clear Plots', icon='cleaning_services', on_click=clear_plots).classes('gap-0.5 items-center')
+                        ui.button('Refresh Plots', icon='refresh', on_click=lambda: (time_sync.refresh(), freq_sync.refresh())).classes('gap-0.5 items-center')
+                    with ui.row().classes('items-center justify-center'):
+                        max_freq_input = ui.number(label='Analysis band (Hz)', value=None, min=0, step=100).tooltip(
+                            'FFT, Welch and spectrogram up to this frequency, at a reduced sample rate; empty for the full band')
+
+            # === Job progress ===
+            with ui.row().classes('items-center justify-center w-full') as job_row:
+                job_label = ui.label().classes('text-caption')
+                job_progress = ui.linear_progress(value=0, show_value=False).classes('w-40')
+                ui.button(icon='close', on_click=cancel_jobs).props('flat round dense').tooltip('Cancel')
+            job_row.visible = False
+            ui.timer(0.25, refresh_jobs)
+
+            # === Metrics panel (settings are server-wide) ===
+            with ui.expansion('Metrics', icon='speed').classes('w-full') as metrics_panel:
+                with ui.row().classes('items-center'):
+                    ui.switch('Record timings', value=instrumentation.enabled, on_change=set_metrics)
+                    ui.select(['Off', *instrumentation.PROFILERS], value=instrumentation.profiler or 'Off',
+                              label='Profile jobs', on_change=set_profiler).classes('w-32')
+                columns = [{'name': key, 'label': label, 'field': key} for key, label in (
+                    ('stage', 'Stage'), ('calls', 'Calls'), ('total', 'Total ms'), ('mean', 'Mean ms'),
+                    ('max', 'Max ms'), ('rate', 'Msamples/s'), ('mb', 'MB'))]
+                metrics_table = ui.table(columns=columns, rows=[], row_key='stage').props('dense flat')
+                profile_view = ui.label().classes('w-full whitespace-pre font-mono text-xs')
+                ui.label('Scrape /metrics for Prometheus').classes('text-caption')
+            ui.timer(1.0, refresh_metrics)
+
+            # === Playback ===
+            with ui.row().classes('items-center justify-center w-full') as playback_row:
+                playback_label = ui.label().classes('text-caption')
+                playback_slider = ui.slider(min=0, max=1, step=0.01, value=0).classes('w-40')
+                playback_slider.on('change', seek_playback)
+                ui.button(icon='stop', on_click=stop_playback).props('flat round dense').tooltip('Stop')
+            playback_row.visible = False
+            with ui.row().classes('items-center justify-center w-full'):
+                loop_check = ui.checkbox('Loop playback', on_change=set_loop)
+            ui.timer(0.2, refresh_playback)
                     
-    # === Plots ===
-    with ui.column().classes('q-pa-md'):
-        with ui.tabs() as tabs:
-            ui.tab('Time Domain', icon='timeline')
-            ui.tab('Frequency Domain', icon='timeline')
-
-        with ui.tab_panels(tabs, value='Time Domain'):
-            with ui.tab_panel('Time Domain'):
-                fig_time.update_layout(
-                    legend=dict(orientation='h', yanchor='bottom', y=-0.3, xanchor='right', x=1),
-                    margin=dict(l=0, r=0, t=0, b=0),
-                    xaxis_title='Time (s)',
-                    yaxis_title='Amplitude')
-                plot_time = ui.plotly(fig_time).classes('w-full h-80')
-
-            with ui.tab_panel('Frequency Domain'):
-                fig_freq.update_layout(
-                    legend=dict(orientation='h', yanchor='bottom', y=-0.3, xanchor='right', x=1),
-                    margin=dict(l=0, r=0, t=0, b=0),
-                    xaxis_title='Frequency (Hz)',
-                    yaxis_title='Magnitude')
-                plot_freq = ui.plotly(fig_freq).classes('w-full h-80')
-
-with ui.footer().classes('items-center justify-center q-pa-none q-mt-none').style('height: 30px;'):
-    ui.label('SonicScope – Developed by Ronel Herzass').classes('text-caption q-mb-none').style('line-height: 1; margin: 0; padding: 0')
+        # === Plots ===
+        with ui.column().classes('q-pa-md'):
+            with ui.tabs() as tabs:
+                ui.tab('Time Domain', icon='timeline')
+                ui.tab('Frequency Domain', icon='timeline')
+
+            with ui.tab_panels(tabs, value='Time Domain'):
+                with ui.tab_panel('Time Domain'):
+                    fig_time.update_layout(
+                        legend=dict(orientation='h', yanchor='bottom', y=-0.3, xanchor='right', x=1),
+                        margin=dict(l=0, r=0, t=0, b=0),
+                        xaxis_title='Time (s)',
+                        yaxis_title='Amplitude')
+                    plot_time = ui.plotly(fig_time).classes('w-full h-80')
+                    time_sync = plot_transport.FigureSync(plot_time)  # only changed traces are sent
+                    plot_time.on('plotly_relayout', on_time_relayout)
+
+                with ui.tab_panel('Frequency Domain'):
+                    fig_freq.update_layout(
+                        legend=dict(orientation='h', yanchor='bottom', y=-0.3, xanchor='right', x=1),
+                        margin=dict(l=0, r=0, t=0, b=0),
+                        xaxis_title='Frequency (Hz)',
+                        yaxis_title='Magnitude')
+                    plot_freq = ui.plotly(fig_freq).classes('w-full h-80')
+                    freq_sync = plot_transport.FigureSync(plot_freq)
+
+    with ui.footer().classes('items-center justify-center q-pa-none q-mt-none').style('height: 30px;'):
+        ui.label('SonicScope – Developed by Ronel Herzass').classes('text-caption q-mb-none').style('line-height: 1; margin: 0; padding: 0')
 
 ui.run()
@@ -0,0 +1,10 @@
+"""
+import_budget.py
+Import-time budget of the core modules, shared by benchmarks.py --imports-only
+and tests/test_import_time.py. Imports nothing, so both can read it cheaply.
+"""
+
+# === Constants ===
+IMPORT_MODULES = ('dsp', 'signal_io', 'signal_processing', 'signal_tools', 'pipeline', 'batch')
+IMPORT_BUDGET = 0.5  # in seconds, per module imported alone in a fresh interpreter (NumPy included)
+HEAVY_MODULES = ('scipy.signal', 'plotly', 'sounddevice', 'nicegui', 'pydub', 'matplotlib')  # loaded on first use only
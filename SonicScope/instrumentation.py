@@ -0,0 +1,281 @@
+"""
+instrumentation.py
+Timing spans, metrics and per-job profiling.
+
+Hot paths wrap their stages in spans:
+
+    with instrumentation.span('filter', samples=len(data)) as sp:
+        ...
+        sp.add(nbytes=out.nbytes)
+
+Each span adds its wall time, sample count and bytes to the running totals
+of its stage (decode, design, filter, fft, encode, plot_serialize, ...);
+summary() returns them and prometheus() renders them in the Prometheus text
+format for the GUI's /metrics endpoint. The RECENT latest spans are kept as
+well, for the metrics panel.
+
+Instrumentation is off unless enable() is called or SONICSCOPE_METRICS=1 is
+set: span() then returns one shared no-op object, so a disabled span costs a
+function call and an attribute check.
+
+profile(name, func, ...) runs one call under cProfile or pyinstrument (set
+with enable_profiling or SONICSCOPE_PROFILE=cprofile|pyinstrument) and keeps
+the report; the job manager profiles every job this way while profiling is on.
+Python has one profiler per process on recent versions, so concurrent calls
+run unprofiled while another is being profiled.
+"""
+
+import io
+import os
+import threading
+import time
+from collections import deque
+
+# === Constants ===
+RECENT = 256        # spans kept for the metrics panel
+PROFILES = 16       # profile reports kept
+PROFILE_LINES = 40  # lines of a cProfile report (sorted by cumulative time)
+PROFILERS = ('cprofile', 'pyinstrument')
+
+enabled = os.environ.get('SONICSCOPE_METRICS', '') not in ('', '0')
+profiler = os.environ.get('SONICSCOPE_PROFILE') or None
+
+_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_stats = {}  # stage -> [calls, seconds, max seconds, samples, bytes]
+_recent = deque(maxlen=RECENT)
+_profiles = deque(maxlen=PROFILES)
+
+
+class Span:
+
+    """
+    One timed stage; use through span().
+    """
+
+    __slots__ = ('stage', 'samples', 'nbytes', 'start', 'duration')
+
+    def __init__(self, stage, samples=0, nbytes=0):
+        self.stage = stage
+        self.samples = samples
+        self.nbytes = nbytes
+        self.start = 0.0
+        self.duration = 0.0
+
+    def add(self, samples=0, nbytes=0):
+
+        """
+        Count samples and bytes processed by the stage, e.g. once they are known.
+        """
+
+        self.samples += int(samples)
+        self.nbytes += int(nbytes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        with _lock:
+            entry = _stats.get(self.stage)
+            if entry is None:
+                entry = _stats[self.stage] = [0, 0.0, 0.0, 0, 0]
+            entry[0] += 1
+            entry[1] += self.duration
+            entry[2] = max(entry[2], self.duration)
+            entry[3] += self.samples
+            entry[4] += self.nbytes
+            _recent.append((time.time(), self.stage, self.duration, self.samples, self.nbytes))
+
+
+class _NullSpan:
+
+    """
+    The span returned while instrumentation is disabled.
+    """
+
+    __slots__ = ()
+
+    def add(self, samples=0, nbytes=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+def span(stage, samples=0, nbytes=0):
+
+    """
+    Time a stage (use as a context manager).
+    input:
+        stage: stage name, e.g. 'decode' or 'filter'
+        samples: samples processed (frames * channels)
+        nbytes: bytes processed
+    output:
+        Span, or a no-op span while disabled
+    """
+
+    if not enabled:
+        return _NULL
+    return Span(stage, samples, nbytes)
+
+
+def enable(on=True):
+
+    """
+    Switch span recording on or off.
+    """
+
+    global enabled
+    enabled = bool(on)
+
+
+def reset():
+
+    """
+    Forget the recorded spans and profiles.
+    """
+
+    with _lock:
+        _stats.clear()
+        _recent.clear()
+        _profiles.clear()
+
+
+def summary():
+
+    """
+    Totals per stage.
+    output:
+        dict stage -> {calls, seconds, mean, max, samples, bytes, samples_per_second}
+    """
+
+    with _lock:
+        stats = {stage: list(entry) for stage, entry in _stats.items()}
+    return {
+        stage: {
+            'calls': calls,
+            'seconds': seconds,
+            'mean': seconds / calls if calls else 0.0,
+            'max': longest,
+            'samples': samples,
+            'bytes': nbytes,
+            'samples_per_second': samples / seconds if seconds > 0 else 0.0,
+        }
+        for stage, (calls, seconds, longest, samples, nbytes) in sorted(stats.items())
+    }
+
+
+def recent(count=RECENT):
+
+    """
+    The latest spans, newest last, as (time, stage, seconds, samples, bytes).
+    """
+
+    with _lock:
+        return list(_recent)[-count:]
+
+
+def prometheus(gauges=None):
+
+    """
+    Render the stage totals in the Prometheus text exposition format.
+    input:
+        gauges: optional dict name -> value of extra gauges (e.g. open sessions)
+    output:
+        str
+    """
+
+    lines = []
+    metrics = (
+        ('stage_calls_total', 'counter', 'calls', "Completed spans per stage"),
+        ('stage_seconds_total', 'counter', 'seconds', "Wall time spent per stage"),
+        ('stage_seconds_max', 'gauge', 'max', "Longest span per stage"),
+        ('stage_samples_total', 'counter', 'samples', "Samples processed per stage"),
+        ('stage_bytes_total', 'counter', 'bytes', "Bytes processed per stage"),
+    )
+    stats = summary()
+    for name, kind, field, text in metrics:
+        lines.append(f"# HELP sonicscope_{name} {text}")
+        lines.append(f"# TYPE sonicscope_{name} {kind}")
+        for stage, values in stats.items():
+            lines.append(f'sonicscope_{name}{{stage="{stage}"}} {values[field]}')
+    lines.append("# HELP sonicscope_metrics_enabled 1 while spans are recorded")
+    lines.append("# TYPE sonicscope_metrics_enabled gauge")
+    lines.append(f"sonicscope_metrics_enabled {int(enabled)}")
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE sonicscope_{name} gauge")
+        lines.append(f"sonicscope_{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# === Profiling ===
+def enable_profiling(engine='cprofile'):
+
+    """
+    Profile the calls made through profile() with an engine from PROFILERS, or None to stop.
+    """
+
+    global profiler
+    if engine is not None and engine not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{engine}', expected one of {PROFILERS}")
+    profiler = engine
+
+
+def profile(name, func, *args, **kwargs):
+
+    """
+    Run func(*args, **kwargs), under the profiler if profiling is on and no
+    other call is being profiled. The report is kept, see profiles().
+    output:
+        the result of func
+    """
+
+    engine = profiler
+    if engine is None or not _profile_lock.acquire(blocking=False):
+        return func(*args, **kwargs)
+    try:
+        if engine == 'pyinstrument':
+            from pyinstrument import Profiler  # optional dependency
+            prof = Profiler(async_mode='disabled')
+            prof.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                prof.stop()
+                _keep_profile(name, engine, prof.output_text())
+        import cProfile
+        import pstats
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            prof.disable()
+            out = io.StringIO()
+            pstats.Stats(prof, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            _keep_profile(name, engine, out.getvalue())
+    finally:
+        _profile_lock.release()
+
+
+def _keep_profile(name, engine, report):
+    with _lock:
+        _profiles.append({'time': time.time(), 'name': name, 'profiler': engine, 'report': report})
+
+
+def profiles():
+
+    """
+    The kept profile reports, newest last, as dicts with time, name, profiler and report.
+    """
+
+    with _lock:
+        return list(_profiles)
@@ -0,0 +1,314 @@
+"""
+jobs.py
+Background job manager for the GUI.
+
+Every operation started from the UI is submitted as a Job and runs on a
+shared thread pool, so the NiceGUI event loop only schedules work and awaits
+the result. Jobs are queued per session and lane: jobs of one session in the
+same lane run one at a time in the order they were submitted (so "generate"
+then "plot output" keeps its order), while other sessions and other lanes
+(e.g. playback, zooming) run in parallel on the pool.
+
+Duplicates are coalesced: submitting a job of the same kind drops the ones
+still queued (newest wins), and with supersede=True also cancels the one
+running, e.g. when the filter is applied again with a new cutoff.
+Cancellation is cooperative: long loops call checkpoint(done, total), which
+records the progress of the current job and raises Cancelled once the job
+was cancelled. Outside a job checkpoint does nothing.
+
+Jobs that read or write a file name it in files; jobs sharing a file run
+one at a time (see file_lock), so a plot never reads a half-written output.
+Each job is timed as a 'job.<kind>' span and, while profiling is on, run
+under the profiler (see instrumentation.py).
+"""
+
+import itertools
+import logging
+import os
+import threading
+import asyncio
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import instrumentation
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+WORKERS = min(4, os.cpu_count() or 1)  # pool threads shared by all sessions
+DEFAULT_LANE = 'process'
+
+_local = threading.local()
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+_ids = itertools.count(1)
+
+
+class Cancelled(BaseException):
+
+    """
+    Raised inside a job by checkpoint once the job was cancelled.
+    Like asyncio.CancelledError it is not an Exception, so the
+    try/except Exception blocks of the processing functions let it through.
+    """
+
+
+def checkpoint(done=None, total=None):
+
+    """
+    Report the progress of the job running in this thread and stop it if it was cancelled.
+    input:
+        done, total: work done so far out of total (any unit); omit to only check
+    output:
+        None; raises Cancelled if the current job was cancelled
+    """
+
+    job = getattr(_local, 'job', None)
+    if job is None:
+        return
+    if done is not None and total:
+        job.progress = min(float(done) / total, 1.0)
+    if job.cancel_requested:
+        raise Cancelled()
+
+
+def current():
+
+    """
+    Return the Job running in this thread, or None.
+    """
+
+    return getattr(_local, 'job', None)
+
+
+def file_lock(filename):
+
+    """
+    Return the lock shared by all jobs touching filename (one per absolute path).
+    """
+
+    key = os.path.abspath(filename)
+    with _file_locks_guard:
+        if key not in _file_locks:
+            _file_locks[key] = threading.Lock()
+        return _file_locks[key]
+
+
+class Job:
+
+    """
+    One submitted operation.
+    Await it from the event loop (`result = await job`) to get the return
+    value of func; cancelled and failed jobs resolve to None (see status).
+    input:
+        session: id of the client session that submitted the job
+        kind: job type; queued jobs of the same kind are coalesced
+        func, args: the callable and its positional arguments
+        files: files read or written by the job
+        lane: queue of the session the job runs in
+    """
+
+    def __init__(self, session, kind, func, args=(), files=(), lane=DEFAULT_LANE):
+        self.id = next(_ids)
+        self.session = session
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.files = tuple(sorted({os.path.abspath(f) for f in files}))
+        self.lane = lane
+        self.status = 'queued'  # queued, running, done, cancelled or failed
+        self.progress = 0.0
+        self.error = None
+        self.future = Future()
+        self._cancel = threading.Event()
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind!r}, session={self.session!r}, {self.status})"
+
+    def cancel(self):
+
+        """
+        Ask the job to stop: a queued job never starts, a running one stops at its next checkpoint.
+        """
+
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+
+        """
+        Block until the job has finished and return its result (None if cancelled or failed).
+        """
+
+        return self.future.result(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.error = error
+        if status == 'done':
+            self.progress = 1.0
+        if not self.future.done():
+            self.future.set_result(result)
+
+
+class JobManager:
+
+    """
+    Run jobs on a thread pool with one queue per (session, lane).
+    input:
+        workers: number of pool threads
+    """
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._queues = {}   # (session, lane) -> deque of queued jobs
+        self._running = {}  # (session, lane) -> running job
+
+    # === Submitting ===
+    def submit(self, session, kind, func, *args, files=(), lane=DEFAULT_LANE, supersede=False):
+
+        """
+        Queue func(*args) for a session.
+        input:
+            session: client session id
+            kind: job type, e.g. 'filter' or 'plot_input'
+            func, args: the callable and its arguments
+            files: files read or written; jobs sharing a file never overlap
+            lane: queue within the session; lanes run in parallel
+            supersede: also cancel a running job of the same kind
+        output:
+            Job
+        """
+
+        job = Job(session, kind, func, args, files, lane)
+        key = (session, lane)
+        with self._lock:
+            queue = self._queues.setdefault(key, deque())
+            # Coalesce: the newest request of a kind replaces the queued ones
+            for old in [j for j in queue if j.kind == kind]:
+                queue.remove(old)
+                old.cancel()
+                old._finish('cancelled')
+            running = self._running.get(key)
+            if supersede and running is not None and running.kind == kind:
+                running.cancel()
+            queue.append(job)
+            if running is None:
+                self._schedule(key)
+        return job
+
+    def _schedule(self, key):
+        # Called with self._lock held: start the next job of a queue on the pool
+        job = self._queues[key].popleft()
+        self._running[key] = job
+        self._pool.submit(self._run, key, job)
+
+    def _run(self, key, job):
+        try:
+            self._execute(job)
+        finally:
+            with self._lock:
+                del self._running[key]
+                if self._queues.get(key):
+                    self._schedule(key)
+                else:
+                    self._queues.pop(key, None)
+
+    def _execute(self, job):
+        if job.cancel_requested:
+            job._finish('cancelled')
+            return
+        locks = [file_lock(f) for f in job.files]  # sorted, so no lock-order deadlock
+        for lock in locks:
+            lock.acquire()
+        _local.job = job
+        try:
+            if job.cancel_requested:  # cancelled while waiting for a file
+                job._finish('cancelled')
+                return
+            job.status = 'running'
+            with instrumentation.span(f'job.{job.kind}'):
+                result = instrumentation.profile(job.kind, job.func, *job.args)
+            job._finish('done', result)
+        except Cancelled:
+            log.info("Job %s cancelled", job.kind)
+            job._finish('cancelled')
+        except Exception as e:
+            log.exception("Job %s failed", job.kind)
+            job._finish('failed', error=e)
+        finally:
+            _local.job = None
+            for lock in reversed(locks):
+                lock.release()
+
+    # === Control ===
+    def cancel(self, session, kind=None):
+
+        """
+        Cancel the queued and running jobs of a session (only those of one kind if given).
+        output:
+            number of jobs cancelled
+        """
+
+        count = 0
+        with self._lock:
+            for (s, _), queue in self._queues.items():
+                if s != session:
+                    continue
+                for job in [j for j in queue if kind is None or j.kind == kind]:
+                    queue.remove(job)
+                    job.cancel()
+                    job._finish('cancelled')
+                    count += 1
+            for (s, _), job in self._running.items():
+                if s == session and (kind is None or job.kind == kind):
+                    job.cancel()
+                    count += 1
+        return count
+
+    def progress(self, session):
+
+        """
+        Progress of a session's running jobs.
+        output:
+            list of (kind, fraction done) for each running job, oldest first
+        """
+
+        with self._lock:
+            running = [job for (s, _), job in self._running.items() if s == session]
+        return [(job.kind, job.progress) for job in sorted(running, key=lambda j: j.id)]
+
+    def pending(self, session=None):
+
+        """
+        Number of queued and running jobs, for one session or for all.
+        """
+
+        with self._lock:
+            queued = sum(len(q) for (s, _), q in self._queues.items() if session in (None, s))
+            running = sum(1 for (s, _) in self._running if session in (None, s))
+        return queued + running
+
+    def shutdown(self, wait=True):
+
+        """
+        Cancel everything and stop the pool.
+        """
+
+        with self._lock:
+            sessions = {s for s, _ in list(self._queues) + list(self._running)}
+        for session in sessions:
+            self.cancel(session)
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,67 @@
+"""
+lazy.py
+Modules that are imported on first use.
+
+scipy.signal alone takes most of the import time of the DSP modules, and
+plotly, sounddevice and nicegui are only needed by the GUI and by code that
+opens an audio device. Modules bind heavy dependencies through module(),
+which returns a stand-in that imports the real module the first time one of
+its attributes is read:
+
+    signal = lazy.module('scipy.signal')
+    ...
+    sos = signal.butter(...)   # scipy.signal is imported here, once
+
+so importing dsp, signal_processing or a batch worker only pays for NumPy.
+Attributes are cached on the stand-in after the first lookup, and the
+import itself goes through importlib's per-module lock, so concurrent first
+uses from the job pool are safe.
+"""
+
+import importlib
+import sys
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyModule:
+
+    """
+    Stand-in for a module that is imported on first attribute access.
+    input:
+        name: full module name, e.g. 'scipy.signal'
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def _load(self):
+        if self.__module is None:
+            with _lock:
+                if self.__module is None:
+                    self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def __getattr__(self, attr):
+        # Only called for names not cached on the stand-in yet
+        value = getattr(self._load(), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__module is not None else 'not loaded'
+        return f"<lazy module '{self.__name}' ({state})>"
+
+
+def module(name):
+
+    """
+    Return a module imported on first use (the module itself if it is already imported).
+    """
+
+    return sys.modules.get(name) or LazyModule(name)
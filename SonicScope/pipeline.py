@@ -0,0 +1,180 @@
+"""
+pipeline.py
+Composable in-memory processing chains.
+
+A Pipeline is a list of array-in/array-out steps with an optional source file
+and sink file. Steps run in memory one after another, so a chain such as
+shift -> scale decodes the input once and encodes the output once.
+Consecutive scale steps and consecutive shift steps are fused into one.
+
+Example:
+    Pipeline().source(INPUT_FILENAME).shift(20).scale(0.5).sink(OUTPUT_FILENAME).run()
+"""
+
+import time
+import numpy as np
+
+import config
+import delay
+import dsp
+import jobs
+import signal_store as store
+import wav_decode
+from sample_format import quantize
+import lazy
+
+wavfile = lazy.module('scipy.io.wavfile')  # imported on first use, see lazy.py
+
+
+class Pipeline:
+
+    """
+    Chain of signal operations between an optional source and sink.
+    Every builder method returns the pipeline, so calls can be chained.
+    """
+
+    def __init__(self):
+        self.steps = []  # (name, params)
+        self.source_filename = None
+        self.sink_filename = None
+
+    # === Builders ===
+    def source(self, filename):
+        self.source_filename = filename
+        return self
+
+    def sink(self, filename):
+        self.sink_filename = filename
+        return self
+
+    def scale(self, factor):
+        return self._add('scale', factor=float(factor))
+
+    def shift(self, shift_ms):
+        # A scalar, or one delay per channel
+        return self._add('shift', shift_ms=np.asarray(shift_ms, dtype=np.float64))
+
+    def butter(self, cutoff, btype, order=2, sos=None):
+        return self._add('butter', cutoff=cutoff, btype=btype, order=order, sos=sos)
+
+    def fir(self, cutoff, btype, numtaps=101, engine='auto', taps=None):
+        return self._add('fir', cutoff=cutoff, btype=btype, numtaps=numtaps, engine=engine, taps=taps)
+
+    def apply(self, func, name='apply'):
+
+        """
+        Add a custom step: func(data, rate) -> data.
+        """
+
+        return self._add(name, func=func)
+
+    def tap(self, func, name='tap'):
+
+        """
+        Add an observer step: func(data, rate) is called, the data passes unchanged.
+        """
+
+        return self._add(name, func=func, observe=True)
+
+    def _add(self, name, **params):
+        self.steps.append((name, params))
+        return self
+
+    # === Execution ===
+    def fused(self, rate):
+
+        """
+        Return the steps with consecutive scales and shifts merged.
+        Shifts are converted to (fractional) samples before they are added.
+        """
+
+        fused = []
+        for name, params in self.steps:
+            if name == 'shift':
+                name, params = 'shift', {'samples': delay.delay_samples(params['shift_ms'], rate)}
+            if fused and name == fused[-1][0] == 'scale':
+                fused[-1] = ('scale', {'factor': fused[-1][1]['factor'] * params['factor']})
+            elif fused and name == fused[-1][0] == 'shift':
+                fused[-1] = ('shift', {'samples': fused[-1][1]['samples'] + params['samples']})
+            else:
+                fused.append((name, params))
+        return fused
+
+    def process(self, data, rate, timings=None):
+
+        """
+        Run the steps on an array.
+        input:
+            data: signal, shape (N,) or (N, C)
+            rate: sample rate in Hz
+            timings: optional dict, filled with seconds per step
+        output:
+            processed signal
+        """
+
+        x = data
+        steps = self.fused(rate)
+        for i, (name, params) in enumerate(steps):
+            jobs.checkpoint(i, len(steps))
+            start = time.perf_counter()
+            if name == 'scale':
+                # Arrays made by an earlier step are ours to overwrite
+                x = dsp.scale_signal(x, params['factor'], inplace=x is not data)
+            elif name == 'shift':
+                x = dsp.shift_signal(x, rate, samples=params['samples'])
+            elif name == 'butter':
+                x = dsp.butter_filter(x, rate, params['cutoff'], params['btype'], params['order'],
+                                      sos=params['sos'])
+            elif name == 'fir':
+                x = dsp.fir_filter(x, rate, params['cutoff'], params['btype'], params['numtaps'],
+                                   params['engine'], taps=params['taps'])
+            elif params.get('observe'):
+                params['func'](x, rate)
+            else:
+                x = params['func'](x, rate)
+            if timings is not None:
+                timings[f'{i}:{name}'] = time.perf_counter() - start
+        return x
+
+    def run(self, data=None, rate=None, timings=None):
+
+        """
+        Read the source (unless data is given), process, and write the sink.
+        output:
+            (rate, processed signal)
+        """
+
+        if data is None:
+            if self.source_filename is None:
+                raise ValueError("Pipeline has no source and no data was given")
+            rate, data = load(self.source_filename)
+        out = self.process(data, rate, timings)
+        if self.sink_filename is not None:
+            save(self.sink_filename, rate, out)
+        return rate, out
+
+
+def load(filename):
+
+    """
+    Read a WAV file into memory as float32 samples in [-1, 1], all channels,
+    at its own rate.
+    output:
+        (rate, data) with data of shape (N,) or (N, C)
+    """
+
+    return wav_decode.decode(filename, np.float32, rate=wav_decode.inspect(filename).rate)
+
+
+def save(filename, rate, data, dtype=None):
+
+    """
+    Write a float signal, quantized once at the end.
+    input:
+        dtype: np.int16 or np.float32; None follows config.OUTPUT_FLOAT32
+    """
+
+    if dtype is None:
+        dtype = np.float32 if config.OUTPUT_FLOAT32 else np.int16
+    wavfile.write(filename, rate, quantize(data, dtype, dither=config.DITHER))
+    store.invalidate(filename)
@@ -0,0 +1,250 @@
+"""
+playback.py
+Streaming playback with stop, seek and loop.
+
+A Player streams a memory-mapped WAV file (or an array) to a callback-driven
+sd.OutputStream. A prefetch thread reads the source in READ_BLOCK chunks,
+converts them to float32 and keeps a RingBuffer of PREFETCH_SECONDS filled;
+the audio callback only copies from the ring, so it never touches the disk.
+The first chunk is read before the stream opens, which makes the start
+immediate whatever the file length, and memory stays at the ring size.
+
+If the ring runs dry before the end of the source the callback plays
+silence for the missing frames and counts an underrun. Seeking asks the
+callback to drop what is buffered before the prefetch thread refills the
+ring from the new position; seeking a player that has played to the end
+starts it again. With null=True the stream is a
+realtime.NullOutputStream, so players can run without audio hardware.
+"""
+
+import logging
+import threading
+import numpy as np
+
+import realtime
+import wav_decode
+from ring_buffer import RingBuffer
+from sample_format import gain
+from wav_io import WavReader
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+SAMPLE_RATE = 44100       # in Hz, for array sources
+BLOCK_SIZE = 1024         # frames per callback
+PREFETCH_SECONDS = 0.5    # audio buffered ahead of the callback
+READ_BLOCK = 8192         # frames per read from the source
+FEED_WAIT = 0.01          # seconds the prefetch thread sleeps when the ring is full
+
+
+class Player:
+
+    """
+    Stream a WAV file or an array to the output device.
+    input:
+        source: path to a WAV file (16-bit PCM and 32-bit float are memory-mapped,
+                other formats are decoded), or an array (N,) / (N, C)
+        rate: sample rate of an array source
+        device: sounddevice output device (None for the default)
+        blocksize: frames per callback
+        loop: start over at the end of the source until stopped
+        null: play to a NullOutputStream instead of a device
+        realtime: pace a null stream like a device
+    """
+
+    def __init__(self, source, rate=SAMPLE_RATE, device=None, blocksize=BLOCK_SIZE, loop=False,
+                 null=False, realtime=True):
+        self._reader = None
+        if isinstance(source, str):
+            info = wav_decode.inspect(source)
+            if (info.format, info.bits) in (('pcm', 16), ('float', 32)):
+                self._reader = WavReader(source)
+                rate, data = self._reader.rate, self._reader.data
+            else:
+                rate, data = wav_decode.decode(source, np.float32, rate=info.rate)
+        else:
+            data = np.asarray(source)
+        self.data = data[:, None] if data.ndim == 1 else data
+        self.rate = rate
+        self.channels = self.data.shape[1]
+        self.device = device
+        self.blocksize = blocksize
+        self.loop = loop
+        self.null = null
+        self.realtime = realtime
+        self.stream = None
+        self.ring = RingBuffer(max(int(PREFETCH_SECONDS * rate), READ_BLOCK), self.channels)
+        self.underruns = 0      # callbacks that got fewer frames than they needed
+        self.status_errors = 0  # underflows reported by the device
+        self.finished = threading.Event()
+        self._scale = np.float32(gain(self.data.dtype))
+        self._read_pos = 0      # next frame to prefetch (prefetch thread)
+        self._play_pos = 0      # frames played since the start or the last seek (audio thread)
+        self._seek = None       # requested position (control thread)
+        self._flush_to = None   # position the callback restarts from after dropping the ring
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._ended = False     # played to the end, the prefetch thread has exited
+        self._stream_lock = threading.Lock()
+        self._control_lock = threading.Lock()  # seek requests vs the prefetch thread exiting
+
+    # === Audio thread ===
+    def _callback(self, outdata, frames, time_info, status):
+        if status:
+            self.status_errors += 1
+        if self._flush_to is not None:
+            self.ring.skip()
+            self._play_pos, self._flush_to = self._flush_to, None
+            outdata.fill(0)
+            return
+        got = len(self.ring.read(frames, out=outdata))
+        self._play_pos += got
+        if got < frames:
+            outdata[got:] = 0
+            if self._eof and self.ring.available() == 0:
+                self.finished.set()
+            else:
+                self.underruns += 1
+
+    # === Prefetch thread ===
+    def _fill(self):
+        # Move up to one READ_BLOCK from the source into the ring; False when there was no room
+        n = len(self.data)
+        if self._read_pos >= n:
+            if not (self.loop and n):
+                self._eof = True
+                return False
+            self._read_pos = 0
+        m = min(READ_BLOCK, self.ring.free(), n - self._read_pos)
+        if m <= 0:
+            return False
+        block = self.data[self._read_pos:self._read_pos + m]
+        self.ring.write(block * self._scale if block.dtype != np.float32 else block)
+        self._read_pos += m
+        return True
+
+    def _feed(self):
+        while not self._stop.is_set():
+            seek = self._seek
+            if seek is not None:
+                self._seek = None
+                self._flush_to = seek
+                # Wait for the callback to drop the old audio before refilling
+                while self._flush_to is not None and self.stream.active and not self._stop.is_set():
+                    self._stop.wait(FEED_WAIT)
+                self._read_pos, self._eof = seek, False
+                self.finished.clear()
+                continue
+            if self.finished.is_set():
+                with self._control_lock:
+                    if self._seek is not None:
+                        continue  # a seek came in while finishing
+                    self._close_stream()
+                    self._thread = None
+                    self._ended = True
+                break
+            if not self._fill():
+                self._stop.wait(FEED_WAIT)
+
+    # === Control ===
+    def start(self):
+
+        """
+        Start playing from the current position.
+        """
+
+        self.finished.clear()
+        self._stop.clear()
+        self._ended = self._eof = False
+        self._fill()  # the first block is ready before the stream asks for it
+        kwargs = dict(samplerate=self.rate, blocksize=self.blocksize, channels=self.channels,
+                      dtype='float32', callback=self._callback)
+        if self.null:
+            self.stream = realtime.NullOutputStream(realtime=self.realtime, **kwargs)
+        else:
+            import sounddevice as sd  # only needed for hardware streams
+            self.stream = sd.OutputStream(device=self.device, **kwargs)
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._thread.start()
+        self.stream.start()
+
+    def stop(self):
+
+        """
+        Stop playing and release the device and the file.
+        """
+
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+        self._ended = False
+        self._close_stream()
+        self.finished.set()
+        if self._reader is not None:
+            self.data = None
+            self._reader.close()
+            self._reader = None
+        log.info("Playback stopped at %.2f s, %d underruns", self.position, self.underruns)
+
+    def _close_stream(self):
+        with self._stream_lock:
+            if self.stream is not None:
+                self.stream.stop()
+                self.stream.close()
+                self.stream = None
+
+    def seek(self, seconds):
+
+        """
+        Continue playing from a position in seconds.
+        """
+
+        frames = int(np.clip(seconds * self.rate, 0, len(self.data)))
+        with self._control_lock:
+            if self._thread is not None:
+                self._seek = frames
+                return
+            self._read_pos = self._play_pos = frames
+            restart, self._ended = self._ended, False
+        if restart:
+            self.start()
+
+    def wait(self, timeout=None):
+
+        """
+        Block until the source was played to the end (never, when looping).
+        output:
+            True if playback finished
+        """
+
+        return self.finished.wait(timeout)
+
+    # === Status ===
+    @property
+    def active(self):
+        return self.stream is not None and not self.finished.is_set()
+
+    @property
+    def duration(self):
+        return len(self.data) / self.rate if self.data is not None else 0.0
+
+    @property
+    def position(self):
+
+        """
+        Position of the audio being played, in seconds.
+        """
+
+        n = len(self.data) if self.data is not None else 0
+        pos = self._play_pos % n if self.loop and n else self._play_pos
+        return pos / self.rate
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,185 @@
+"""
+plot_transport.py
+Incremental, binary updates of the GUI's Plotly figures.
+
+ui.plotly.update() re-serializes the whole figure, every trace as a JSON list
+of floats, so each new trace re-sends everything already on screen.
+FigureSync remembers which traces the browser has and, on sync(), only sends
+the difference through Plotly.js calls:
+
+    new traces        Plotly.addTraces
+    changed traces    Plotly.restyle (x, y, z and name of that trace only)
+    removed traces    Plotly.deleteTraces
+
+Arrays travel as Plotly typed-array specs, {'dtype': 'f4', 'bdata': base64},
+so samples stay float32 (4 bytes per value, about 5.3 characters as base64,
+instead of ~20 characters of a JSON float). The redraw cost of an operation
+now depends on what it changed, not on how many traces are shown.
+sync() and refresh() are timed as 'plot_serialize' spans (see instrumentation.py).
+The figure's layout is not synced: the browser owns the zoom, and layout
+set on the server goes out with refresh().
+"""
+
+import base64
+import itertools
+import json
+import numpy as np
+
+from instrumentation import span
+
+# === Constants ===
+ARRAY_KEYS = ('x', 'y', 'z')  # trace attributes sent as typed arrays
+_TYPED = {'i1', 'u1', 'i2', 'u2', 'i4', 'u4', 'f4'}  # dtypes Plotly.js decodes
+_uids = itertools.count()
+
+
+def encode(values):
+
+    """
+    Encode an array as a Plotly typed-array spec.
+    Floats are sent as float32, 64-bit integers as float32 too (Plotly.js has
+    no 64-bit typed arrays); anything non-numeric is returned unchanged.
+    input:
+        values: array-like, 1-D or 2-D (e.g. a heatmap z)
+    output:
+        {'dtype', 'bdata'[, 'shape']} or values itself
+    """
+
+    if values is None or isinstance(values, (str, dict)):
+        return values
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'iuf' or arr.ndim == 0:
+        return values
+    if arr.dtype.str[1:] not in _TYPED:
+        arr = arr.astype(np.float32)
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+    spec = {'dtype': arr.dtype.str[1:], 'bdata': base64.b64encode(arr.tobytes()).decode('ascii')}
+    if arr.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in arr.shape)
+    return spec
+
+
+def trace_json(trace):
+
+    """
+    JSON-ready dict of a plotly trace with its arrays encoded, see encode.
+    """
+
+    data = trace.to_plotly_json()
+    for key in ARRAY_KEYS:
+        if key in data:
+            data[key] = encode(trace[key])
+    return data
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=_json_default)
+
+
+def _json_default(value):
+    # numpy scalars and stray arrays inside trace properties (e.g. marker colors)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FigureSync:
+
+    """
+    Keep the browser copy of a ui.plotly element's figure in sync, incrementally.
+    input:
+        plot: ui.plotly element showing a plotly go.Figure
+    """
+
+    def __init__(self, plot):
+        self.plot = plot
+        self.sent = []  # (uid, state) of the traces in the browser, in order
+        self.bytes_sent = 0
+
+    @staticmethod
+    def _state(trace):
+        # The objects themselves are kept, so an array cannot be freed and its id reused
+        return tuple(trace[key] if key in trace else None for key in ARRAY_KEYS) + (trace.name,)
+
+    @staticmethod
+    def _changed(old, new):
+        return any(a is not b for a, b in zip(old[:-1], new[:-1])) or old[-1] != new[-1]
+
+    def refresh(self):
+
+        """
+        Send the whole figure, layout included, and start tracking from it.
+        """
+
+        self._assign_uids()
+        with span('plot_serialize'):
+            self.plot.update()
+        self.sent = [(trace.uid, self._state(trace)) for trace in self.plot.figure.data]
+
+    def sync(self):
+
+        """
+        Send the traces that were added, changed or removed since the last sync.
+        output:
+            number of characters of JavaScript sent (0 if nothing changed)
+        """
+
+        with span('plot_serialize') as stage:
+            size = self._sync()
+            stage.add(nbytes=size)
+        return size
+
+    def _sync(self):
+        self._assign_uids()
+        traces = list(self.plot.figure.data)
+        current = {trace.uid: i for i, trace in enumerate(traces)}
+        calls = []
+
+        # Removed traces
+        gone = [i for i, (uid, _) in enumerate(self.sent) if uid not in current]
+        if gone:
+            calls.append(f"Plotly.deleteTraces(el,{_dumps(gone)});")
+            self.sent = [entry for entry in self.sent if entry[0] in current]
+        # The browser's traces must still be in the server's order, or start over
+        kept = [current[uid] for uid, _ in self.sent]
+        if kept != sorted(kept):
+            self.refresh()
+            return 0
+
+        # Changed traces
+        sent = dict(self.sent)
+        for index, (uid, old) in enumerate(self.sent):
+            trace = traces[current[uid]]
+            state = self._state(trace)
+            if self._changed(old, state):
+                # Only the attributes that changed, e.g. the y of a zoomed trace
+                update = {key: [encode(b)] for key, a, b in zip(ARRAY_KEYS, old, state)
+                          if a is not b and b is not None}
+                if old[-1] != state[-1]:
+                    update['name'] = [trace.name]
+                calls.append(f"Plotly.restyle(el,{_dumps(update)},[{index}]);")
+                sent[uid] = state
+
+        # New traces, inserted at their final positions
+        new = [i for i, trace in enumerate(traces) if trace.uid not in sent]
+        if new:
+            data = [trace_json(traces[i]) for i in new]
+            calls.append(f"Plotly.addTraces(el,{_dumps(data)},{_dumps(new)});")
+            for i in new:
+                sent[traces[i].uid] = self._state(traces[i])
+
+        self.sent = [(trace.uid, sent[trace.uid]) for trace in traces]
+        if not calls:
+            return 0
+        code = f"(() => {{const el = document.getElementById('c{self.plot.id}'); {''.join(calls)}}})()"
+        self.plot.client.run_javascript(code)
+        self.bytes_sent += len(code)
+        return len(code)
+
+    def _assign_uids(self):
+        # Traces are matched by uid; give the ones created without one a fresh uid
+        for trace in self.plot.figure.data:
+            if trace.uid is None:
+                trace.uid = f"trace-{next(_uids)}"
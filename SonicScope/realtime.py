@@ -0,0 +1,411 @@
+"""
+realtime.py
+Low-latency duplex streaming with live filtering.
+
+A LiveSession opens a sounddevice duplex Stream. Every audio callback runs
+the input block through a causal BlockFilter (the filter state is carried
+from block to block), writes it to the output and pushes a copy into a
+lock-free RingBuffer. The GUI drains that buffer on a timer and gets a peak
+level per channel and a magnitude spectrum of the latest samples, at its own
+much lower rate, so plotting never delays the audio thread.
+
+With BLOCK_SIZE = 256 one block is 5.8 ms at 44.1 kHz; together with the
+device's 'low' latency setting this keeps the end-to-end latency under
+LATENCY_TARGET on common hardware (see LiveSession.latency).
+
+SimulatedStream is a stand-in for sd.Stream fed from an array or a WAV file,
+so sessions can run without audio hardware; SimulatedInputStream does the
+same for sd.InputStream, and NullOutputStream for sd.OutputStream.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+import dsp
+import filter_design as design
+from ring_buffer import RingBuffer
+from sample_format import to_float32, quantize
+from stream_filter import BlockFilter
+from wav_io import WavReader
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+scipy_fft = lazy.module('scipy.fft')
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+SAMPLE_RATE = 44100   # in Hz
+BLOCK_SIZE = 256      # frames per callback
+LATENCY_TARGET = 0.020  # seconds, input to output
+RING_SECONDS = 1.0    # monitor buffer length
+NFFT = 2048           # live spectrum length
+MAX_POINTS = 512      # spectrum points sent to the plot
+LEVEL_HISTORY = 300   # level values kept for the rolling level plot
+
+
+def make_filter(rate, cutoff, btype, design_type='butter', order=5, numtaps=101):
+
+    """
+    Design a causal live filter.
+    input:
+        rate: sample rate in Hz
+        cutoff: cutoff frequency or (low, high) for band filters
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        design_type: 'butter' or 'fir'
+        order: Butterworth order
+        numtaps: FIR taps; long filters use overlap-add FFT convolution per block
+    output:
+        BlockFilter
+    """
+
+    if design_type == 'fir':
+        numtaps = dsp.fir_numtaps(numtaps, btype)
+        taps = design.fir_taps(numtaps, cutoff, btype, rate)
+        engine = 'fft' if numtaps >= dsp.FIR_FFT_MIN_TAPS else 'direct'
+        return BlockFilter(taps=taps, engine=engine)
+    return BlockFilter(sos=design.butter_sos(order, cutoff, btype, rate))
+
+
+def _to_float(data):
+    # Integer PCM to float32 in [-1, 1], always (N, C)
+    data = to_float32(data)
+    return data[:, None] if data.ndim == 1 else data
+
+
+class SimulatedStream:
+
+    """
+    Stand-in for sounddevice.Stream that plays an array or a WAV file into the
+    callback instead of a microphone. Accepts the same keyword arguments as
+    sd.Stream, so LiveSession can use either.
+    input:
+        source: array (N,) / (N, C), or path to a WAV file
+        samplerate: sample rate of an array source (files use their own)
+        blocksize: frames per callback
+        callback: callback(indata, outdata, frames, time, status)
+        dtype: sample type passed to the callback ('float32' or 'int16')
+        realtime: pace the callbacks like a device; False runs as fast as possible
+        loop: restart from the beginning at the end of the source
+        keep_output: keep the output blocks in self.output
+    """
+
+    def __init__(self, source, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, callback=None,
+                 dtype='float32', realtime=True, loop=False, keep_output=True, **kwargs):
+        if isinstance(source, str):
+            with WavReader(source) as reader:
+                samplerate, source = reader.rate, np.array(reader.data)
+        self.dtype = np.dtype(dtype)
+        source = np.asarray(source)
+        if self.dtype == np.int16 and source.dtype == np.int16:
+            self.data = source[:, None] if source.ndim == 1 else source
+        elif self.dtype == np.int16:
+            self.data = quantize(_to_float(source), np.int16, dither=False)
+        else:
+            self.data = _to_float(source)
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = self.data.shape[1]
+        self.callback = callback
+        self.realtime = realtime
+        self.loop = loop
+        self.keep_output = keep_output
+        self.output = []
+        self.latency = (blocksize / samplerate, blocksize / samplerate)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+    def wait(self):
+
+        """
+        Block until the source has been played to the end.
+        """
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        n, bs = len(self.data), self.blocksize
+        indata = np.zeros((bs, self.channels), dtype=self.dtype)
+        outdata = np.zeros_like(indata)
+        period = bs / self.samplerate
+        deadline = time.perf_counter()
+        pos = 0
+        status = ''
+        while not self._stop.is_set():
+            if pos >= n:
+                if not self.loop or n == 0:
+                    break
+                pos = 0
+            frames = min(bs, n - pos)
+            indata[:frames] = self.data[pos:pos + frames]
+            indata[frames:] = 0
+            self._invoke(indata, outdata, frames, status)
+            pos += frames
+            if self.realtime:
+                deadline += period
+                now = time.perf_counter()
+                # A callback that overran its block is what a device reports as underflow
+                status = 'output underflow' if now > deadline + period else ''
+                time.sleep(max(0.0, deadline - now))
+
+    def _invoke(self, indata, outdata, frames, status):
+        outdata.fill(0)
+        self.callback(indata, outdata, self.blocksize, None, status)
+        if self.keep_output:
+            self.output.append(outdata[:frames].copy())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SimulatedInputStream(SimulatedStream):
+
+    """
+    Stand-in for sounddevice.InputStream: callback(indata, frames, time, status).
+    Only the frames taken from the source are passed, so the last block may be short.
+    """
+
+    def __init__(self, source, keep_output=False, **kwargs):
+        super().__init__(source, keep_output=keep_output, **kwargs)
+        self.latency = self.blocksize / self.samplerate
+
+    def _invoke(self, indata, outdata, frames, status):
+        self.callback(indata[:frames], frames, None, status)
+
+
+class NullOutputStream:
+
+    """
+    Stand-in for sounddevice.OutputStream that discards what the callback
+    writes, for running players without audio hardware.
+    input:
+        samplerate: sample rate in Hz
+        blocksize: frames per callback
+        channels: number of channels
+        callback: callback(outdata, frames, time, status)
+        dtype: sample type of outdata
+        realtime: pace the callbacks like a device; False runs as fast as possible
+        keep_output: keep the output blocks in self.output
+    """
+
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE, channels=1, callback=None,
+                 dtype='float32', realtime=True, keep_output=False, **kwargs):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.callback = callback
+        self.dtype = np.dtype(dtype)
+        self.realtime = realtime
+        self.keep_output = keep_output
+        self.output = []
+        self.latency = blocksize / samplerate
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+        period = self.blocksize / self.samplerate
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            outdata.fill(0)
+            self.callback(outdata, self.blocksize, None, '')
+            if self.keep_output:
+                self.output.append(outdata.copy())
+            if self.realtime:
+                deadline += period
+                time.sleep(max(0.0, deadline - time.perf_counter()))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LiveSession:
+
+    """
+    Duplex input -> filter -> output stream with a plot monitor.
+    input:
+        rate: sample rate in Hz
+        channels: number of channels
+        blocksize: frames per callback
+        live_filter: BlockFilter applied to every block, or None to pass through
+        device: sounddevice device (None for the default)
+        source: array or WAV path to run on a SimulatedStream instead of hardware
+        realtime: pace a simulated source like a device
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, channels=1, blocksize=BLOCK_SIZE, live_filter=None,
+                 device=None, source=None, realtime=True):
+        if isinstance(source, str):
+            with WavReader(source) as reader:
+                rate, channels = reader.rate, reader.channels
+        elif source is not None:
+            channels = 1 if np.ndim(source) == 1 else np.shape(source)[1]
+        self.rate = rate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.filter = live_filter
+        self.device = device
+        self.source = source
+        self.realtime = realtime
+        self.stream = None
+
+        # Written by the audio thread only
+        self.ring = RingBuffer(int(RING_SECONDS * rate), channels)
+        self.blocks = 0
+        self.xruns = 0
+        self.max_callback = 0.0
+
+        # Used by the monitor (GUI) thread only
+        self.frames_seen = 0
+        self.levels = deque(maxlen=LEVEL_HISTORY)  # (time, peak per channel)
+        self._history = np.zeros((NFFT, channels), dtype=np.float32)
+        self._window = signal.get_window('hann', NFFT).astype(np.float32)[:, None]
+
+    # === Audio thread ===
+    def _callback(self, indata, outdata, frames, time_info, status):
+        start = time.perf_counter()
+        if status:
+            self.xruns += 1
+        block = indata if self.filter is None else self.filter.process(indata)
+        np.clip(block, -1.0, 1.0, out=outdata)
+        self.ring.write(outdata)
+        self.blocks += 1
+        self.max_callback = max(self.max_callback, time.perf_counter() - start)
+
+    # === Control ===
+    def start(self):
+
+        """
+        Open and start the stream.
+        """
+
+        if self.filter is not None:
+            self.filter.reset()
+        kwargs = dict(samplerate=self.rate, blocksize=self.blocksize, channels=self.channels,
+                      dtype='float32', latency='low', callback=self._callback)
+        if self.source is not None:
+            self.stream = SimulatedStream(self.source, realtime=self.realtime, **kwargs)
+        else:
+            import sounddevice as sd  # only needed for hardware streams
+            self.stream = sd.Stream(device=self.device, **kwargs)
+        self.stream.start()
+        latency = self.latency
+        log.info("Live stream started: %d Hz, %d ch, block %d, latency %.1f ms",
+                 self.rate, self.channels, self.blocksize, latency * 1000)
+        if latency > LATENCY_TARGET:
+            log.warning("Latency %.1f ms is above the %.0f ms target", latency * 1000, LATENCY_TARGET * 1000)
+
+    def stop(self):
+
+        """
+        Stop and close the stream.
+        """
+
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            log.info("Live stream stopped: %d blocks, %d xruns, %d monitor frames dropped, "
+                     "slowest callback %.2f ms", self.blocks, self.xruns, self.ring.dropped,
+                     self.max_callback * 1000)
+        self.stream = None
+
+    @property
+    def active(self):
+        return self.stream is not None and self.stream.active
+
+    @property
+    def latency(self):
+
+        """
+        Input plus output latency reported by the stream, in seconds.
+        """
+
+        if self.stream is None:
+            return None
+        return float(sum(self.stream.latency))
+
+    # === Monitor ===
+    def poll(self):
+
+        """
+        Drain the monitor buffer and return the latest plot data.
+        output:
+            times: (T,) level times in seconds
+            levels: (T, C) peak level per poll, in [0, 1]
+            freq: (F,) frequencies in Hz, at most MAX_POINTS
+            spectrum_db: (F, C) magnitude of the last NFFT samples in dBFS
+        """
+
+        new = self.ring.read()
+        n = len(new)
+        if n:
+            self.frames_seen += n
+            self.levels.append((self.frames_seen / self.rate, np.abs(new).max(axis=0)))
+            if n >= NFFT:
+                self._history[:] = new[-NFFT:]
+            else:
+                self._history[:-n] = self._history[n:]
+                self._history[-n:] = new
+
+        spec = np.abs(scipy_fft.rfft(self._history * self._window, axis=0))
+        # Full-scale sine -> 0 dBFS
+        spec *= 2 / self._window.sum()
+        step = -(-len(spec) // MAX_POINTS)
+        bins = len(spec) // step * step
+        spec = spec[:bins].reshape(-1, step, self.channels).max(axis=1)  # keep the peaks
+        freq = scipy_fft.rfftfreq(NFFT, d=1 / self.rate)[:bins:step]
+        with np.errstate(divide='ignore'):
+            spectrum_db = 20 * np.log10(spec)
+
+        if self.levels:
+            times = np.array([t for t, _ in self.levels])
+            levels = np.array([peaks for _, peaks in self.levels])
+        else:
+            times, levels = np.empty(0), np.empty((0, self.channels))
+        return times, levels, freq, spectrum_db
@@ -0,0 +1,167 @@
+"""
+recorder.py
+Recording of any length at constant memory.
+
+The sd.InputStream callback only copies each block into a preallocated
+RingBuffer. A writer thread drains the buffer and appends the samples to the
+WAV file through WavWriter, which patches the RIFF header with the final
+sizes when the recording stops. Memory use is the ring size, whatever the
+duration. If the writer falls behind and the ring fills up, the callback
+drops the block instead of waiting and the overrun is counted.
+
+A SimulatedInputStream (see realtime.py) can replace the microphone.
+"""
+
+import logging
+import threading
+import numpy as np
+
+import realtime
+from ring_buffer import RingBuffer
+from wav_io import WavReader, WavWriter
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+SAMPLE_RATE = 44100   # in Hz
+CHANNELS = 2
+BLOCK_SIZE = 1024     # frames per callback
+RING_SECONDS = 2.0    # audio buffered between the callback and the writer
+WRITE_BLOCK = 8192    # frames per file write
+WRITER_WAIT = 0.02    # seconds the writer sleeps when the ring is empty
+
+
+class Recorder:
+
+    """
+    Record 16-bit PCM from an input stream straight to a WAV file.
+    input:
+        filename: WAV file to create
+        rate: sample rate in Hz
+        channels: number of channels
+        device: sounddevice input device (None for the default)
+        source: array or WAV path recorded instead of the microphone
+        realtime: pace a simulated source like a device
+        loop: repeat a simulated source until stopped
+    """
+
+    def __init__(self, filename, rate=SAMPLE_RATE, channels=CHANNELS, device=None,
+                 source=None, realtime=True, loop=False):
+        if isinstance(source, str):
+            with WavReader(source) as reader:
+                rate, channels = reader.rate, reader.channels
+        elif source is not None:
+            channels = 1 if np.ndim(source) == 1 else np.shape(source)[1]
+        self.filename = filename
+        self.rate = rate
+        self.channels = channels
+        self.device = device
+        self.source = source
+        self.realtime = realtime
+        self.loop = loop
+        self.ring = RingBuffer(int(RING_SECONDS * rate), channels, dtype=np.int16)
+        self.status_errors = 0  # input overflows reported by the device
+        self.stream = None
+        self._writer = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # === Audio thread ===
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            self.status_errors += 1
+        self.ring.write(indata)
+
+    # === Writer thread ===
+    def _drain(self):
+        block = np.empty((WRITE_BLOCK, self.channels), dtype=np.int16)
+        while True:
+            stopping = self._stop.is_set()
+            if self.ring.available():
+                self._writer.write(self.ring.read(WRITE_BLOCK, out=block))
+            elif stopping:
+                break
+            else:
+                self._stop.wait(WRITER_WAIT)
+
+    # === Control ===
+    def start(self):
+
+        """
+        Create the file and start recording.
+        """
+
+        self._writer = WavWriter(self.filename, self.rate, self.channels)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+        kwargs = dict(samplerate=self.rate, blocksize=BLOCK_SIZE, channels=self.channels,
+                      dtype='int16', callback=self._callback)
+        try:
+            if self.source is not None:
+                self.stream = realtime.SimulatedInputStream(self.source, realtime=self.realtime,
+                                                            loop=self.loop, **kwargs)
+            else:
+                import sounddevice as sd  # only needed for hardware streams
+                self.stream = sd.InputStream(device=self.device, **kwargs)
+            self.stream.start()
+        except Exception:
+            self._finish()
+            raise
+
+    def stop(self):
+
+        """
+        Stop recording, flush the buffered audio and finalize the WAV header.
+        output:
+            number of frames written
+        """
+
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        self._finish()
+        log.info("Recorded %d frames (%.2f s) to %s, %d overruns (%d frames dropped)",
+                 self.frames, self.duration, self.filename, self.overruns, self.ring.dropped)
+        return self.frames
+
+    def _finish(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._writer is not None:
+            self._writer.close()
+
+    def wait(self):
+
+        """
+        Block until a simulated source has been recorded to the end.
+        """
+
+        if self.stream is not None and hasattr(self.stream, 'wait'):
+            self.stream.wait()
+
+    # === Status ===
+    @property
+    def recording(self):
+        return self.stream is not None
+
+    @property
+    def frames(self):
+        return self._writer.frames if self._writer is not None else 0
+
+    @property
+    def duration(self):
+        return self.frames / self.rate
+
+    @property
+    def overruns(self):
+
+        """
+        Number of callbacks that lost audio: blocks dropped because the ring
+        was full, plus overflows reported by the device.
+        """
+
+        return self.ring.overruns + self.status_errors
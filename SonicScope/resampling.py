@@ -0,0 +1,518 @@
+"""
+resampling.py
+Polyphase resampling and reduced-rate processing.
+
+A signal whose content of interest lies far below Nyquist (a 1 kHz low-pass,
+a band-pass around the 120 Hz / 440 Hz samples) does not need the full sample
+rate. reduction_factor picks how far such a band can be decimated, and the
+decimation runs as a chain of small polyphase stages (STAGE_FACTORS, from 8
+down to 2, largest first). Each stage only has to keep the final band free of aliases,
+so the early, high-rate stages get short filters with wide transitions and
+the whole chain costs a few multiply-adds per input sample. Interpolation
+back to the original rate runs the same stages in reverse.
+
+decimate and interpolate work on whole arrays (scipy.signal.resample_poly with
+the stage filters); Decimator and Interpolator do the same block by block,
+carrying their state, and produce the same samples for any block split.
+Filtering and analysis at the reduced rate are built on these:
+
+    filter_reduced(data, rate, factor, edge, func)             -- in memory
+    filter_to_wav(data, rate, filename, factor, edge, sos=...)  -- streamed
+    decimate_blocks(blocks, rate, factor, edge)                -- for analysis
+
+The stage filters are linear phase and centred, so reduced-rate results line
+up sample for sample with the original signal. Both ends are oddly
+extended as far as the stage filters reach (as filtfilt pads), so the edges
+do not fall towards zero; the decimated signal keeps one sample at or past
+the last input, so interpolating back never extrapolates.
+"""
+
+from functools import lru_cache
+from math import gcd
+import os
+import tempfile
+import numpy as np
+
+from jobs import checkpoint
+from sample_format import gain, quantize, to_float32
+from stream_filter import filter_blocks, odd_ext
+from wav_io import WavWriter, iter_blocks, BLOCK_SIZE
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+
+# === Constants ===
+STAGE_FACTORS = (8, 6, 5, 4, 3, 2)  # decimation factors of single stages, largest first
+MAX_FACTOR = 64            # largest total decimation factor
+MARGIN = 2.5               # the reduced rate is at least MARGIN x the highest frequency kept
+STOPBAND_DB = 60           # alias rejection of the stage filters
+BAND_DB = 60               # a filter's band ends where its zero-phase response is this far down
+HAMMING_WIDTH = 3.3        # transition width of a Hamming firwin design, in rate / numtaps
+MIN_LENGTH = 1024          # shortest reduced signal worth the resampling
+
+
+# === Band edges ===
+def butter_band_edge(cutoff, btype, order):
+
+    """
+    Highest frequency a zero-phase Butterworth filter passes above -BAND_DB.
+    Uses the analog prototype; the bilinear transform only makes the digital
+    filter fall faster, so the edge is conservative.
+    input:
+        cutoff: cutoff frequency or [low, high] frequencies in Hz
+        btype: 'lowpass', 'highpass', 'bandpass' or 'bandstop'
+        order: order of the filter
+    output:
+        frequency in Hz, or None when the filter passes up to Nyquist (highpass, bandstop)
+    """
+
+    if btype not in ('lowpass', 'bandpass'):
+        return None
+    # sosfiltfilt squares the response: |H|^2 = 1 / (1 + w^(2 order)) per pass
+    w = (10 ** (BAND_DB / 20) - 1) ** (1 / (2 * order))
+    if btype == 'lowpass':
+        return float(np.max(cutoff)) * w
+    low, high = (float(f) for f in cutoff)
+    # Band-pass transform: w = (f^2 - low high) / (f (high - low)), solved for f
+    width = w * (high - low)
+    return (width + np.sqrt(width ** 2 + 4 * low * high)) / 2
+
+
+def fir_band_edge(cutoff, btype, numtaps, rate):
+
+    """
+    Highest frequency a Hamming-window firwin design passes, its upper cutoff
+    plus the transition width.
+    output:
+        frequency in Hz, or None when the filter passes up to Nyquist (highpass, bandstop)
+    """
+
+    if btype not in ('lowpass', 'bandpass'):
+        return None
+    return float(np.max(cutoff)) + HAMMING_WIDTH * rate / numtaps
+
+
+# === Stages ===
+def reduction_factor(rate, edge, length=None, min_length=MIN_LENGTH):
+
+    """
+    Largest decimation factor that keeps [0, edge] Hz intact.
+    input:
+        rate: sample rate in Hz
+        edge: highest frequency to keep, in Hz (None: nothing can be dropped)
+        length: signal length; the reduced signal keeps at least min_length samples
+    output:
+        int factor, a product of STAGE_FACTORS up to MAX_FACTOR (1 for no reduction)
+    """
+
+    if edge is None or edge <= 0:
+        return 1
+    limit = min(int(rate / (MARGIN * edge)), MAX_FACTOR)
+    if length is not None:
+        limit = min(limit, length // min_length)
+    for factor in range(limit, 1, -1):
+        rest = factor
+        for q in STAGE_FACTORS:
+            while rest % q == 0:
+                rest //= q
+        if rest == 1:
+            return factor
+    return 1
+
+
+def stage_factors(factor):
+
+    """
+    Split a decimation factor into single stages, largest first.
+    """
+
+    stages = []
+    for q in STAGE_FACTORS:
+        while factor % q == 0:
+            stages.append(q)
+            factor //= q
+    if factor != 1:
+        raise ValueError(f"Factor must be a product of {STAGE_FACTORS}")
+    return tuple(stages)
+
+
+@lru_cache(maxsize=32)
+def design_stages(rate, factor, edge):
+
+    """
+    Design the anti-aliasing filters of a decimation chain.
+    Stage i runs at rate_i and passes [0, edge]; only the band that folds
+    onto it, from rate_i / q - edge up, has to be rejected.
+    input:
+        rate: input sample rate in Hz
+        factor: total decimation factor (see reduction_factor)
+        edge: highest frequency kept, in Hz
+    output:
+        tuple of (q, taps) per stage; taps are odd-length, unit-gain, with a
+        half length that is a multiple of q
+    """
+
+    stages = []
+    for q in stage_factors(factor):
+        out_rate = rate / q
+        width = (out_rate - 2 * edge) / (rate / 2)  # transition, relative to Nyquist
+        if width <= 0:
+            raise ValueError(f"{edge} Hz does not fit below {out_rate / 2} Hz")
+        numtaps, beta = signal.kaiserord(STOPBAND_DB, width)
+        half = -(-(numtaps // 2) // q) * q  # rounded up to a multiple of q
+        taps = signal.firwin(2 * half + 1, 1 / q, window=('kaiser', beta))
+        taps.setflags(write=False)
+        stages.append((q, taps))
+        rate = out_rate
+    return tuple(stages)
+
+
+def reach(rate, factor, edge):
+
+    """
+    Input samples on either side of a point that a decimation chain reads.
+    The signal is extended by this much (odd extension, as in sosfiltfilt)
+    before resampling, so the edges are not pulled towards zero.
+    """
+
+    span, step = 0, 1
+    for q, taps in design_stages(rate, factor, edge):
+        span += (len(taps) - 1) // 2 * step
+        step *= q
+    return span
+
+
+def reduced_length(length, factor):
+
+    """
+    Number of samples of a signal decimated by factor. The last one is at or
+    past the end of the signal (from the odd extension), so interpolating
+    back covers every original sample without extrapolating. Signals no
+    longer than the factor have no room for the extension and keep one sample.
+    """
+
+    if length <= factor:
+        return min(length, 1)
+    return -(-(length - 1) // factor) + 1
+
+
+def _padding(rate, factor, edge, down, length=None):
+    # Odd-extension length, kept a multiple of down and (given a length) inside the signal
+    pad = -(-reach(rate, factor, edge) // factor)
+    if down > 1:
+        pad *= factor
+    if length is not None:
+        pad = max(min(pad, (length - 1) // down * down), 0)
+    return pad
+
+
+def _extend(x, pad):
+    if pad == 0:
+        return np.asarray(x, dtype=np.float64)
+    left, right = odd_ext(x, pad)
+    return np.concatenate((left, x, right))
+
+
+# === Batch ===
+def resample(data, rate, target_rate):
+
+    """
+    Resample a float signal along axis 0 with a polyphase filter.
+    output:
+        resampled signal (float32)
+    """
+
+    if rate == target_rate:
+        return data
+    g = gcd(int(rate), int(target_rate))
+    up, down = int(target_rate) // g, int(rate) // g
+    return signal.resample_poly(data, up, down, axis=0).astype(np.float32, copy=False)
+
+
+def decimate(data, rate, factor, edge):
+
+    """
+    Decimate a signal by factor, keeping [0, edge] Hz.
+    output:
+        signal at rate / factor, reduced_length(N, factor) samples (float32)
+    """
+
+    n = len(data)
+    pad = _padding(rate, factor, edge, factor, n)
+    x = _extend(to_float32(data), pad)
+    for q, taps in design_stages(rate, factor, edge):
+        x = signal.resample_poly(x, 1, q, axis=0, window=taps)
+    start = pad // factor
+    return x[start:start + reduced_length(n, factor)].astype(np.float32)
+
+
+def interpolate(data, rate, factor, edge, length=None):
+
+    """
+    Interpolate a decimated signal back to the original rate.
+    input:
+        data: signal at rate / factor
+        rate: original sample rate; factor, edge: as given to decimate
+        length: number of samples to return (default len(data) * factor)
+    output:
+        signal at rate (float32)
+    """
+
+    n = len(data)
+    pad = _padding(rate, factor, edge, 1, n)
+    x = _extend(to_float32(data), pad)
+    for q, taps in reversed(design_stages(rate, factor, edge)):
+        x = signal.resample_poly(x, q, 1, axis=0, window=taps)
+    start = pad * factor
+    length = n * factor if length is None else min(length, n * factor)
+    return x[start:start + length].astype(np.float32)
+
+
+def filter_reduced(data, rate, factor, edge, func):
+
+    """
+    Run a filter at rate / factor and bring the result back to the original rate.
+    input:
+        data: signal array
+        rate: sample rate in Hz
+        factor, edge: decimation factor and band kept (see reduction_factor)
+        func: called as func(x, reduced_rate) and returning the filtered x
+    output:
+        filtered signal at rate, same length as data (float32)
+    """
+
+    if factor == 1:
+        return to_float32(func(to_float32(data), rate))
+    reduced = func(decimate(data, rate, factor, edge), rate / factor)
+    return interpolate(reduced, rate, factor, edge, len(data))
+
+
+# === Streaming ===
+class _PolyphaseStage:
+
+    """
+    One block-by-block resampling stage by up/q or 1/down.
+    Output m is sum_j taps[j] * u[m * down + half - j], where u is the input
+    upsampled by up and zero outside the signal, as resample_poly computes it.
+    """
+
+    def __init__(self, taps, up=1, down=1):
+        self.taps = taps * up
+        self.up, self.down = up, down
+        self.half = (len(taps) - 1) // 2
+        self.pending = None   # inputs that later outputs still need
+        self.base = 0         # input index of pending[0]
+        self.received = 0     # inputs seen
+        self.produced = 0     # outputs produced
+
+    def process(self, block, final=False):
+        if self.pending is None:
+            lead = -(-self.half // self.up)
+            self.pending = np.zeros((lead,) + block.shape[1:])
+            self.base = -lead
+        self.pending = np.concatenate((self.pending, block))
+        self.received += len(block)
+        if final:
+            tail = np.zeros((-(-self.half // self.up) + 1,) + self.pending.shape[1:])
+            self.pending = np.concatenate((self.pending, tail))
+            end = -(-self.received * self.up // self.down)
+        else:
+            end = -(-(self.received * self.up - self.half) // self.down)
+        if end <= self.produced:
+            return self.pending[:0]
+
+        out = signal.upfirdn(self.taps, self.pending, self.up, self.down, axis=0)
+        first = (self.produced * self.down + self.half - self.base * self.up) // self.down
+        y = out[first:first + end - self.produced]
+        self.produced = end
+
+        # Keep what the next output needs, in whole multiples of down
+        need = (end * self.down - self.half) // self.up
+        drop = max(need - self.base, 0) // self.down * self.down
+        self.pending = self.pending[drop:]
+        self.base += drop
+        return y
+
+
+class _StageChain:
+
+    """
+    Polyphase stages run one after the other, with the odd extension of
+    the signal at both ends (see reach).
+    """
+
+    def __init__(self, stages, pad, up, down):
+        self.stages = stages
+        self.pad = pad            # extension on either side, in input samples
+        self.up, self.down = up, down
+        self.head = []            # the first blocks, until pad + 1 samples arrived
+        self.tail = None          # the last pad + 1 inputs, for the end extension
+        self.received = 0
+        self.skipped = 0          # outputs of the start extension dropped so far
+        self.emitted = 0
+
+    def _run(self, block, final=False):
+        for stage in self.stages:
+            block = stage.process(block, final)
+        return block
+
+    def _emit(self, y):
+        skip = min(self.pad * self.up // self.down - self.skipped, len(y))
+        self.skipped += skip
+        # Later outputs only come from the end extension
+        y = y[skip:][:max(self.output_length(self.received) - self.emitted, 0)]
+        self.emitted += len(y)
+        return y.astype(np.float32)
+
+    def _start(self):
+        head = np.concatenate(self.head)
+        self.head = None
+        left = odd_ext(head, self.pad)[0] if self.pad else head[:0]
+        return self._run(np.concatenate((left, head)))
+
+    def process(self, block):
+
+        """
+        Resample one block; returns the samples that are complete so far (float32).
+        """
+
+        block = np.asarray(block, dtype=np.float64)
+        self.received += len(block)
+        keep = self.pad + 1
+        self.tail = block[-keep:] if self.tail is None else np.concatenate((self.tail, block))[-keep:]
+        if self.head is not None:
+            self.head.append(block)
+            if self.received <= self.pad:
+                return np.zeros((0,) + block.shape[1:], dtype=np.float32)
+            y = self._start()
+        else:
+            y = self._run(block)
+        return self._emit(y)
+
+    def flush(self):
+
+        """
+        Return the remaining samples once the input has ended (float32).
+        """
+
+        if self.tail is None:
+            return np.zeros(0, dtype=np.float32)
+        y = []
+        if self.head is not None:
+            # Shorter than the extension: extend by what the signal allows
+            self.pad = min(self.pad, max(self.received - 1, 0) // self.down * self.down)
+            y.append(self._start())
+        right = odd_ext(self.tail, self.pad)[1] if self.pad else self.tail[:0]
+        y.append(self._run(right, final=True))
+        return self._emit(np.concatenate(y))
+
+
+class Decimator(_StageChain):
+
+    """
+    Block-by-block decimate: feed blocks to process(), then call flush().
+    input:
+        rate, factor, edge: as for decimate
+    """
+
+    def __init__(self, rate, factor, edge):
+        stages = [_PolyphaseStage(taps, down=q) for q, taps in design_stages(rate, factor, edge)]
+        super().__init__(stages, _padding(rate, factor, edge, factor), 1, factor)
+
+    def output_length(self, received):
+        return reduced_length(received, self.down)
+
+
+class Interpolator(_StageChain):
+
+    """
+    Block-by-block interpolate (without the length trim): feed blocks to process(), then call flush().
+    input:
+        rate, factor, edge: as for interpolate
+    """
+
+    def __init__(self, rate, factor, edge):
+        stages = [_PolyphaseStage(taps, up=q) for q, taps in reversed(design_stages(rate, factor, edge))]
+        super().__init__(stages, _padding(rate, factor, edge, 1), factor, 1)
+
+    def output_length(self, received):
+        return received * self.up
+
+
+def decimate_blocks(blocks, rate, factor, edge):
+
+    """
+    Decimate a stream of float blocks, e.g. for block-wise analysis at the reduced rate.
+    output:
+        yields the decimated signal in blocks (float32)
+    """
+
+    decimator = Decimator(rate, factor, edge)
+    for block in blocks:
+        y = decimator.process(block)
+        if len(y):
+            yield y
+    y = decimator.flush()
+    if len(y):
+        yield y
+
+
+def filter_to_wav(data, rate, output_filename, factor, edge, sos=None, taps=None, zero_phase=True,
+                  block_size=BLOCK_SIZE, engine='direct', dtype=np.int16, dither=True):
+
+    """
+    Decimate, filter and interpolate a signal block by block and write the result.
+    The decimated signal goes to a temporary memmap, a factor smaller than
+    the input; the filter runs over it with stream_filter.filter_blocks.
+    input:
+        data: array or memory-mapped view of the input signal, shape (N,) or (N, C)
+        rate: sample rate of the signal
+        output_filename: path of the WAV file to write
+        factor, edge: decimation factor and band kept (see reduction_factor)
+        sos, taps: filter designed for rate / factor
+        zero_phase, block_size, engine: see stream_filter.filter_blocks
+        dtype: output sample type, np.int16 or np.float32
+        dither: dither the int16 quantization (see sample_format.quantize)
+    output:
+        number of samples written
+    """
+
+    n = len(data)
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    scale = gain(data.dtype)
+
+    # Three phases of about the same cost: decimation, filtering, interpolation
+    def filter_progress(done, total):
+        checkpoint(n + n * done / total, 3 * n)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".f32")
+    os.close(fd)
+    reduced = None
+    try:
+        reduced = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(reduced_length(n, factor),) + data.shape[1:])
+        decimator = Decimator(rate, factor, edge)
+        pos = 0
+        for block in iter_blocks(data, block_size):
+            checkpoint(pos * factor, 3 * n)
+            y = decimator.process(block * scale)
+            reduced[pos:pos + len(y)] = y
+            pos += len(y)
+        y = decimator.flush()
+        reduced[pos:pos + len(y)] = y
+        pos += len(y)
+
+        interpolator = Interpolator(rate, factor, edge)
+        with WavWriter(output_filename, rate, channels, dtype) as writer:
+            def write(y):
+                y = y[:n - writer.frames]
+                if len(y):
+                    writer.write(quantize(y, dtype, dither))
+            for block in filter_blocks(reduced[:pos], sos, taps, zero_phase, max(block_size // factor, 1),
+                                       engine, progress=filter_progress):
+                checkpoint(2 * n + writer.frames, 3 * n)
+                write(interpolator.process(block))
+            write(interpolator.flush())
+    finally:
+        reduced = None  # release the mapping before removing the file
+        os.remove(tmp_path)
+    return n
@@ -0,0 +1,111 @@
+"""
+ring_buffer.py
+Preallocated single-producer / single-consumer ring buffer.
+
+One thread (e.g. a sounddevice callback) writes blocks and one other thread
+reads them. No lock is taken: the producer only advances the write counter
+and the consumer only advances the read counter, each after its copy is
+done, so the audio callback never waits. When the buffer is full the
+incoming frames are dropped and counted as an overrun instead of blocking.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+
+    """
+    Fixed-size frame buffer of shape (capacity, channels).
+    input:
+        capacity: number of frames held
+        channels: number of channels per frame
+        dtype: sample type
+    """
+
+    def __init__(self, capacity, channels=1, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = int(channels)
+        self._buf = np.zeros((self.capacity, self.channels), dtype=dtype)
+        self._written = 0  # total frames written, advanced by the producer only
+        self._read = 0     # total frames read, advanced by the consumer only
+        self.overruns = 0  # write calls that had to drop frames
+        self.dropped = 0   # frames dropped because the buffer was full
+
+    def available(self):
+
+        """
+        Number of frames ready to be read.
+        """
+
+        return self._written - self._read
+
+    def free(self):
+
+        """
+        Number of frames that can be written without dropping.
+        """
+
+        return self.capacity - (self._written - self._read)
+
+    # === Producer side ===
+    def write(self, block):
+
+        """
+        Append a block of frames, shape (N,) for one channel or (N, channels).
+        Frames that do not fit are dropped and counted.
+        output:
+            number of frames written
+        """
+
+        block = np.asarray(block)
+        if block.ndim == 1:
+            block = block[:, None]
+        n = min(len(block), self.free())
+        if n < len(block):
+            self.overruns += 1
+            self.dropped += len(block) - n
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = block[:first]
+        self._buf[:n - first] = block[first:n]
+        self._written += n  # publish only after the copy
+        return n
+
+    # === Consumer side ===
+    def read(self, frames=None, out=None):
+
+        """
+        Remove up to `frames` frames (all available when None).
+        input:
+            frames: maximum number of frames to read
+            out: optional preallocated (frames, channels) array to fill
+        output:
+            array of shape (n, channels), a view of out when out is given
+        """
+
+        n = self.available()
+        if frames is not None:
+            n = min(n, int(frames))
+        if out is None:
+            out = np.empty((n, self.channels), dtype=self._buf.dtype)
+        out = out[:n]
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._buf[start:start + first]
+        out[first:] = self._buf[:n - first]
+        self._read += n  # release the space only after the copy
+        return out
+
+    def skip(self, frames=None):
+
+        """
+        Discard up to `frames` frames (all available when None) without copying.
+        output:
+            number of frames discarded
+        """
+
+        n = self.available()
+        if frames is not None:
+            n = min(n, int(frames))
+        self._read += n
+        return n
@@ -0,0 +1,103 @@
+"""
+sample_format.py
+Conversions between stored PCM samples and the internal float32 representation.
+
+Processing works on float32 samples in [-1, 1]. Integer PCM is converted
+when it is read (to_float32, or gain for block-wise scaling of a mapped
+file), and quantize is the single clip/dither/round step applied where
+samples are written back to int16 (or clipped for float32 output).
+"""
+
+import numpy as np
+
+# === Constants ===
+FULL_SCALE = 32768  # int16 value of a sample of 1.0
+
+
+def gain(dtype):
+
+    """
+    Factor that maps samples of this type to [-1, 1] (1.0 for floats).
+    """
+
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return 1.0
+    return 1 / 2 ** (8 * dtype.itemsize - 1)
+
+
+def to_float32(data):
+
+    """
+    Convert PCM samples of any supported type to float32 in [-1, 1].
+    float32 input is returned unchanged, everything else is converted in one copy.
+    """
+
+    data = np.asarray(data)
+    if data.dtype.kind == 'f':
+        return data.astype(np.float32, copy=False)
+    if data.dtype == np.uint8:
+        x = data.astype(np.float32)
+        np.subtract(x, 128, out=x)
+        np.multiply(x, 1 / 128, out=x)
+        return x
+    if data.dtype.kind == 'i':
+        x = data.astype(np.float32)
+        np.multiply(x, gain(data.dtype), out=x)
+        return x
+    raise ValueError(f"Unsupported sample type: {data.dtype}")
+
+
+def to_int16(data):
+
+    """
+    Convert PCM samples of any supported type to int16 without dither.
+    Integers are rescaled by bit shifting; floats in [-1, 1] go through quantize.
+    int16 input is returned unchanged.
+    """
+
+    data = np.asarray(data)
+    if data.dtype == np.int16:
+        return data
+    if data.dtype == np.uint8:
+        return (data.astype(np.int16) - 128) << 8
+    if data.dtype.kind == 'i':
+        # scipy returns 24-bit samples left-justified in int32, so one shift covers both
+        return (data >> (8 * data.dtype.itemsize - 16)).astype(np.int16)
+    if data.dtype.kind == 'f':
+        return quantize(data, np.int16, dither=False)
+    raise ValueError(f"Unsupported sample type: {data.dtype}")
+
+
+def quantize(data, dtype=np.int16, dither=True, rng=None):
+
+    """
+    Final output stage: clip float samples to full scale and convert to dtype.
+    input:
+        data: float samples in [-1, 1]
+        dtype: np.int16, or np.float32 to only clip
+        dither: add triangular (TPDF) dither of +-1 LSB before rounding to int16
+        rng: numpy Generator for the dither noise
+    output:
+        samples of type dtype
+    """
+
+    if np.dtype(dtype) == np.float32:
+        return np.clip(data, -1.0, 1.0, dtype=np.float32)
+    x = np.multiply(data, FULL_SCALE, dtype=np.float32)  # the only float temporary
+    if dither:
+        rng = rng or np.random.default_rng()
+        x += rng.random(x.shape, dtype=np.float32)
+        x -= rng.random(x.shape, dtype=np.float32)
+    np.rint(x, out=x)
+    np.clip(x, -FULL_SCALE, FULL_SCALE - 1, out=x)
+    return x.astype(np.int16)
+
+
+def clipped(data):
+
+    """
+    True if any float sample is outside [-1, 1] and will be clipped by quantize.
+    """
+
+    return bool(len(data)) and (np.max(data) > 1.0 or np.min(data) < -1.0)
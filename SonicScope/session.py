@@ -0,0 +1,333 @@
+"""
+session.py
+Per-client sessions for the multi-user GUI server.
+
+Each browser client gets a Session: its own working directory (a temporary
+directory with its input.wav, a copy of config.INPUT_FILENAME to start with,
+and its output.wav), its own time and frequency figures (created on first
+use, so headless sessions never load plotly), and its own plot,
+recording, playback and live-stream state, so users of one server never see or
+overwrite each other's signals.
+
+Code that works on "the current signal" (signal_tools) asks current() for
+the session; call(session, func, ...) runs a function with a session bound,
+in whichever thread runs it. Outside the GUI the default session is used,
+with the files and figures from config.py.
+
+Memory is bounded per session: the decoded signals of a session's files may
+take at most SESSION_BYTES of the signal store (see signal_store.set_budget),
+and at most MAX_SESSIONS sessions are kept. Sessions idle for IDLE_TIMEOUT,
+or the least recently used idle one when the limit is reached, are closed:
+their streams are stopped, their store entries dropped and their working
+directory deleted.
+"""
+
+import atexit
+import contextvars
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import signal_store as store
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+MAX_SESSIONS = 24                  # sessions kept before idle ones are evicted
+SESSION_BYTES = 64 * 1024 * 1024   # decoded-signal budget per session
+IDLE_TIMEOUT = 30 * 60             # seconds without activity before a session is closed
+REAP_INTERVAL = 60                 # seconds between idle checks
+
+_lock = threading.Lock()
+_sessions = OrderedDict()  # session id -> Session, least recently used first
+_current = contextvars.ContextVar('session', default=None)
+_default = None
+
+
+class Session:
+
+    """
+    State of one client.
+    input:
+        session_id: client id
+        workdir: directory for the session's files, or None for a new temporary directory
+    """
+
+    def __init__(self, session_id, workdir=None):
+        self.id = session_id
+        self.temporary = workdir is None
+        self.workdir = workdir or tempfile.mkdtemp(prefix='sonicscope-')
+        self.input_filename = os.path.join(self.workdir, 'input.wav')
+        self.output_filename = os.path.join(self.workdir, 'output.wav')
+        self._figures = {}  # 'fig_time'/'fig_freq' -> go.Figure, created on first use
+        self.config_figures = False  # use config.py's figures (the default session)
+        self.time_traces = {}  # trace uid -> trace_lod.MinMaxPyramid
+        self.time_window = (None, None)  # visible time range in seconds
+        self.live_session = None  # realtime.LiveSession while the live mode is on
+        self.active_recorder = None  # recorder.Recorder while recording
+        self.player = None  # playback.Player while playing
+        self.last_used = time.monotonic()
+        self.closed = False
+        if self.temporary:
+            store.set_budget(self.workdir, SESSION_BYTES)
+            # New clients start from a copy of the shared input signal
+            if os.path.exists(config.INPUT_FILENAME):
+                shutil.copyfile(config.INPUT_FILENAME, self.input_filename)
+
+    def __repr__(self):
+        return f"Session({self.id!r}, {self.workdir!r})"
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def _figure(self, name):
+        figure = self._figures.get(name)
+        if figure is None:
+            if self.config_figures:
+                figure = getattr(config, name)
+            else:
+                import plotly.graph_objects as go  # headless sessions never load plotly
+                figure = go.Figure()
+            self._figures[name] = figure
+        return figure
+
+    @property
+    def fig_time(self):
+        return self._figure('fig_time')
+
+    @fig_time.setter
+    def fig_time(self, figure):
+        self._figures['fig_time'] = figure
+
+    @property
+    def fig_freq(self):
+        return self._figure('fig_freq')
+
+    @fig_freq.setter
+    def fig_freq(self, figure):
+        self._figures['fig_freq'] = figure
+
+    @property
+    def streaming(self):
+
+        """
+        True while the session records, plays or runs the live stream.
+        """
+
+        return (self.live_session is not None or self.active_recorder is not None
+                or (self.player is not None and self.player.active))
+
+    def memory(self):
+
+        """
+        Approximate memory held by the session.
+        output:
+            dict with the bytes of its stored signals and of its figure traces
+        """
+
+        figures = 0
+        for fig in self._figures.values():
+            for trace in fig.data:
+                for name in ('x', 'y', 'z'):
+                    value = getattr(trace, name, None)
+                    if hasattr(value, 'nbytes'):
+                        figures += value.nbytes
+                    elif value is not None:
+                        figures += 8 * len(value)
+        return {'signals': store.usage(self.workdir), 'figures': figures}
+
+    def close(self):
+
+        """
+        Stop the session's streams and delete its files and stored signals.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        for stream in (self.live_session, self.active_recorder, self.player):
+            try:
+                if stream is not None:
+                    stream.stop()
+            except Exception:
+                log.exception("Failed to stop a stream of session %s", self.id)
+        self.live_session = self.active_recorder = self.player = None
+        self.time_traces.clear()
+        for fig in self._figures.values():
+            fig.data = []
+        if self.temporary:
+            store.drop(self.workdir)
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        log.info("Session %s closed", self.id)
+
+
+def default():
+
+    """
+    Return the session used outside the GUI: config.py's files and figures.
+    """
+
+    global _default
+    with _lock:
+        if _default is None:
+            _default = Session(None, os.path.dirname(config.INPUT_FILENAME))
+            _default.input_filename = config.INPUT_FILENAME
+            _default.output_filename = config.OUTPUT_FILENAME
+            _default.config_figures = True
+        return _default
+
+
+def current():
+
+    """
+    Return the session bound to the running code (see call), or the default session.
+    """
+
+    return _current.get() or default()
+
+
+def call(session, func, *args, **kwargs):
+
+    """
+    Run func(*args, **kwargs) with session bound as the current session.
+    """
+
+    token = _current.set(session)
+    try:
+        session.touch()
+        return func(*args, **kwargs)
+    finally:
+        _current.reset(token)
+
+
+# === Registry ===
+def open_session(session_id, busy=None):
+
+    """
+    Return the session of a client, creating it (and evicting an idle one if
+    MAX_SESSIONS is reached) on first use.
+    input:
+        session_id: client id
+        busy: optional predicate, True for sessions that must not be evicted
+    output:
+        Session
+    """
+
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is not None:
+            _sessions.move_to_end(session_id)
+            session.touch()
+            return session
+    if len(_sessions) >= MAX_SESSIONS:
+        evict_idle(busy, keep=MAX_SESSIONS - 1)
+    session = Session(session_id)
+    with _lock:
+        _sessions[session_id] = session
+        if len(_sessions) > MAX_SESSIONS:
+            log.warning("%d active sessions, more than MAX_SESSIONS=%d", len(_sessions), MAX_SESSIONS)
+    return session
+
+
+def get(session_id):
+
+    """
+    Return an open session, or None.
+    """
+
+    with _lock:
+        return _sessions.get(session_id)
+
+
+def close_session(session_id):
+
+    """
+    Close a session and forget it.
+    """
+
+    with _lock:
+        session = _sessions.pop(session_id, None)
+    if session is not None:
+        session.close()
+
+
+def evict_idle(busy=None, keep=None, timeout=IDLE_TIMEOUT):
+
+    """
+    Close idle sessions, least recently used first.
+    A session is idle when busy(session) is false, or without a predicate
+    when it is not streaming.
+    input:
+        busy: optional predicate, e.g. connected clients or sessions with running jobs
+        keep: also close idle sessions until at most this many remain
+        timeout: close sessions unused for this many seconds
+    output:
+        number of sessions closed
+    """
+
+    now = time.monotonic()
+    with _lock:
+        candidates = [s for s in _sessions.values() if not (busy(s) if busy else s.streaming)]
+        count = len(_sessions)
+    candidates.sort(key=lambda s: s.last_used)
+    evicted = []
+    for session in candidates:
+        if now - session.last_used > timeout or (keep is not None and count > keep):
+            evicted.append(session)
+            count -= 1
+    for session in evicted:
+        close_session(session.id)
+    return len(evicted)
+
+
+def stats():
+
+    """
+    Return a dict with the number of sessions and the memory of each.
+    """
+
+    with _lock:
+        sessions = list(_sessions.values())
+    return {
+        "sessions": len(sessions),
+        "max_sessions": MAX_SESSIONS,
+        "session_bytes": SESSION_BYTES,
+        "memory": {s.id: s.memory() for s in sessions},
+    }
+
+
+def start_reaper(busy=None, interval=REAP_INTERVAL):
+
+    """
+    Start a daemon thread that closes idle sessions every interval seconds.
+    """
+
+    def reap():
+        while True:
+            time.sleep(interval)
+            try:
+                evict_idle(busy)
+            except Exception:
+                log.exception("Failed to evict idle sessions")
+
+    thread = threading.Thread(target=reap, daemon=True, name='session-reaper')
+    thread.start()
+    return thread
+
+
+@atexit.register
+def close_all():
+
+    """
+    Close every session (temporary directories are removed at exit).
+    """
+
+    with _lock:
+        ids = list(_sessions)
+    for session_id in ids:
+        close_session(session_id)
@@ -0,0 +1,67 @@
+"""
+signal_io.py
+Opening WAV files as arrays.
+
+open_signal is the one way the processing and plotting code reads a signal:
+16-bit PCM and 32-bit float files can be memory-mapped, everything else is
+decoded once and kept in the signal store (see signal_store.py). It only
+needs the core modules, so signal_processing, batch workers and tools can
+use it without loading the GUI, plotting or audio-device libraries.
+"""
+
+import logging
+import os
+import numpy as np
+
+import signal_store as store
+import wav_decode
+from instrumentation import span
+from wav_io import WavReader
+
+log = logging.getLogger(__name__)
+
+
+def open_signal(filename, mmap=False):
+    
+    """
+    Open the signal from the input file.
+    Files that are not 16-bit PCM or 32-bit float at an allowed rate are
+    converted in memory (see wav_decode.py); the source file is left untouched. Decoded signals are
+    kept in the signal store, so reopening an unchanged file does not decode
+    it again. All channels are kept.
+    input:
+        filename: path to the WAV file
+        mmap: if True, return a read-only memory-mapped view of a 16-bit PCM
+              or 32-bit float file instead of decoding it into memory
+    output:
+        rate, data with data of shape (N,) for mono or (N, C)
+    """
+    
+    try:
+        
+        log.debug("Opening signal from %s", filename)
+        if not os.path.exists(filename):
+            log.error("File '%s' does not exist.", filename)
+            return
+        info = wav_decode.inspect(filename)
+        if mmap and not (wav_decode.needs_conversion(info, np.int16)
+                         and wav_decode.needs_conversion(info, np.float32)):
+            reader = WavReader(filename)
+            return reader.rate, reader.data
+        cached = store.get(filename)
+        if cached is not None:
+            rate, data = cached
+        else:
+            key = store.signal_key(filename)
+            # Float sources stay float, everything else is stored compactly as int16
+            with span('decode') as stage:
+                rate, data = wav_decode.decode(filename, np.float32 if info.format == 'float' else np.int16)
+                stage.add(samples=data.size, nbytes=data.nbytes)
+            data = store.put(filename, rate, data, key)  # the shared, read-only view
+            log.debug("Decoded %s: %d Hz, %s", filename, rate, data.shape)
+
+        return rate, data
+    
+    except Exception:
+        log.exception("Failed to read input signal %s", filename)
+        return None, None
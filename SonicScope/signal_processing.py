@@ -1,154 +1,324 @@
 """
 signal_processing.py
 This module contains digital filtering operations (e.g., FFT, bandpass, etc.)
+Stages are timed with instrumentation spans (design, filter, fft, encode) and
+progress and failures are reported through the module's logger.
+Band-limited spectra run at a reduced sample rate when the band allows it
+(see resampling.py and config.REDUCED_RATE); filters can opt in with reduce=True.
+Only core DSP modules are imported: no plotting, GUI or audio-device libraries.
 """
 
-import signal_tools as tools
-import os
-from scipy.io.wavfile import write, read 
-import scipy.signal as signal
+from signal_io import open_signal
+import signal_store as store
+import filter_design as design
+import spectrum
+import dsp
+import delay
+import resampling
+from dsp import select_fir_engine
+from wav_io import WavWriter, iter_blocks
+from stream_filter import filter_to_wav
+from sample_format import to_float32, quantize, clipped
+from jobs import checkpoint
+from instrumentation import span
+import logging
+from collections import namedtuple
 import numpy as np
-import plotly.graph_objects as go
 import config
+import lazy
+
+wavfile = lazy.module('scipy.io.wavfile')  # imported on first use, see lazy.py
 
 
 INPUT_FILENAME, OUTPUT_FILENAME = config.INPUT_FILENAME, config.OUTPUT_FILENAME
-fig_time, fig_freq = config.fig_time, config.fig_freq
+log = logging.getLogger(__name__)
 # === Constants ===
+FirPlan = namedtuple('FirPlan', 'numtaps engine rate factor edge')
+
+
+def output_dtype():
+    
+    """
+    Sample type of written files: float32 if config.OUTPUT_FLOAT32, else int16.
+    """
+    
+    return np.float32 if config.OUTPUT_FLOAT32 else np.int16
+
+def reduction(rate, edge, length, reduce=None):
+
+    """
+    Decimation factor to filter or analyse a band at, see resampling.reduction_factor.
+    input:
+        rate: sample rate in Hz
+        edge: highest frequency that matters, in Hz, or None for the full band
+        length: signal length in samples
+        reduce: allow a reduced rate (None follows config.REDUCED_RATE)
+    output:
+        int factor, 1 for the full rate
+    """
+
+    if not (config.REDUCED_RATE if reduce is None else reduce):
+        return 1
+    return resampling.reduction_factor(rate, edge, length)
+
+def write_output(output_filename, rate, data):
+    
+    """
+    Quantize a float signal once and write it, see sample_format.quantize.
+    """
+    
+    with span('encode', samples=data.size) as stage:
+        out = quantize(data, output_dtype(), dither=config.DITHER)
+        wavfile.write(output_filename, rate, out)
+        stage.add(nbytes=out.nbytes)
+    store.invalidate(output_filename)
 
         
-def scaling(scale):
+def scaling(scale, input_filename=INPUT_FILENAME, output_filename=OUTPUT_FILENAME):
     
     """
     Apply a noise filter to the audio signal.
+    The input is processed block by block from a memory-mapped view, so
+    memory use does not grow with the file length. Each block is scaled in
+    float32 and clipped/quantized once when it is written.
     input:
         scale: scaling factor to apply to the audio signal
+        input_filename, output_filename: files to read and write
     output:
-        None, but writes the scaled signal to OUTPUT_FILENAME
+        None, but writes the scaled signal to output_filename
     """
     
     try:
-        rate, data = tools.open_signal(INPUT_FILENAME)
-        scaled_data = (data * float(scale)).astype(np.int16)  # Scale the data
-        if np.max(scaled_data) > 32767 or np.min(scaled_data) < -32768:
-            scaled_data = np.clip(scaled_data, -32768, 32767)
-            print("Clipping applied to scaled data.")
-        
-        scaled_data = np.ascontiguousarray(scaled_data)
-        write(OUTPUT_FILENAME, rate, scaled_data)
-        print("Scaling was applied.")
+        rate, data = open_signal(input_filename, mmap=True)
+        was_clipped = False
+        channels = 1 if data.ndim == 1 else data.shape[1]
+        with span('scale', samples=data.size, nbytes=data.nbytes), \
+                WavWriter(output_filename, rate, channels, output_dtype()) as writer:
+            for block in iter_blocks(data):
+                checkpoint(writer.frames, len(data))
+                scaled = dsp.scale_signal(block, scale)  # Scale the data
+                was_clipped = was_clipped or clipped(scaled)
+                writer.write(quantize(scaled, writer.dtype, dither=config.DITHER))
+        store.invalidate(output_filename)
+        if was_clipped:
+            log.warning("Clipping applied to scaled data.")
+        log.info("Scaling was applied.")
         
-    except Exception as e:
-        print(f"[ERROR] Failed to apply noise scaling: {e}")
+    except Exception:
+        log.exception("Failed to apply noise scaling")
 
-def time_shift(shift_ms):
+def time_shift(shift_ms, input_filename=INPUT_FILENAME, output_filename=OUTPUT_FILENAME):
     
-    #TODO: fix time shifting and add true phase shifting using fft
     """
     Apply a time shifting shift to the audio signal.
+    The delay is linear (zeros are shifted in, nothing wraps around) and is
+    written block by block from a memory-mapped view, see delay.stream.
+    Whole-sample delays copy the samples unchanged unless the output sample
+    type differs; fractional delays go through a windowed-sinc filter.
     input:
-        shift_ms: time shift in milliseconds
+        shift_ms: time shift in milliseconds, negative to advance
+        input_filename, output_filename: files to read and write
     output:
-        None, but writes the shifted signal to OUTPUT_FILENAME
+        None, but writes the shifted signal to output_filename
     """
     try:
-        rate, data = tools.open_signal(INPUT_FILENAME)
-        time_shifted_data = np.roll(data, int(shift_ms * rate / 1000))
-        write(OUTPUT_FILENAME, rate, time_shifted_data)
-        print("Phase time shifting was applied.")
+        rate, data = open_signal(input_filename, mmap=True)
+        samples = delay.delay_samples(shift_ms, rate)
+        channels = 1 if data.ndim == 1 else data.shape[1]
+        dtype = np.dtype(output_dtype())
+
+        def convert(block):
+            if block.dtype == dtype:
+                return block
+            return quantize(to_float32(block), dtype, dither=config.DITHER)
+
+        with span('shift', samples=data.size, nbytes=data.nbytes), \
+                WavWriter(output_filename, rate, channels, dtype) as writer:
+            for block in delay.stream(data, samples):
+                checkpoint(writer.frames, len(data))
+                writer.write(convert(block))
+        store.invalidate(output_filename)
+        log.info("Phase time shifting was applied.")
         
-    except Exception as e:
-        print(f"[ERROR] Failed to apply noise filter: {e}")
+    except Exception:
+        log.exception("Failed to apply time shift")
+
+def spectrum_of_file(filename, window=None, nfft=None, max_freq=None, reduce=None):
+
+    """
+    Return the spectrum of a file, computing it only if it is not cached.
+    input:
+        filename: path to the audio file
+        window: window name (e.g. 'hamming') or None
+        nfft: FFT length (at the analysis rate), or None for the next fast length
+        max_freq: highest frequency of interest in Hz, or None for the whole band; the
+                  spectrum then stops there and is computed at a reduced rate if it allows
+        reduce: allow the reduced rate (None follows config.REDUCED_RATE)
+    output:
+        spectrum.Spectrum with freq, magnitude and magnitude_db
+    """
 
-def fft(input_filename):
+    key = store.signal_key(filename)
+    if key is not None and max_freq is not None:
+        key += (float(max_freq), reduce)
+    result = spectrum.get(key, window, nfft)
+    if result is None:
+        rate, data = open_signal(filename, mmap=True)
+        factor = reduction(rate, max_freq, len(data), reduce)
+        with span('fft', samples=data.size, nbytes=data.nbytes):
+            if factor > 1:
+                blocks = (to_float32(block) for block in iter_blocks(data))
+                reduced = np.concatenate(list(resampling.decimate_blocks(blocks, rate, factor, max_freq)))
+                result = spectrum.compute(reduced, rate / factor, window, nfft)
+                # The transform summed N / factor samples: scale back to full-rate magnitudes
+                result.magnitude *= np.float32(factor)
+            else:
+                result = spectrum.compute(data, rate, window, nfft)
+            if max_freq is not None:
+                end = np.searchsorted(result.freq, max_freq, side='right')
+                result = spectrum.Spectrum(result.freq[:end], result.magnitude[:end])
+        spectrum.put(key, result, window, nfft)
+    return result
+
+def fft(input_filename, window=None, max_freq=None):
     
     """
     Apply Fast Fourier Transform (FFT) to input file audio signal.
     input:
-        None
+        input_filename: path to the input audio file
+        window: window name (e.g. 'hamming') or None
+        max_freq: highest frequency in Hz, or None (see spectrum_of_file)
     output:
         freq: numpy array of frequencies
-        magnitude: numpy array of magnitudes corresponding to the frequencies
+        magnitude: numpy array of magnitudes (dB) corresponding to the frequencies,
+                   shape (F,) or (F, C) for multi-channel input
     """
     
     try:
-        print("Applying FFT...")
-        rate, data = tools.open_signal(input_filename)
-        fft_data = np.fft.fft(data)
-        freq = np.fft.fftfreq(len(data), d=1 / rate)
-        
-        pos_mask = freq >= 0  # Only keep positive frequencies
-        freq = freq[pos_mask]
-        magnitude = np.abs(fft_data[pos_mask])
-        magnitude_db = 20 * np.log10(magnitude)  # Convert to dB scale
-        #magnitude_db = np.clip(magnitude_db, -100, 0)  # Clip to avoid log(0)
-        
-        print("FFT computed.")
-        return freq, magnitude_db
+        log.debug("Applying FFT to %s", input_filename)
+        result = spectrum_of_file(input_filename, window, max_freq=max_freq)
+        return result.freq, result.magnitude_db
     
-    except Exception as e:
-        print(f"[ERROR] Failed to compute FFT: {e}")
+    except Exception:
+        log.exception("Failed to compute FFT")
         return None, None
 
-def apply_filter(data, rate, cutoff, btype, order=2):
+def apply_filter(data, rate, cutoff, btype, order=2, output_filename=OUTPUT_FILENAME, reduce=False):
 
     """
     Apply a Butterworth filter to the input signal.
     input:
-        data: numpy array of audio signal data
+        data: numpy array of audio signal data, shape (N,) or (N, C)
         rate: sample rate of the audio signal
         cutoff: cutoff frequency or frequencies for the filter
         btype: type of filter ('lowpass', 'highpass', 'bandpass', 'bandstop')
         order: order of the filter
+        output_filename: file the filtered signal is written to (None to skip)
+        reduce: filter at a reduced rate when the band allows it (None follows config.REDUCED_RATE);
+                off by default, since a few biquad sections cost about as much as the resampling
     output:
-        filtered_data: numpy array of filtered audio signal data
+        filtered_data: filtered signal, float32 in [-1, 1]
     """
     try:
         nyquist = 0.5 * rate
         normal_cutoff = np.array(cutoff) / nyquist
-
-        print(f"Normalized cutoff: {normal_cutoff}")
-        print(f"Applying {btype} filter with cutoff: {cutoff}, order: {order}, rate: {rate}")
-        print(f"[DEBUG] btype={btype}, cutoff={cutoff}, normal_cutoff={normal_cutoff}")
-
-        #b, a = signal.butter(order, normal_cutoff, btype=btype, analog=False)
-        
+        log.info("Applying %s filter with cutoff %s (normalized %s), order %d, rate %d",
+                 btype, cutoff, normal_cutoff, order, rate)
         if np.any(normal_cutoff <= 0) or np.any(normal_cutoff >= 1):
             raise ValueError(f"Invalid normalized cutoff: {normal_cutoff}")
 
-        # Use second-order sections for numerical stability
-        sos = signal.butter(order, normal_cutoff, btype=btype, analog=False, output='sos')
-        filtered_data = signal.sosfiltfilt(sos, data)
+        edge = resampling.butter_band_edge(cutoff, btype, order)
+        factor = reduction(rate, edge, len(data), reduce)
 
-        if np.isnan(filtered_data).any():
-            raise ValueError("Filtered data contains NaNs")
-        
-        # Debugging information
-        #print(f"[DEBUG] Filter coefficients - b: {b}, a: {a}")
-        print(f"[DEBUG] sos coefficients: {sos}")
-        print(f"[DEBUG] Data before filtering: {data[:10]}... (first 10 samples)")        
-        print(f"[DEBUG] Data type after conversion: {data.dtype}")
-        #filtered_data = signal.filtfilt(b, a, data)
-        print(f'[DEBUG] Filtered data: {filtered_data[:10]}... (first 10 samples)')
-        
-        '''
-        # Normalize to int16 range
-        max_val = np.max(np.abs(filtered_data))
-        if max_val > 0:
-            filtered_data = (filtered_data / max_val) * 32767
-        '''
-        
-        print(f"[DEBUG] Filtered data max value: {np.max(filtered_data)}, min value: {np.min(filtered_data)}")
+        # Use second-order sections for numerical stability
+        with span('design'):
+            sos = design.butter_sos(order, cutoff, btype, rate / factor)
+        with span('filter', samples=data.size, nbytes=data.nbytes):
+            if factor > 1:
+                log.info("Filtering at %g Hz (1/%d of the rate)", rate / factor, factor)
+                filtered_data = resampling.filter_reduced(
+                    data, rate, factor, edge,
+                    lambda x, reduced_rate: dsp.butter_filter(x, reduced_rate, cutoff, btype, order, sos=sos))
+            else:
+                filtered_data = dsp.butter_filter(data, rate, cutoff, btype, order, sos=sos)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("sos coefficients: %s", sos)
+            log.debug("Filtered %s samples of %s, range [%g, %g]", data.shape, data.dtype,
+                      np.min(filtered_data), np.max(filtered_data))
 
-        write(OUTPUT_FILENAME, rate, filtered_data.astype(np.int16))
+        if output_filename is not None:
+            write_output(output_filename, rate, filtered_data)
 
         return filtered_data
     
-    except Exception as e:
-        print(f"[ERROR] Failed to apply filter: {e}")
+    except Exception:
+        log.exception("Failed to apply filter")
+        return None
+    
+def apply_filter_stream(input_filename, cutoff, btype, order=2, zero_phase=True,
+                        output_filename=OUTPUT_FILENAME, reduce=False):
+
+    """
+    Apply a Butterworth filter to an input file block by block.
+    The output is written incrementally to output_filename, so memory use
+    stays bounded by the block size regardless of the file length.
+    input:
+        input_filename: path to the input audio file
+        cutoff: cutoff frequency or frequencies for the filter
+        btype: type of filter ('lowpass', 'highpass', 'bandpass', 'bandstop')
+        order: order of the filter
+        zero_phase: forward-backward filtering (same result as apply_filter)
+        output_filename: file the filtered signal is written to
+        reduce: filter at a reduced rate when the band allows it, see apply_filter
+    output:
+        number of samples written, or None on failure
+    """
+    try:
+        rate, data = open_signal(input_filename, mmap=True)
+        edge = resampling.butter_band_edge(cutoff, btype, order)
+        factor = reduction(rate, edge, len(data), reduce)
+        with span('design'):
+            sos = design.butter_sos(order, cutoff, btype, rate / factor)
+        with span('filter', samples=data.size, nbytes=data.nbytes):
+            if factor > 1:
+                log.info("Filtering at %g Hz (1/%d of the rate)", rate / factor, factor)
+                n = resampling.filter_to_wav(data, rate, output_filename, factor, edge, sos=sos,
+                                             zero_phase=zero_phase, dtype=output_dtype(), dither=config.DITHER)
+            else:
+                n = filter_to_wav(data, rate, output_filename, sos=sos, zero_phase=zero_phase,
+                                  dtype=output_dtype(), dither=config.DITHER)
+        store.invalidate(output_filename)
+        log.info("Streaming %s filter applied to %d samples.", btype, n)
+        return n
+
+    except Exception:
+        log.exception("Failed to apply streaming filter")
         return None
     
-def FIR(input_filename, cutoff, btype, order=2):
+def fir_plan(rate, length, cutoff, btype, numtaps=101, engine='auto', reduce=False):
+
+    """
+    Taps, engine and sample rate an FIR filter runs with (see FIR).
+    input:
+        rate: sample rate in Hz
+        length: signal length in samples
+        cutoff, btype, numtaps, engine, reduce: as for FIR
+    output:
+        FirPlan(numtaps, engine, rate, factor, edge): the filter runs at rate = rate / factor
+        with numtaps taps; edge is the band kept by the decimation
+    """
+
+    numtaps = dsp.fir_numtaps(numtaps, btype)
+    edge = resampling.fir_band_edge(cutoff, btype, numtaps, rate)
+    factor = reduction(rate, edge, length, reduce)
+    if factor > 1:
+        numtaps = dsp.fir_numtaps(max(-(-numtaps // factor), 3), btype)
+    if engine == 'auto':
+        engine = select_fir_engine(numtaps, length // factor)
+    return FirPlan(numtaps, engine, rate / factor, factor, edge)
+
+def FIR(input_filename, cutoff, btype, numtaps=101, stream=False, engine='auto',
+        output_filename=OUTPUT_FILENAME, reduce=False):
     
     """
     Apply a FIR filter to the input file audio signal.
@@ -156,21 +326,45 @@ def FIR(input_filename, cutoff, btype, order=2):
         input_filename: path to the input audio file
         cutoff: cutoff frequency or frequencies for the filter
         btype: type of filter ('lowpass', 'highpass', 'bandpass', 'bandstop')
+        numtaps: number of filter taps (bumped to odd for highpass/bandstop)
+        stream: filter block by block straight to output_filename
+        engine: 'direct', 'fft' or 'auto' (see select_fir_engine)
+        output_filename: file the filtered signal is written to
+        reduce: filter at a reduced rate when the band allows it (None follows config.REDUCED_RATE);
+                the filter then keeps its transition width in Hz with numtaps / factor taps.
+                Off by default: the result is a different filter, about -30 to -50 dB
+                (relative RMS) from the full-rate one; see fir_plan for what actually runs
     output:
-        filtered_data: numpy array of filtered audio signal data
+        filtered_data: filtered signal, float32 in [-1, 1]
+                       (number of samples written when stream is True)
     """
     try:
-        rate, data = tools.open_signal(input_filename)
-        nyquist = 0.5 * rate
-        normal_cutoff = np.array(cutoff) / nyquist
+        rate, data = open_signal(input_filename, mmap=True)
+
+        numtaps, engine, _, factor, edge = fir_plan(rate, len(data), cutoff, btype, numtaps, engine, reduce)
+        log.info("FIR %s: %d taps, %s engine, at %g Hz", btype, numtaps, engine, rate / factor)
 
         # Design the FIR filter
-        taps = signal.firwin(numtaps=101, cutoff=normal_cutoff, window='hamming', pass_zero=btype)
-        filtered_data = signal.filtfilt(taps, 1.0, data)
+        with span('design'):
+            taps = design.fir_taps(numtaps, cutoff, btype, rate / factor, window='hamming')
+        if stream:
+            with span('filter', samples=data.size, nbytes=data.nbytes):
+                if factor > 1:
+                    n = resampling.filter_to_wav(data, rate, output_filename, factor, edge, taps=taps,
+                                                 engine=engine, dtype=output_dtype(), dither=config.DITHER)
+                else:
+                    n = filter_to_wav(data, rate, output_filename, taps=taps, engine=engine,
+                                      dtype=output_dtype(), dither=config.DITHER)
+            store.invalidate(output_filename)
+            return n
+        with span('filter', samples=data.size, nbytes=data.nbytes):
+            filtered_data = resampling.filter_reduced(
+                data, rate, factor, edge,
+                lambda x, reduced_rate: dsp.fir_filter(x, reduced_rate, cutoff, btype, engine=engine, taps=taps))
 
-        write(OUTPUT_FILENAME, rate, filtered_data.astype(np.int16))
+        write_output(output_filename, rate, filtered_data)
         return filtered_data
 
-    except Exception as e:
-        print(f"[ERROR] Failed to apply FIR filter: {e}")
-        return None
\ No newline at end of file
+    except Exception:
+        log.exception("Failed to apply FIR filter")
+        return None
@@ -0,0 +1,202 @@
+"""
+signal_store.py
+Process-wide in-memory store of decoded signals.
+
+Decoded WAV data is kept keyed by (path, mtime, size) so repeated operations on
+the same file skip the decode. Take the key before decoding and pass it to
+put, so a file rewritten meanwhile is not stored under its new key. Entries are evicted least-recently-used once the
+total size of the stored arrays exceeds the byte budget.
+A directory can get its own, smaller budget (set_budget): signals of files in
+it then also evict each other once they exceed it, so one GUI session cannot
+take the whole store.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# === Constants ===
+MAX_BYTES = 256 * 1024 * 1024  # 256 MB of decoded samples
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (rate, data)
+_total_bytes = 0
+_budgets = {}  # directory -> byte budget for the files in it
+hits = 0
+misses = 0
+
+
+def signal_key(filename):
+
+    """
+    Build the store key for a file.
+    input:
+        filename: path to the WAV file
+    output:
+        (absolute path, mtime in ns, size in bytes), or None if the file does not exist
+    """
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return os.path.abspath(filename), st.st_mtime_ns, st.st_size
+
+
+def get(filename):
+
+    """
+    Return the stored (rate, data) for a file, or None if it is not stored
+    or the file changed on disk since it was decoded.
+    """
+
+    global hits, misses
+    key = signal_key(filename)
+    with _lock:
+        entry = _entries.get(key) if key is not None else None
+        if entry is None:
+            misses += 1
+            return None
+        _entries.move_to_end(key)
+        hits += 1
+        return entry
+
+
+def put(filename, rate, data, key=None):
+
+    """
+    Store the decoded (rate, data) for a file.
+    A read-only view of the array is stored, since it is shared between
+    callers; the caller's array keeps its flags.
+    input:
+        key: signal_key(filename) taken before decoding; nothing is stored if the
+             file changed since (None: the file is assumed unchanged)
+    output:
+        the stored read-only view, to share instead of data (data itself when not stored)
+    """
+
+    global _total_bytes
+    current = signal_key(filename)
+    if current is None or data is None or (key is not None and key != current):
+        return data
+    key = current
+    directory = _budget_directory(key[0])
+    budget = _budgets.get(directory, MAX_BYTES)
+    if data.nbytes > min(budget, MAX_BYTES):
+        return data
+    data = data.view()
+    data.setflags(write=False)
+    with _lock:
+        _drop_path(key[0])
+        _entries[key] = (rate, data)
+        _total_bytes += data.nbytes
+        if directory is not None:
+            # Oldest signals of the same directory go first
+            while _usage(directory) > budget:
+                _drop_key(next(k for k in _entries if _inside(k[0], directory)))
+        while _total_bytes > MAX_BYTES and _entries:
+            _, (_, old) = _entries.popitem(last=False)
+            _total_bytes -= old.nbytes
+    return data
+
+
+def invalidate(filename):
+
+    """
+    Drop every stored version of a file.
+    Call this whenever the file is (re)written.
+    """
+
+    with _lock:
+        _drop_path(os.path.abspath(filename))
+
+
+def set_budget(directory, max_bytes):
+
+    """
+    Limit the bytes stored for the files in a directory.
+    """
+
+    with _lock:
+        _budgets[os.path.abspath(directory)] = max_bytes
+
+
+def usage(directory=None):
+
+    """
+    Return the bytes stored for the files in a directory, or in total.
+    """
+
+    with _lock:
+        if directory is None:
+            return _total_bytes
+        return _usage(os.path.abspath(directory))
+
+
+def drop(directory):
+
+    """
+    Drop every stored signal of the files in a directory, and its budget.
+    """
+
+    directory = os.path.abspath(directory)
+    with _lock:
+        for key in [k for k in _entries if _inside(k[0], directory)]:
+            _drop_key(key)
+        _budgets.pop(directory, None)
+
+
+def clear():
+
+    """
+    Drop all stored signals and reset the counters.
+    """
+
+    global _total_bytes, hits, misses
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+        hits = misses = 0
+
+
+def stats():
+
+    """
+    Return a dict with the number of entries, stored bytes, hits and misses.
+    """
+
+    with _lock:
+        return {
+            "entries": len(_entries),
+            "bytes": _total_bytes,
+            "max_bytes": MAX_BYTES,
+            "hits": hits,
+            "misses": misses,
+        }
+
+
+def _drop_path(path):
+    # Caller must hold _lock
+    for key in [k for k in _entries if k[0] == path]:
+        _drop_key(key)
+
+
+def _drop_key(key):
+    # Caller must hold _lock
+    global _total_bytes
+    _, data = _entries.pop(key)
+    _total_bytes -= data.nbytes
+
+
+def _inside(path, directory):
+    return os.path.dirname(path) == directory
+
+
+def _usage(directory):
+    # Caller must hold _lock
+    return sum(data.nbytes for k, (_, data) in _entries.items() if _inside(k[0], directory))
+
+
+def _budget_directory(path):
+    directory = os.path.dirname(path)
+    return directory if directory in _budgets else None
@@ -1,130 +1,217 @@
 """
 signal_tools.py
 Utility functions for recording, playing, loading, and manipulating signals.
+The functions work on the files, figures and streams of the current session
+(see session.py): the client's own in the GUI, config.py's otherwise.
+Decoding and plot building are timed with instrumentation spans; progress
+and failures go to the module's logger. plotly is imported by the plotting
+functions on first use and sounddevice by the streams that open a device,
+so importing this module stays cheap for headless code.
 """
 
-import sounddevice as sd
-from scipy.io.wavfile import write, read
 import numpy as np
 import os
-import plotly.graph_objects as go
-from pydub import AudioSegment
 import config
 import signal_processing as sp
+import signal_store as store
+from wav_io import iter_blocks
+from signal_io import open_signal  # re-exported: tools.open_signal
+import wav_decode
+from sample_format import gain, quantize, to_float32
+import spectral_analysis
+import resampling
+import trace_lod
+import realtime
+import playback
+import recorder
+import session
+import itertools
+import logging
+import time
+from instrumentation import span
+import lazy
+
+wavfile = lazy.module('scipy.io.wavfile')  # imported on first use, see lazy.py
 # === Imports ===
 
 # === Constants ===
 SAMPLE_RATE = 44100  # in Hz
 CHANNELS = 2
 DURATION = 5  # seconds
-INPUT_FILENAME = config.INPUT_FILENAME
-OUTPUT_FILENAME = config.OUTPUT_FILENAME
-fig_time = config.fig_time
-fig_freq = config.fig_freq
+_trace_ids = itertools.count()
+log = logging.getLogger(__name__)
 
-# === Open Signal === 
-def open_signal(filename):
-    
+def save_signal(data, rate):
+   
     """
-    Open the signal from the input file.
+    Save the signal data to the output file.
+    Float data in [-1, 1] is quantized once here; integer PCM is written as is.
     """
     
     try:
+        output_filename = session.current().output_filename
+        log.info("Saving signal to %s", output_filename)
+        os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+        with span('encode', samples=data.size, nbytes=data.nbytes):
+            if data.dtype.kind == 'f':
+                data = quantize(data, sp.output_dtype(), dither=config.DITHER)
+            wavfile.write(output_filename, rate, data)
+        store.invalidate(output_filename)
         
-        print(f"Opening signal from {filename}")
-        if not os.path.exists(filename):
-            print(f"[ERROR] File '{filename}' does not exist.")
-            return
-        rate, data = read(convert_to_pcm16(filename))
-        print("Sample rate:", rate)
-        print(f"Original length: {len(data)}")  # should be 220500
-
-        if len(data.shape) > 1:
-            data = data[:, 0]  # Use only the first channel if stere
-                    
-        return rate, data
+    except Exception:
+        log.exception("Failed to save output signal")
+        
+# === Signal Input ===
+def start_recording(source=None):
     
-    except Exception as e:
-        print(f"[ERROR] Failed to read input signal (input.wav): {e}")
-        return None, None
-
-def save_signal(data, rate):
-   
     """
-    Save the signal data to the output file.
+    Start recording from the microphone to the input file.
+    The recording runs until stop_recording, at constant memory.
+    input:
+        source: array or WAV path recorded instead of the microphone
     """
     
+    s = session.current()
     try:
-        print(f"Saving signal to {OUTPUT_FILENAME}")
-        os.makedirs(os.path.dirname(OUTPUT_FILENAME), exist_ok=True)
-        write(OUTPUT_FILENAME, rate, data.astype(np.int16))
-        print("Signal saved successfully.")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to save output signal: {e}")
+        if s.active_recorder is not None:
+            return
+        log.info("Recording...")
+        os.makedirs(os.path.dirname(s.input_filename), exist_ok=True)
+        s.active_recorder = recorder.Recorder(s.input_filename, SAMPLE_RATE, CHANNELS, source=source)
+        s.active_recorder.start()
         
-def convert_to_pcm16(input_path: str) -> str:
+    except Exception:
+        log.exception("Failed to record audio")
+        s.active_recorder = None
+
+def stop_recording():
     
     """
-    Convert any WAV file to PCM 16-bit format using pydub.
-    Returns the path to the converted file (or original if already PCM).
+    Stop the recording and finalize the input file.
+    output:
+        number of frames recorded, or None if nothing was recording
     """
     
-    sound = AudioSegment.from_file(input_path, format="wav")
+    s = session.current()
+    try:
+        if s.active_recorder is None:
+            return None
+        frames = s.active_recorder.stop()
+        store.invalidate(s.input_filename)
+        if s.active_recorder.overruns:
+            log.warning("%d overruns while recording", s.active_recorder.overruns)
+        log.info("Recording finished. Saved to %s", s.input_filename)
+        return frames
+    
+    except Exception:
+        log.exception("Failed to stop recording")
+        return None
+    
+    finally:
+        s.active_recorder = None
 
-    # Check if already 16-bit PCM
-    if sound.sample_width == 2 and sound.frame_rate in [8000, 16000, 44100, 48000]:
-        return input_path
+def record_audio(duration=DURATION):
+    
+    """
+    Record audio from the microphone for a fixed duration and save it to a WAV file.
+    """
+    
+    start_recording()
+    time.sleep(duration)
+    return stop_recording()
 
-    # Export as PCM 16-bit
-    print(f"Converting {input_path} to PCM 16-bit format")
-    sound = sound.set_sample_width(2)  # 2 bytes = 16 bits
-    sound.export(input_path, format="wav")
 
-    return input_path
+# === Playback ===
+def start_playback(filename, loop=False, null=False):
+    
+    """
+    Start streaming a WAV file to the speakers and return at once.
+    The file is memory-mapped and prefetched block by block (see playback.py),
+    so long files start immediately and play at constant memory.
+    input:
+        filename: path to the WAV file
+        loop: start over at the end of the file until stopped
+        null: play to a null device instead of the speakers
+    output:
+        playback.Player, or None if the file could not be opened
+    """
+    
+    s = session.current()
+    try:
+        stop_playback()
+        if not os.path.exists(filename):
+            log.error("File '%s' does not exist.", filename)
+            return None
+        log.info("Playing signal from %s", filename)
+        s.player = playback.Player(filename, loop=loop, null=null)
+        s.player.start()
+        return s.player
+        
+    except Exception:
+        log.exception("Failed to play audio")
+        s.player = None
+        return None
 
-# === Signal Input ===
-def record_audio():
+def stop_playback():
     
     """
-    Record audio from the microphone and save it to a WAV file.
+    Stop the playback, if one is running.
     """
     
+    s = session.current()
     try:
-        print("Recording...")
-        recording = sd.rec(
-            int(DURATION * SAMPLE_RATE),
-            samplerate=SAMPLE_RATE,
-            channels=CHANNELS,
-            dtype='int16'
-        )
-        sd.wait()
-        os.makedirs(os.path.dirname(INPUT_FILENAME), exist_ok=True)
-        write(INPUT_FILENAME, SAMPLE_RATE, recording)
-        print(f"Recording finished. Saved to {INPUT_FILENAME}")
-    
-    except Exception as e:
-        print(f"[ERROR] Failed to record audio: {e}")
+        if s.player is not None:
+            s.player.stop()
+        s.player = None
+        
+    except Exception:
+        log.exception("Failed to stop playback")
+
+def seek_playback(seconds):
+    
+    """
+    Move the running playback to a position in seconds.
+    """
+    
+    s = session.current()
+    if s.player is not None:
+        s.player.seek(seconds)
 
+def playback_status():
+    
+    """
+    State of the session's playback.
+    output:
+        dict with active, position, duration, loop and underruns, or None if nothing plays
+    """
+    
+    player = session.current().player
+    if player is None or player.data is None:
+        return None
+    return {
+        "active": player.active,
+        "position": player.position,
+        "duration": player.duration,
+        "loop": player.loop,
+        "underruns": player.underruns,
+    }
 
 def play_signal(filename):
     
     """
-    Play the recorded signal from the WAV file.
+    Play the signal from the WAV file and wait until it ends.
     input: filename - path to the WAV file
     output: plays the audio signal
     """
     
-    try:
-        rate, data = open_signal(filename)
-        print(f"Playing signal from {filename}")
-        print(f"Data shape: {data.shape}, dtype: {data.dtype}, Sample rate: {rate}")
-        sd.play(data, rate)
-        sd.wait()
-        print("Playback finished.")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to play audio: {e}")
+    s = session.current()
+    player = start_playback(filename)
+    if player is None:
+        return
+    player.wait()
+    if s.player is player:  # not replaced by a newer playback meanwhile
+        stop_playback()
+    log.info("Playback finished.")
         
         
 def upload_signal(e):
@@ -133,15 +220,90 @@ def upload_signal(e):
     Upload a signal file from the user.
     """
     
-    print(f"Uploading {e.name}...")
-    with open(INPUT_FILENAME, 'wb') as f:
+    input_filename = session.current().input_filename
+    log.info("Uploading %s", e.name)
+    with open(input_filename, 'wb') as f:
         f.write(e.content.read())
+    store.invalidate(input_filename)
 
-    rate, data = read(convert_to_pcm16(INPUT_FILENAME))
+    key = store.signal_key(input_filename)
+    with span('decode') as stage:
+        rate, data = wav_decode.decode(input_filename)
+        stage.add(samples=data.size, nbytes=data.nbytes)
+    store.put(input_filename, rate, data, key)
 
 
 
 # === Plotting ===
+def _channel_names(name, data):
+    
+    """
+    Trace names for each channel: the plain name for mono, 'name ch1'... otherwise.
+    """
+    
+    if data.ndim == 1:
+        return [name]
+    return [f"{name} ch{c + 1}" for c in range(data.shape[1])]
+
+def _columns(data):
+    
+    """
+    Per-channel views of a (N,) or (N, C) array.
+    """
+    
+    return [data] if data.ndim == 1 else [data[:, c] for c in range(data.shape[1])]
+
+def _add_time_trace(filename, name):
+    
+    """
+    Add a level-of-detail trace per channel of a file to the time figure.
+    Only a screen-resolution min/max envelope is sent, see update_time_window.
+    """
+    
+    import plotly.graph_objects as go  # loaded with the first plot, not at import
+    s = session.current()
+    rate, data = open_signal(filename, mmap=True)
+
+    # Plotted in [-1, 1]: int16 files are scaled, float files already are
+    mapped = filename if isinstance(data, np.memmap) else None
+    key = store.signal_key(filename)
+    for c, (column, trace_name) in enumerate(zip(_columns(data), _channel_names(name, data))):
+        with span('plot_lod', samples=len(column)):
+            lod = trace_lod.pyramid(key, column, rate, gain(data.dtype), mapped, channel=c)
+        uid = f"time-{next(_trace_ids)}"
+        s.time_traces[uid] = lod
+        t, y = lod.query(*s.time_window)
+        s.fig_time.add_trace(go.Scatter(x=t, y=y, mode='lines', name=trace_name, uid=uid))
+
+def update_time_window(t0=None, t1=None):
+    
+    """
+    Re-query every level-of-detail trace for the visible time window.
+    input:
+        t0, t1: visible window in seconds, None for the full signal
+    """
+    
+    s = session.current()
+    s.time_window = (t0, t1)
+    for trace in s.fig_time.data:
+        lod = s.time_traces.get(trace.uid)
+        if lod is not None:
+            trace.x, trace.y = lod.query(t0, t1)
+    if t0 is None or t1 is None:
+        s.fig_time.update_xaxes(autorange=True)
+    else:
+        s.fig_time.update_xaxes(range=[t0, t1], autorange=False)
+
+def clear_time_traces():
+    
+    """
+    Forget the level-of-detail traces (call when the time figure is cleared).
+    """
+    
+    s = session.current()
+    s.time_traces.clear()
+    s.time_window = (None, None)
+
 def plot_Input_signal():
     
     """
@@ -149,18 +311,12 @@ def plot_Input_signal():
     """
     
     try:
-        print("Plotting signal...")
-        rate, data = open_signal(INPUT_FILENAME)
-        if len(data.shape) > 1:
-            data = data[:, 0]  # Use only the first channel if stereo
-            
-        t = np.linspace(0, len(data) / rate, num=len(data))
-        fig_time.add_trace(go.Scatter(x=t, y=data / 32767, mode='lines', name='Input Signal'))
-        fig_time.update()
-        print("Signal plotted.")
+        log.debug("Plotting signal...")
+        _add_time_trace(session.current().input_filename, 'Input Signal')
+        log.debug("Signal plotted.")
         
-    except Exception as e:
-        print(f"[ERROR] Failed to plot signal: {e}")
+    except Exception:
+        log.exception("Failed to plot signal")
         
 def add_output():
     
@@ -169,51 +325,172 @@ def add_output():
     """
     
     try:
-        print("Adding trace...")
-        
-        rate, data = open_signal(OUTPUT_FILENAME)
-        if len(data.shape) > 1:
-            data = data[:, 0]  # Use only the first channel if stereo
-            
-        t = np.linspace(0, len(data) / rate, num=len(data))
-        #data must be between -1 and 1 for plotting. int16 is between -32768 and 32767
-        fig_time.add_trace(go.Scatter(x=t, y=data / 32767, mode='lines', name='Output Signal'))
-        fig_time.update()
-        print("Trace added.")
+        log.debug("Adding trace...")
+        _add_time_trace(session.current().output_filename, 'Output Signal')
+        log.debug("Trace added.")
         
-    except Exception as e:
-        print(f"[ERROR] Failed to add trace: {e}")
+    except Exception:
+        log.exception("Failed to add trace")
         
-def add_fft_trace(trace_name, filename):
+def add_fft_trace(trace_name, filename, max_freq=None):
     """
     Add a FFT trace to the frequency figure using a windowed signal and dB scaling.
-    Only positive frequencies are shown.
+    Only positive frequencies are shown, up to max_freq if given (see sp.spectrum_of_file).
     """
+    import plotly.graph_objects as go
     try:
-        print(f"Adding FFT trace from {filename}...")
-        rate, data = open_signal(filename)
-        if data is None:
-            print("[ERROR] No data to add FFT trace.")
-            return
+        log.debug("Adding FFT trace from %s", filename)
+        # Hamming window - Because the FFT is sensitive to discontinuities, we apply a window function
+        result = sp.spectrum_of_file(filename, window='hamming', max_freq=max_freq)
+        freq, magnitude = result.freq, result.magnitude
 
-        # Apply Hamming window - Because the FFT is sensitive to discontinuities, we apply a window function
-        window = np.hamming(len(data))
-        windowed_data = data * window
+        for column, name in zip(_columns(magnitude), _channel_names(trace_name, magnitude)):
+            session.current().fig_freq.add_trace(go.Scatter(x=freq, y=column, mode='lines', name=name))
+        log.debug("FFT trace added.")
 
-        fft_data = np.fft.fft(windowed_data)
-        freq = np.fft.fftfreq(len(data), d=1 / rate)
-        mask = freq >= 0
-        freq = freq[mask] # Only keep positive frequencies
-        magnitude = np.abs(fft_data)[mask]
-        #magnitude_db = 20 * np.log10(magnitude/ np.max(magnitude))  # Convert to dB scale
+    except Exception:
+        log.exception("Failed to add FFT trace")
 
-        fig_freq.add_trace(go.Scatter(x=freq, y=magnitude, mode='lines', name=trace_name))
-        fig_freq.update()
-        print("FFT trace added.")
 
-    except Exception as e:
-        print(f"[ERROR] Failed to add FFT trace: {e}")
+def _analysis_blocks(data, rate, max_freq):
 
+    """
+    Float blocks of a signal for block-wise analysis, decimated when max_freq allows it.
+    output:
+        blocks, analysis rate, number of samples at that rate
+    """
+
+    blocks = (to_float32(block) for block in iter_blocks(data))
+    factor = sp.reduction(rate, max_freq, len(data))
+    if factor == 1:
+        return blocks, rate, len(data)
+    log.debug("Analysing up to %g Hz at %g Hz", max_freq, rate / factor)
+    return resampling.decimate_blocks(blocks, rate, factor, max_freq), rate / factor, resampling.reduced_length(len(data), factor)
+
+
+def add_psd_trace(trace_name, filename, max_freq=None):
+    
+    """
+    Add a Welch power spectral density trace (dB) to the frequency figure.
+    The file is read block by block, so memory does not grow with its length.
+    With max_freq the trace stops there, and the estimate runs at a reduced rate
+    when the band allows it (finer resolution for the same segment length).
+    """
+    
+    import plotly.graph_objects as go
+    try:
+        log.debug("Adding Welch PSD trace from %s", filename)
+        rate, data = open_signal(filename, mmap=True)
+        blocks, rate, _ = _analysis_blocks(data, rate, max_freq)
+        with span('psd', samples=data.size, nbytes=data.nbytes):
+            freq, psd = spectral_analysis.welch_psd(blocks, rate)
+        if max_freq is not None:
+            end = np.searchsorted(freq, max_freq, side='right')
+            freq, psd = freq[:end], psd[:end]
+        with np.errstate(divide='ignore'):
+            psd_db = 10 * np.log10(psd)
+        for column, name in zip(_columns(psd_db), _channel_names(trace_name, psd_db)):
+            session.current().fig_freq.add_trace(go.Scatter(x=freq, y=column, mode='lines', name=name))
+        log.debug("Welch PSD trace added.")
+
+    except Exception:
+        log.exception("Failed to add PSD trace")
 
 
-        
\ No newline at end of file
+def add_spectrogram_trace(trace_name, filename, max_freq=None):
+    
+    """
+    Add an STFT spectrogram heatmap (dB) to the frequency figure.
+    Frequency runs along the x axis, time (s) along the y axis.
+    Multi-channel signals are shown as the mean power over the channels.
+    max_freq limits the band as for add_psd_trace.
+    """
+    
+    import plotly.graph_objects as go
+    try:
+        log.debug("Adding spectrogram from %s", filename)
+        rate, data = open_signal(filename, mmap=True)
+        blocks, rate, length = _analysis_blocks(data, rate, max_freq)
+        with span('spectrogram', samples=data.size, nbytes=data.nbytes):
+            freq, times, sxx = spectral_analysis.spectrogram(blocks, rate, length)
+        if max_freq is not None:
+            end = np.searchsorted(freq, max_freq, side='right')
+            freq, sxx = freq[:end], sxx[:end]
+        if sxx.ndim == 3:
+            sxx = sxx.mean(axis=2)
+            trace_name = f"{trace_name} (mean of {data.shape[1]} channels)"
+        with np.errstate(divide='ignore'):
+            sxx_db = 10 * np.log10(sxx.T)
+        session.current().fig_freq.add_trace(go.Heatmap(x=freq, y=times, z=sxx_db, colorscale='Viridis',
+                                                        colorbar=dict(title='dB'), name=trace_name))
+        log.debug("Spectrogram added.")
+
+    except Exception:
+        log.exception("Failed to add spectrogram")
+
+
+# === Live ===
+def start_live(live_filter=None, source=None):
+    
+    """
+    Start the live duplex stream (microphone -> filter -> speakers).
+    input:
+        live_filter: realtime.BlockFilter from realtime.make_filter, or None
+        source: array or WAV path played instead of the microphone
+    """
+    
+    s = session.current()
+    try:
+        stop_live()
+        s.live_session = realtime.LiveSession(channels=CHANNELS, live_filter=live_filter, source=source)
+        s.live_session.start()
+        
+    except Exception:
+        log.exception("Failed to start live stream")
+        s.live_session = None
+
+def stop_live():
+    
+    """
+    Stop the live stream, if one is running.
+    """
+    
+    s = session.current()
+    try:
+        if s.live_session is not None:
+            s.live_session.stop()
+        s.live_session = None
+        
+    except Exception:
+        log.exception("Failed to stop live stream")
+
+def _live_trace(fig, uid, name):
+    
+    """
+    Return the live trace with this uid, adding it to the figure if needed.
+    """
+    
+    import plotly.graph_objects as go
+    for trace in fig.data:
+        if trace.uid == uid:
+            return trace
+    fig.add_trace(go.Scatter(x=[], y=[], mode='lines', name=name, uid=uid))
+    return fig.data[-1]
+
+def update_live_plots():
+    
+    """
+    Push the latest live level and spectrum into the figures.
+    Called from a GUI timer; returns False when no live stream is running.
+    """
+    
+    s = session.current()
+    if s.live_session is None:
+        return False
+    times, levels, freq, spectrum_db = s.live_session.poll()
+    for c in range(s.live_session.channels):
+        level = _live_trace(s.fig_time, f'live-level-{c}', f'Live Level ch{c + 1}')
+        level.x, level.y = times, levels[:, c]
+        spec = _live_trace(s.fig_freq, f'live-spectrum-{c}', f'Live Spectrum ch{c + 1}')
+        spec.x, spec.y = freq, spectrum_db[:, c]
+    return s.live_session.active
@@ -0,0 +1,146 @@
+"""
+spectral_analysis.py
+Welch PSD and STFT spectrogram computed block by block.
+
+Both functions consume an iterable of signal blocks (e.g. from a memory-mapped
+WavReader), so only one block plus one segment of carry-over is held in memory.
+The spectrogram size is bounded by max_frames: when a file has more segments
+than that, consecutive segments are averaged together.
+Blocks may be (N,) mono or (N, C) multi-channel; all channels are analysed
+in the same vectorized call and returned channels last.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+scipy_fft = lazy.module('scipy.fft')
+
+# === Constants ===
+NPERSEG = 1024
+MAX_FRAMES = 1000  # spectrogram columns kept
+
+
+def _frames(blocks, nperseg, hop):
+
+    """
+    Turn a stream of blocks into batches of overlapping segments.
+    output:
+        yields arrays of shape (n, C, nperseg), float32 (C = 1 for mono)
+    """
+
+    carry = None
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block[:, None]
+        buf = block if carry is None else np.concatenate((carry, block))
+        if len(buf) < nperseg:
+            carry = buf
+            continue
+        count = (len(buf) - nperseg) // hop + 1
+        yield sliding_window_view(buf, nperseg, axis=0)[::hop][:count]
+        carry = buf[count * hop:]
+
+
+def _segment_power(frames, win, scale, detrend):
+    if detrend:
+        frames = frames - frames.mean(axis=-1, keepdims=True)
+    spec = scipy_fft.rfft(frames * win, axis=-1)
+    power = (spec.real ** 2 + spec.imag ** 2) * scale
+    # One-sided: double everything except DC and (for even nperseg) Nyquist
+    if win.shape[0] % 2:
+        power[..., 1:] *= 2
+    else:
+        power[..., 1:-1] *= 2
+    return power
+
+
+def _setup(rate, nperseg, noverlap, window):
+    if noverlap is None:
+        noverlap = nperseg // 2
+    if not 0 <= noverlap < nperseg:
+        raise ValueError(f"noverlap must be in [0, {nperseg}), got {noverlap}")
+    win = signal.get_window(window, nperseg).astype(np.float32)
+    scale = np.float32(1.0 / (rate * np.sum(win.astype(np.float64) ** 2)))
+    return nperseg - noverlap, win, scale
+
+
+def welch_psd(blocks, rate, nperseg=NPERSEG, noverlap=None, window='hann', detrend=True):
+
+    """
+    Estimate the power spectral density with Welch's method.
+    Matches scipy.signal.welch (density scaling, mean averaging).
+    input:
+        blocks: iterable of signal blocks, (N,) or (N, C), in order
+        rate: sample rate in Hz
+        nperseg: segment length
+        noverlap: overlap between segments (default nperseg // 2)
+        window: window name for scipy.signal.get_window
+        detrend: remove the mean of each segment
+    output:
+        freq: frequencies in Hz (float32)
+        psd: power spectral density (float32), shape (F,) or (F, C)
+    """
+
+    hop, win, scale = _setup(rate, nperseg, noverlap, window)
+    total = 0
+    count = 0
+    mono = True
+    for frames in _frames(blocks, nperseg, hop):
+        total = total + _segment_power(frames, win, scale, detrend).sum(axis=0, dtype=np.float64)
+        count += len(frames)
+        mono = frames.shape[1] == 1
+    if count == 0:
+        raise ValueError(f"Signal is shorter than one segment ({nperseg} samples)")
+    freq = scipy_fft.rfftfreq(nperseg, d=1 / rate).astype(np.float32)
+    psd = (total / count).astype(np.float32).T
+    return freq, psd[:, 0] if mono else psd
+
+
+def spectrogram(blocks, rate, length, nperseg=NPERSEG, noverlap=None, window='hann',
+                detrend=True, max_frames=MAX_FRAMES):
+
+    """
+    Compute a short-time Fourier transform power spectrogram.
+    input:
+        blocks: iterable of signal blocks, (N,) or (N, C), in order
+        rate: sample rate in Hz
+        length: total number of samples in the signal
+        nperseg, noverlap, window, detrend: as in welch_psd
+        max_frames: maximum number of time columns; groups of consecutive
+                    segments are averaged when the signal has more
+    output:
+        freq: frequencies in Hz (float32)
+        times: centre time of each column in seconds (float32)
+        sxx: power spectral density, float32, shape (F, T) or (F, T, C)
+    """
+
+    hop, win, scale = _setup(rate, nperseg, noverlap, window)
+    n_segments = (length - nperseg) // hop + 1 if length >= nperseg else 0
+    if n_segments <= 0:
+        raise ValueError(f"Signal is shorter than one segment ({nperseg} samples)")
+    group = -(-n_segments // max_frames) if max_frames else 1
+    n_cols = -(-n_segments // group)
+
+    sxx = None
+    counts = np.zeros(n_cols, dtype=np.int64)
+    seg = 0
+    for frames in _frames(blocks, nperseg, hop):
+        frames = frames[:n_segments - seg]
+        if sxx is None:
+            sxx = np.zeros((n_cols, frames.shape[1], nperseg // 2 + 1), dtype=np.float32)
+        cols = (seg + np.arange(len(frames))) // group
+        np.add.at(sxx, cols, _segment_power(frames, win, scale, detrend))
+        np.add.at(counts, cols, 1)
+        seg += len(frames)
+    sxx /= np.maximum(counts, 1)[:, None, None]
+
+    # Centre of each column: mean of its segments' centres
+    centres = np.arange(n_segments) * hop + nperseg / 2
+    times = np.add.reduceat(centres, np.arange(0, n_segments, group)) / np.bincount(
+        np.arange(n_segments) // group)
+    freq = scipy_fft.rfftfreq(nperseg, d=1 / rate).astype(np.float32)
+    sxx = sxx.transpose(2, 0, 1)  # (F, T, C)
+    return freq, (times / rate).astype(np.float32), sxx[..., 0] if sxx.shape[2] == 1 else sxx
@@ -0,0 +1,116 @@
+"""
+spectrum.py
+Real-FFT spectrum engine with a small result cache.
+
+Spectra are computed with scipy.fft.rfft in single precision, zero-padded to
+a fast FFT length, and cached per (signal key, window, nfft) so the dB and
+linear views of the same signal share one transform.
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from sample_format import to_float32
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+scipy_fft = lazy.module('scipy.fft')
+
+# === Constants ===
+CACHE_SIZE = 8  # spectra kept before least-recently-used eviction
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (signal key, window, nfft) -> Spectrum
+
+
+class Spectrum:
+
+    """
+    One-sided magnitude spectrum.
+    attributes:
+        freq: frequencies in Hz (0 .. rate/2)
+        magnitude: linear magnitudes (float32), shape (F,) or (F, C)
+        magnitude_db: magnitudes in dB, computed on first access
+    """
+
+    def __init__(self, freq, magnitude):
+        self.freq = freq
+        self.magnitude = magnitude
+        self._magnitude_db = None
+
+    @property
+    def magnitude_db(self):
+        if self._magnitude_db is None:
+            with np.errstate(divide='ignore'):
+                self._magnitude_db = 20 * np.log10(self.magnitude)
+        return self._magnitude_db
+
+
+def compute(data, rate, window=None, nfft=None):
+
+    """
+    Compute the one-sided magnitude spectrum of a signal.
+    input:
+        data: signal, shape (N,) or (N, C); channels are transformed together,
+              integer PCM is scaled to [-1, 1] first (magnitudes relative to full scale)
+        rate: sample rate in Hz
+        window: window name for scipy.signal.get_window (e.g. 'hamming'), or None
+        nfft: FFT length, or None for the next fast length >= len(data)
+    output:
+        Spectrum
+    """
+
+    n = len(data)
+    if nfft is None:
+        nfft = scipy_fft.next_fast_len(n, real=True)
+    x = to_float32(data)
+    if window is not None:
+        # Symmetric window, same as np.hamming(n) for 'hamming'
+        win = signal.get_window(window, n, fftbins=False).astype(np.float32)
+        win = win.reshape((-1,) + (1,) * (x.ndim - 1))
+        # In place only on a copy; float32 input may be a read-only view of a memmap
+        x = x * win if np.may_share_memory(x, data) else np.multiply(x, win, out=x)
+    spec = scipy_fft.rfft(x, n=nfft, axis=0, workers=-1)
+    freq = scipy_fft.rfftfreq(nfft, d=1 / rate)
+    return Spectrum(freq, np.abs(spec))
+
+
+def get(key, window=None, nfft=None):
+
+    """
+    Return the cached spectrum for a signal key, or None.
+    """
+
+    if key is None:
+        return None
+    with _lock:
+        entry = _cache.get((key, window, nfft))
+        if entry is not None:
+            _cache.move_to_end((key, window, nfft))
+        return entry
+
+
+def put(key, spectrum, window=None, nfft=None):
+
+    """
+    Cache a spectrum under a signal key.
+    """
+
+    if key is None:
+        return
+    with _lock:
+        _cache[(key, window, nfft)] = spectrum
+        _cache.move_to_end((key, window, nfft))
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear():
+
+    """
+    Drop every cached spectrum.
+    """
+
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,287 @@
+"""
+stream_filter.py
+Block-based filtering with carried filter state.
+
+Signals are filtered block by block through sosfilt/lfilter, carrying the
+zi state between blocks, and written to the output WAV as they are produced.
+Zero-phase filtering runs a forward pass into a temporary memmap and a
+backward pass over it, with the same odd padding and initial conditions as
+sosfiltfilt/filtfilt, so the result matches the batch functions.
+Long FIR filters can run through FFT (overlap-add) convolution instead of
+the direct form. Signals are filtered along axis 0, so (N, C) multi-channel
+input is handled in one call per block. Samples are scaled to [-1, 1] as
+they are read and quantized once when they are written.
+BlockFilter exposes the causal per-block filter for live streams.
+filter_blocks yields the filtered signal block by block and filter_to_wav
+writes it; both report their progress through jobs.checkpoint, so a GUI job
+running them can be cancelled between blocks.
+"""
+
+import os
+import tempfile
+import numpy as np
+from jobs import checkpoint
+from sample_format import gain, quantize
+from wav_io import WavWriter, iter_blocks, BLOCK_SIZE
+import lazy
+
+signal = lazy.module('scipy.signal')  # imported on first use, see lazy.py
+
+
+# === Filter stages ===
+def _sos_stage(sos):
+
+    """
+    Return (step, zi_unit, padlen) for a second-order-sections filter.
+    padlen follows scipy.signal.sosfiltfilt.
+    """
+
+    ntaps = 2 * sos.shape[0] + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+
+    def step(x, zi):
+        return signal.sosfilt(sos, x, axis=0, zi=zi)
+
+    return step, signal.sosfilt_zi(sos), 3 * ntaps
+
+
+def _fir_stage(taps):
+
+    """
+    Return (step, zi_unit, padlen) for an FIR filter.
+    padlen follows scipy.signal.filtfilt.
+    """
+
+    taps = np.asarray(taps, dtype=np.float64)
+
+    def step(x, zi):
+        return signal.lfilter(taps, [1.0], x, axis=0, zi=zi)
+
+    return step, signal.lfilter_zi(taps, [1.0]), 3 * len(taps)
+
+
+def _fir_fft_stage(taps):
+
+    """
+    Return (step, zi_unit, padlen) for an FIR filter applied by overlap-add
+    FFT convolution. The state is the last len(taps) - 1 input samples, so a
+    state of all x0 matches lfilter_zi(taps, 1) * x0.
+    """
+
+    taps = np.asarray(taps, dtype=np.float64)
+
+    def step(x, history):
+        ext = np.concatenate((history, x))
+        kernel = taps.reshape((-1,) + (1,) * (ext.ndim - 1))
+        return signal.oaconvolve(ext, kernel, mode='valid', axes=0), ext[len(ext) - len(history):]
+
+    return step, np.ones(len(taps) - 1), 3 * len(taps)
+
+
+def _stage(sos=None, taps=None, engine='direct'):
+
+    """
+    Return (step, zi_unit, padlen) for sos, or for taps with the given engine.
+    """
+
+    if (sos is None) == (taps is None):
+        raise ValueError("Exactly one of sos or taps must be given")
+    if sos is not None:
+        return _sos_stage(np.asarray(sos))
+    if engine == 'fft':
+        return _fir_fft_stage(taps)
+    return _fir_stage(taps)
+
+
+def _initial_state(zi_unit, x0):
+
+    """
+    Scale a unit initial state by the first sample(s).
+    x0 is a scalar for mono signals or a (C,) vector for multi-channel ones.
+    """
+
+    x0 = np.asarray(x0, dtype=np.float64)
+    return zi_unit.reshape(zi_unit.shape + (1,) * x0.ndim) * x0
+
+
+def odd_ext(data, padlen):
+
+    """
+    Odd extension of a signal at both edges, as sosfiltfilt/filtfilt pad it.
+    input:
+        data: signal, shape (N,) or (N, C), with N > padlen
+        padlen: samples to add on each side
+    output:
+        left, right: the extensions before and after the signal (float64)
+    """
+
+    first = np.asarray(data[0], dtype=np.float64)
+    last = np.asarray(data[-1], dtype=np.float64)
+    left = 2 * first - np.asarray(data[padlen:0:-1], dtype=np.float64)
+    right = 2 * last - np.asarray(data[-2:-(padlen + 2):-1], dtype=np.float64)
+    return left, right
+
+
+def fft_filtfilt(taps, data):
+
+    """
+    Zero-phase FIR filtering with FFT convolution.
+    Same result as signal.filtfilt(taps, 1.0, data), in O(N log taps).
+    input:
+        taps: FIR filter taps
+        data: input signal, shape (N,) or (N, C), filtered along axis 0
+    output:
+        filtered signal (float64)
+    """
+
+    step, zi_unit, padlen = _fir_fft_stage(taps)
+    x = np.asarray(data, dtype=np.float64)
+    if len(x) <= padlen:
+        raise ValueError(f"Signal length {len(x)} must be greater than the padding length {padlen}")
+    left, right = odd_ext(x, padlen)
+    ext = np.concatenate((left, x, right))
+    y, _ = step(ext, _initial_state(zi_unit, ext[0]))
+    y, _ = step(y[::-1], _initial_state(zi_unit, y[-1]))
+    return y[::-1][padlen:-padlen]
+
+
+# === Streaming filter ===
+class BlockFilter:
+
+    """
+    Causal filter applied block by block, carrying its state between calls.
+    Filtering a signal in any split gives the same result as sosfilt/lfilter
+    over the whole signal. The state starts at rest (zeros) and is sized
+    from the first block, so (N,) and (N, C) blocks both work.
+    input:
+        sos: second-order sections of an IIR filter
+        taps: FIR filter taps (used when sos is None)
+        engine: 'direct' (lfilter) or 'fft' (overlap-add) for FIR taps
+    """
+
+    def __init__(self, sos=None, taps=None, engine='direct'):
+        self._step, self._zi_unit, _ = _stage(sos, taps, engine)
+        self.zi = None
+
+    def process(self, block):
+
+        """
+        Filter one block and return the output (float64, same shape).
+        """
+
+        block = np.asarray(block, dtype=np.float64)
+        if self.zi is None:
+            self.zi = np.zeros_like(_initial_state(self._zi_unit, np.zeros(block.shape[1:])))
+        y, self.zi = self._step(block, self.zi)
+        return y
+
+    def reset(self):
+
+        """
+        Return the filter to rest.
+        """
+
+        self.zi = None
+
+
+def filter_blocks(data, sos=None, taps=None, zero_phase=True, block_size=BLOCK_SIZE,
+                  engine='direct', progress=checkpoint):
+
+    """
+    Filter a signal block by block.
+    input:
+        data: array or memory-mapped view of the input signal, shape (N,) or (N, C)
+        sos: second-order sections of an IIR filter
+        taps: FIR filter taps (used when sos is None)
+        zero_phase: if True, match sosfiltfilt/filtfilt, otherwise sosfilt/lfilter
+        block_size: number of samples processed per block
+        engine: 'direct' (lfilter) or 'fft' (overlap-add) for FIR taps
+        progress: called as progress(done, total) between blocks (jobs.checkpoint by default)
+    output:
+        iterator over the filtered signal in blocks of at most block_size samples,
+        float in [-1, 1] units (integer input is scaled)
+    """
+
+    _, _, padlen = _stage(sos, taps, engine)
+    if zero_phase and len(data) <= padlen:
+        raise ValueError(f"Signal length {len(data)} must be greater than the padding length {padlen}")
+    if not zero_phase:
+        return _causal_blocks(data, sos, taps, block_size, engine, progress)
+    return _zero_phase_blocks(data, sos, taps, block_size, engine, progress)
+
+
+def _causal_blocks(data, sos, taps, block_size, engine, progress):
+    causal = BlockFilter(sos, taps, engine)
+    scale = gain(data.dtype)
+    for pos, block in enumerate(iter_blocks(data, block_size)):
+        progress(pos * block_size, len(data))
+        yield causal.process(block) * scale
+
+
+def _zero_phase_blocks(data, sos, taps, block_size, engine, progress):
+    step, zi_unit, padlen = _stage(sos, taps, engine)
+    n = len(data)
+    scale = gain(data.dtype)  # integer input is filtered in [-1, 1] units
+
+    left, right = odd_ext(data, padlen)
+    left *= scale
+    right *= scale
+    total = n + 2 * padlen
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".f32")
+    os.close(fd)
+    tmp = None
+    try:
+        # float32 intermediate: half the disk of float64, far below 16-bit resolution
+        tmp = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(total,) + data.shape[1:])
+
+        # Forward pass
+        y, zi = step(left, _initial_state(zi_unit, left[0]))
+        tmp[:padlen] = y
+        pos = padlen
+        for block in iter_blocks(data, block_size):
+            progress(pos, 3 * total)
+            y, zi = step(block * scale, zi)
+            tmp[pos:pos + len(y)] = y
+            pos += len(y)
+        y, zi = step(right, zi)
+        tmp[pos:] = y
+
+        # Backward pass, in place over the forward result
+        zi = _initial_state(zi_unit, tmp[-1])
+        for end in range(total, 0, -block_size):
+            progress(2 * total - end, 3 * total)
+            start = max(end - block_size, 0)
+            y, zi = step(tmp[start:end][::-1], zi)
+            tmp[start:end] = y[::-1]
+
+        for pos in range(padlen, padlen + n, block_size):
+            progress(2 * total + pos - padlen, 3 * total)
+            yield tmp[pos:min(pos + block_size, padlen + n)]
+    finally:
+        tmp = None  # release the mapping before removing the file
+        os.remove(tmp_path)
+
+
+def filter_to_wav(data, rate, output_filename, sos=None, taps=None, zero_phase=True,
+                  block_size=BLOCK_SIZE, engine='direct', dtype=np.int16, dither=True):
+
+    """
+    Filter a signal block by block and write the result to a WAV file.
+    input:
+        data: array or memory-mapped view of the input signal, shape (N,) or (N, C)
+        rate: sample rate of the signal
+        output_filename: path of the WAV file to write
+        sos, taps, zero_phase, block_size, engine: see filter_blocks
+        dtype: output sample type, np.int16 or np.float32
+        dither: dither the int16 quantization (see sample_format.quantize)
+    output:
+        number of samples written
+    """
+
+    blocks = filter_blocks(data, sos, taps, zero_phase, block_size, engine)
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    with WavWriter(output_filename, rate, channels, dtype) as writer:
+        for block in blocks:
+            writer.write(quantize(block, dtype, dither))
+    return len(data)
@@ -0,0 +1,5 @@
+# The app's modules are flat files next to tests/: make them importable
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,51 @@
+"""
+test_import_time.py
+Import-time budget of the core modules (see lazy.py).
+
+Each module is imported alone in a fresh interpreter under -X importtime; its
+cumulative import time must stay within IMPORT_BUDGET and none of the heavy
+GUI/plotting/audio/SciPy-signal modules may be loaded. The limits come from
+import_budget.py, as for benchmarks.py --imports-only.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from import_budget import IMPORT_MODULES, IMPORT_BUDGET, HEAVY_MODULES
+
+# === Constants ===
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module):
+
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    output:
+        dict module name -> cumulative import time in seconds
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=PACKAGE_DIR, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize('module', IMPORT_MODULES)
+def test_import_time(module):
+    times = import_profile(module)
+    assert times[module] <= IMPORT_BUDGET, f"import {module} took {times[module]:.3f} s"
+    heavy = sorted(name for name in times
+                   if any(name == h or name.startswith(h + '.') for h in HEAVY_MODULES))
+    assert not heavy, f"import {module} loaded {', '.join(heavy)}"
@@ -0,0 +1,63 @@
+"""
+test_playback.py
+Player seeking on the null output device (no audio hardware needed).
+"""
+
+import time
+
+import numpy as np
+
+import playback
+
+RATE = 8000
+
+
+def make_player(seconds, realtime):
+    data = np.zeros((int(seconds * RATE), 2), dtype=np.float32)
+    return playback.Player(data, rate=RATE, blocksize=256, null=True, realtime=realtime)
+
+
+def wait_active(player, timeout=1.0):
+    # A seek is picked up by the prefetch thread (or restarts the player) asynchronously
+    deadline = time.monotonic() + timeout
+    while not player.active and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return player.active
+
+
+def test_seek_after_end_plays_again():
+    player = make_player(0.3, realtime=True)
+    player.start()
+    assert player.wait(3)
+    # Seek once the player has released the stream, as when the slider is moved later
+    deadline = time.monotonic() + 1.0
+    while player.stream is not None and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert player.stream is None and not player.active
+
+    player.seek(0.1)
+    assert wait_active(player)
+    assert player.position < player.duration
+    assert player.wait(3)
+    assert player.position == player.duration
+    player.stop()
+
+
+def test_seek_while_playing():
+    player = make_player(10.0, realtime=True)
+    player.start()
+    assert wait_active(player)
+    player.seek(9.8)
+    # Without the seek, ten seconds would be left to play
+    assert player.wait(3)
+    assert player.position == player.duration
+    player.stop()
+
+
+def test_seek_before_start():
+    player = make_player(1.0, realtime=False)
+    player.seek(0.5)
+    assert player.position == 0.5
+    player.start()
+    assert player.wait(5)
+    player.stop()
@@ -0,0 +1,46 @@
+"""
+test_resampling.py
+Decimator and Interpolator give the same samples as decimate/interpolate,
+however the signal is split into blocks.
+"""
+
+import numpy as np
+import pytest
+
+import resampling
+
+RATE = 44100
+
+
+def run_blocks(chain, data, block_size):
+    parts = [chain.process(data[i:i + block_size]) for i in range(0, len(data), block_size)]
+    parts.append(chain.flush())
+    return np.concatenate(parts)
+
+
+@pytest.mark.parametrize('shape', [(12011,), (12011, 2), (50, 2), (1,)])
+@pytest.mark.parametrize('edge', [300, 1000, 2500])
+@pytest.mark.parametrize('block_size', [1, 333, 7777])
+def test_block_split_invariance(shape, edge, block_size):
+    rng = np.random.default_rng(1)
+    data = (0.1 * rng.standard_normal(shape)).astype(np.float32)
+    factor = resampling.reduction_factor(RATE, edge)
+
+    reduced = resampling.decimate(data, RATE, factor, edge)
+    assert reduced.shape == (resampling.reduced_length(len(data), factor),) + shape[1:]
+    streamed = run_blocks(resampling.Decimator(RATE, factor, edge), data, block_size)
+    np.testing.assert_array_equal(streamed, reduced)
+
+    restored = resampling.interpolate(reduced, RATE, factor, edge, len(data))
+    assert restored.shape == data.shape
+    streamed = run_blocks(resampling.Interpolator(RATE, factor, edge), reduced, max(block_size // factor, 1))
+    np.testing.assert_array_equal(streamed[:len(data)], restored)
+
+
+def test_round_trip_keeps_the_band():
+    t = np.arange(RATE) / RATE
+    data = (0.5 * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+    factor = resampling.reduction_factor(RATE, 1000, len(data))
+    restored = resampling.filter_reduced(data, RATE, factor, 1000, lambda x, rate: x)
+    assert factor > 1
+    np.testing.assert_allclose(restored, data, atol=2e-3)
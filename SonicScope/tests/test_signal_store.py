@@ -0,0 +1,43 @@
+"""
+test_signal_store.py
+Stored signals are shared read-only without touching the caller's array.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import signal_store as store
+
+
+@pytest.fixture
+def wav_path(tmp_path):
+    path = tmp_path / 'signal.wav'
+    path.write_bytes(b'x' * 64)
+    store.clear()
+    yield str(path)
+    store.clear()
+
+
+def test_put_keeps_caller_array_writable(wav_path):
+    data = np.zeros(16, dtype=np.int16)
+    shared = store.put(wav_path, 44100, data, store.signal_key(wav_path))
+    data[0] = 1  # the caller can still edit its own array
+    assert not shared.flags.writeable
+
+    rate, stored = store.get(wav_path)
+    assert rate == 44100
+    assert not stored.flags.writeable
+    with pytest.raises(ValueError):
+        stored[0] = 2
+
+
+def test_put_skips_file_changed_since_key(wav_path):
+    key = store.signal_key(wav_path)
+    with open(wav_path, 'ab') as f:
+        f.write(b'y' * 16)
+    os.utime(wav_path, ns=(key[1] + 10 ** 9, key[1] + 10 ** 9))
+
+    store.put(wav_path, 44100, np.zeros(16, dtype=np.int16), key)
+    assert store.get(wav_path) is None
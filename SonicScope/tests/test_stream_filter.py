@@ -0,0 +1,60 @@
+"""
+test_stream_filter.py
+Block-by-block filtering matches scipy's whole-array result for any block size.
+"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from stream_filter import filter_blocks
+
+RATE = 44100
+BLOCK_SIZES = (7, 97, 1000, 4099)
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    return (0.3 * rng.standard_normal((12007, 3))).astype(np.float32)
+
+
+def run(data, **kwargs):
+    return np.concatenate(list(filter_blocks(data, progress=lambda done, total: None, **kwargs)))
+
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_zero_phase_sos(data, block_size):
+    sos = signal.butter(5, [300, 3000], 'bandpass', fs=RATE, output='sos')
+    expected = signal.sosfiltfilt(sos, data, axis=0)
+    np.testing.assert_allclose(run(data, sos=sos, block_size=block_size), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('engine', ['direct', 'fft'])
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_zero_phase_fir(data, engine, block_size):
+    taps = signal.firwin(301, 1000, fs=RATE)
+    expected = signal.filtfilt(taps, 1.0, data, axis=0)
+    result = run(data, taps=taps, engine=engine, block_size=block_size)
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('block_size', BLOCK_SIZES)
+def test_causal_sos(data, block_size):
+    sos = signal.butter(4, 1000, 'lowpass', fs=RATE, output='sos')
+    expected = signal.sosfilt(sos, data, axis=0)
+    result = run(data, sos=sos, zero_phase=False, block_size=block_size)
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+
+def test_integer_input_is_scaled(data):
+    pcm = np.round(data * 32767).astype(np.int16)
+    sos = signal.butter(5, 2000, 'lowpass', fs=RATE, output='sos')
+    expected = signal.sosfiltfilt(sos, pcm / 32768.0, axis=0)
+    np.testing.assert_allclose(run(pcm, sos=sos, block_size=997), expected, atol=1e-6)
+
+
+def test_short_signal_rejected():
+    taps = signal.firwin(301, 1000, fs=RATE)
+    with pytest.raises(ValueError):
+        filter_blocks(np.zeros(100, dtype=np.float32), taps=taps)
@@ -0,0 +1,179 @@
+"""
+trace_lod.py
+Level-of-detail min/max pyramid for time-domain plot traces.
+
+Each level stores per-bucket minimum and maximum of the signal, with buckets
+FACTOR times wider than the level below. A query for a visible time window
+picks the coarsest level that still has at least `width` buckets in the
+window, so the number of points sent to the browser stays roughly constant
+however long the recording is. Zoomed far enough in, raw samples are served.
+
+Pyramids built from a file do not keep the file mapped: raw samples are read
+back through a fresh mapping, and only while the file is unchanged.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from wav_io import WavReader, iter_blocks
+
+# === Constants ===
+BASE_BUCKET = 64     # samples per bucket at level 0
+FACTOR = 4           # bucket growth between levels
+WIDTH = 2000         # buckets per query (~ screen width in pixels)
+CACHE_SIZE = 8       # pyramids kept, least recently used evicted
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # signal key -> MinMaxPyramid
+
+
+class MinMaxPyramid:
+
+    """
+    Min/max envelope pyramid of a 1-D signal.
+    input:
+        data: 1-D signal (array or memory-mapped view)
+        rate: sample rate in Hz
+        scale: factor applied to the samples (e.g. 1 / 32768 for int16)
+        filename: file the data was mapped from; raw samples are then re-read
+                  from it instead of keeping data alive
+        channel: channel of filename the data belongs to
+    """
+
+    def __init__(self, data, rate, scale=1.0, filename=None, channel=0):
+        self.length = len(data)
+        self.rate = rate
+        self.scale = scale
+        self.filename = filename
+        self.channel = channel
+        self._stat = _file_stat(filename) if filename else None
+        self._data = None if filename else data
+        self.levels = []  # (bucket size, mins, maxs)
+
+        # Level 0, built block by block so memory-mapped input is never fully loaded
+        block = BASE_BUCKET * 4096
+        n_buckets = -(-len(data) // BASE_BUCKET)
+        mins = np.empty(n_buckets, dtype=np.float32)
+        maxs = np.empty(n_buckets, dtype=np.float32)
+        for i, chunk in enumerate(iter_blocks(data, block)):
+            b0 = i * (block // BASE_BUCKET)
+            mn, mx = _bucket_minmax(chunk, BASE_BUCKET)
+            mins[b0:b0 + len(mn)] = mn
+            maxs[b0:b0 + len(mx)] = mx
+        mins *= scale
+        maxs *= scale
+        self.levels.append((BASE_BUCKET, mins, maxs))
+
+        while len(mins) > WIDTH:
+            mins = _bucket_minmax(mins, FACTOR)[0]
+            maxs = _bucket_minmax(maxs, FACTOR)[1]
+            self.levels.append((self.levels[-1][0] * FACTOR, mins, maxs))
+
+    @property
+    def duration(self):
+        return self.length / self.rate
+
+    def _raw(self, i0, i1):
+        # Raw samples, or None if the source file changed since the build
+        if self._data is not None:
+            return np.asarray(self._data[i0:i1], dtype=np.float32)
+        if _file_stat(self.filename) != self._stat:
+            return None
+        with WavReader(self.filename, channel=self.channel) as reader:
+            return np.asarray(reader.data[i0:i1], dtype=np.float32)
+
+    def query(self, t0=None, t1=None, width=WIDTH):
+
+        """
+        Return plot points for a time window.
+        input:
+            t0, t1: visible window in seconds (None for the whole signal)
+            width: number of buckets wanted in the window
+        output:
+            x: times in seconds
+            y: sample values, or interleaved min/max per bucket (float32)
+        """
+
+        n = self.length
+        i0 = 0 if t0 is None else int(np.clip(np.floor(t0 * self.rate), 0, n))
+        i1 = n if t1 is None else int(np.clip(np.ceil(t1 * self.rate) + 1, i0, n))
+
+        if i1 - i0 <= 2 * width or i1 - i0 <= 2 * BASE_BUCKET:
+            y = self._raw(i0, i1)
+            if y is not None:
+                return np.arange(i0, i1) / self.rate, y * np.float32(self.scale)
+
+        # Coarsest level that still gives `width` buckets in the window
+        bucket, mins, maxs = self.levels[0]
+        for level in self.levels[1:]:
+            if (i1 - i0) / level[0] < width:
+                break
+            bucket, mins, maxs = level
+        b0, b1 = i0 // bucket, -(-i1 // bucket)
+        centres = (np.arange(b0, b1) * bucket + bucket / 2) / self.rate
+        x = np.repeat(centres, 2)
+        y = np.empty(2 * (b1 - b0), dtype=np.float32)
+        y[0::2] = mins[b0:b1]
+        y[1::2] = maxs[b0:b1]
+        return x, y
+
+
+def _bucket_minmax(values, bucket):
+
+    """
+    Per-bucket min and max of a 1-D array; the last bucket may be partial.
+    """
+
+    full = len(values) // bucket * bucket
+    head = np.asarray(values[:full]).reshape(-1, bucket)
+    mins, maxs = head.min(axis=1), head.max(axis=1)
+    if full < len(values):
+        tail = np.asarray(values[full:])
+        mins = np.append(mins, tail.min())
+        maxs = np.append(maxs, tail.max())
+    return mins, maxs
+
+
+def _file_stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def pyramid(key, data, rate, scale=1.0, filename=None, channel=0):
+
+    """
+    Return the pyramid for one channel of a signal, building it on first use.
+    input:
+        key: signal key (see signal_store.signal_key), or None to skip caching
+        data, rate, scale, filename, channel: as in MinMaxPyramid
+    output:
+        MinMaxPyramid
+    """
+
+    if key is not None:
+        key = (key, channel)
+    with _lock:
+        if key is not None and key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    result = MinMaxPyramid(data, rate, scale, filename, channel)
+    if key is not None:
+        with _lock:
+            _cache[key] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def clear():
+
+    """
+    Drop every cached pyramid.
+    """
+
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,129 @@
+"""
+wav_decode.py
+Native WAV inspection and sample-format conversion.
+
+inspect reads only the RIFF header, so checking whether a file is already
+16-bit PCM at a supported rate costs a few hundred bytes of I/O. decode reads
+the samples once with scipy and converts them with vectorized NumPy (see
+sample_format.py): 8/16/24/32-bit integer and 32/64-bit float PCM become
+int16 or float32, and rates outside ALLOWED_RATES are resampled with
+scipy.signal.resample_poly (see resampling.resample).
+The source file is never rewritten; callers cache the decoded array instead
+(see signal_store.py).
+"""
+
+import logging
+import struct
+from collections import namedtuple
+import numpy as np
+
+from sample_format import to_int16, to_float32
+from resampling import resample
+import lazy
+
+wavfile = lazy.module('scipy.io.wavfile')  # imported on first use, see lazy.py
+
+log = logging.getLogger(__name__)
+
+# === Constants ===
+ALLOWED_RATES = (8000, 16000, 44100, 48000)  # in Hz
+
+_FORMATS = {1: 'pcm', 3: 'float'}
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+WavInfo = namedtuple('WavInfo', 'format channels rate bits frames data_offset')
+
+
+def inspect(filename):
+
+    """
+    Read the format of a WAV file from its header, without touching the samples.
+    input:
+        filename: path to the WAV file
+    output:
+        WavInfo(format, channels, rate, bits, frames, data_offset), where
+        format is 'pcm', 'float' or the numeric tag of any other encoding
+    """
+
+    with open(filename, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(f"{filename} is not a little-endian RIFF/WAVE file")
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(12)
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{filename} has no data chunk")
+            chunk_id, size = header[:4], struct.unpack('<I', header[4:])[0]
+            if chunk_id == b'fmt ':
+                body = f.read(size + size % 2)
+                tag, channels, rate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == _WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                    tag = struct.unpack('<H', body[24:26])[0]  # first two bytes of the sub-format GUID
+                fmt = (_FORMATS.get(tag, tag), channels, rate, bits, block_align)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{filename} has no fmt chunk before its data")
+                offset = f.tell()
+                # Files from an interrupted writer can carry a zero or oversized data size
+                if size == 0 or offset + size > file_size:
+                    size = file_size - offset
+                encoding, channels, rate, bits, block_align = fmt
+                return WavInfo(encoding, channels, rate, bits, size // max(block_align, 1), offset)
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def needs_conversion(info, dtype=np.int16):
+
+    """
+    True if a file must be decoded (not just mapped) to get dtype samples at an allowed rate.
+    """
+
+    if info.rate not in ALLOWED_RATES:
+        return True
+    if np.dtype(dtype) == np.int16:
+        return not (info.format == 'pcm' and info.bits == 16)
+    return not (info.format == 'float' and info.bits == 32)
+
+
+def nearest_rate(rate):
+
+    """
+    Return the allowed rate to resample to: the lowest one at or above rate
+    (no information is lost), or the highest allowed rate.
+    """
+
+    for allowed in sorted(ALLOWED_RATES):
+        if allowed >= rate:
+            return allowed
+    return max(ALLOWED_RATES)
+
+
+# === Conversion ===
+def decode(filename, dtype=np.int16, rate=None):
+
+    """
+    Decode a WAV file into memory as int16 or float32.
+    input:
+        filename: path to the WAV file
+        dtype: np.int16 or np.float32
+        rate: target sample rate, or None for nearest_rate of the file's rate
+    output:
+        rate, data with data of shape (N,) or (N, C)
+    """
+
+    info = inspect(filename)
+    if info.format not in ('pcm', 'float'):
+        raise ValueError(f"Unsupported WAV encoding (format tag {info.format}) in {filename}")
+    file_rate, data = wavfile.read(filename)
+    target_rate = nearest_rate(file_rate) if rate is None else rate
+    if target_rate != file_rate:
+        log.info("Resampling %s from %d Hz to %d Hz", filename, file_rate, target_rate)
+        data = resample(to_float32(data), file_rate, target_rate)
+    if np.dtype(dtype) == np.int16:
+        return target_rate, to_int16(data)
+    return target_rate, to_float32(data)
@@ -0,0 +1,171 @@
+"""
+wav_io.py
+Chunked WAV reading and writing for recordings that do not fit in memory.
+
+WavReader memory-maps the PCM data chunk and hands out zero-copy views,
+WavWriter appends blocks to a WAV file and patches the RIFF header on close.
+"""
+
+import struct
+import numpy as np
+import lazy
+
+wavfile = lazy.module('scipy.io.wavfile')  # imported on first use, see lazy.py
+
+# === Constants ===
+BLOCK_SIZE = 65536  # samples per block
+
+_FORMAT_PCM = 1
+_FORMAT_FLOAT = 3
+
+
+# === Reading ===
+class WavReader:
+
+    """
+    Memory-mapped view of a WAV file.
+    input:
+        filename: path to the WAV file
+        channel: channel index to select, or None to keep all channels
+    attributes:
+        rate: sample rate of the file
+        data: read-only view of the samples, shape (N,) or (N, C)
+    """
+
+    def __init__(self, filename, channel=None):
+        self.filename = filename
+        self.rate, data = wavfile.read(filename, mmap=True)
+        data.setflags(write=False)
+        if channel is not None and data.ndim > 1:
+            data = data[:, channel]  # strided view, no copy
+        self.data = data
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def channels(self):
+        return 1 if self.data.ndim == 1 else self.data.shape[1]
+
+    @property
+    def duration(self):
+        return len(self) / self.rate
+
+    def channel(self, index):
+
+        """
+        Return a strided view of a single channel.
+        """
+
+        if self.data.ndim == 1:
+            if index != 0:
+                raise IndexError(f"Channel {index} out of range for mono file")
+            return self.data
+        return self.data[:, index]
+
+    def blocks(self, block_size=BLOCK_SIZE, start=0, stop=None):
+
+        """
+        Iterate over the signal in blocks.
+        input:
+            block_size: number of samples per block
+            start, stop: sample range to iterate over
+        output:
+            yields views of at most block_size samples
+        """
+
+        return iter_blocks(self.data, block_size, start, stop)
+
+    def close(self):
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_blocks(data, block_size=BLOCK_SIZE, start=0, stop=None):
+
+    """
+    Iterate over an array in blocks along the first axis.
+    The yielded blocks are views into data.
+    """
+
+    stop = len(data) if stop is None else min(stop, len(data))
+    for pos in range(start, stop, block_size):
+        yield data[pos:min(pos + block_size, stop)]
+
+
+# === Writing ===
+class WavWriter:
+
+    """
+    Incremental WAV writer.
+    Blocks are appended as they arrive and the RIFF/data sizes are patched
+    when the writer is closed.
+    input:
+        filename: path of the WAV file to create
+        rate: sample rate
+        channels: number of channels
+        dtype: sample type written to the file (int16, int32 or float32)
+    """
+
+    def __init__(self, filename, rate, channels=1, dtype=np.int16):
+        self.filename = filename
+        self.rate = int(rate)
+        self.channels = int(channels)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.int16), np.dtype(np.int32), np.dtype(np.float32)):
+            raise ValueError(f"Unsupported WAV sample type: {self.dtype}")
+        self.frames = 0
+        self._file = open(filename, "wb")
+        self._write_header()
+
+    def write(self, block):
+
+        """
+        Append a block of samples, shape (N,) or (N, channels).
+        """
+
+        block = np.asarray(block)
+        if block.ndim == 1:
+            block = block[:, None]
+        if block.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channels, got {block.shape[1]}")
+        self._file.write(np.ascontiguousarray(block, dtype=self.dtype.newbyteorder("<")).tobytes())
+        self.frames += block.shape[0]
+
+    def close(self):
+
+        """
+        Patch the header with the final sizes and close the file.
+        """
+
+        if self._file is None:
+            return
+        data_bytes = self.frames * self.channels * self.dtype.itemsize
+        if data_bytes % 2:
+            self._file.write(b"\x00")  # RIFF chunks are word aligned
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", 36 + data_bytes + data_bytes % 2))
+        self._file.seek(40)
+        self._file.write(struct.pack("<I", data_bytes))
+        self._file.close()
+        self._file = None
+
+    def _write_header(self):
+        fmt = _FORMAT_FLOAT if self.dtype.kind == "f" else _FORMAT_PCM
+        bits = self.dtype.itemsize * 8
+        block_align = self.channels * self.dtype.itemsize
+        self._file.write(b"RIFF" + struct.pack("<I", 36) + b"WAVE")
+        self._file.write(b"fmt " + struct.pack("<IHHIIHH", 16, fmt, self.channels, self.rate,
+                                               self.rate * block_align, block_align, bits))
+        self._file.write(b"data" + struct.pack("<I", 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
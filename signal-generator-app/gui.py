@@ -8,6 +8,8 @@ def create_window():
         [sg.Text('Phase (rad):'), sg.InputText('0', key='phase')],
         [sg.Text('Offset:'), sg.InputText('0', key='offset')],
         [sg.Text('Duration (s):'), sg.InputText('2', key='duration')],
-        [sg.Button('Generate & Plot'), sg.Button('Play'),sg.Button('Export'), sg.Button('Clear'), sg.Button('Exit')],
+        [sg.Text('Harmonics (Custom):'), sg.InputText('1, 0.5, 0.33, 0.25', key='harmonics')],
+        [sg.Text('Noise Color:'), sg.Combo(['White', 'Pink', 'Brown'], default_value='White', key='color')],
+        [sg.Button('Generate & Plot'), sg.Button('Play'), sg.Button('Stop'), sg.Checkbox('Loop', key='loop'), sg.Button('Export'), sg.Button('Clear'), sg.Button('Exit')],
     ]
     return sg.Window('Signal Generator', layout)
@@ -1,6 +1,6 @@
 from gui import create_window
 import PySimpleGUI as sg
-from signals import generate_sine, generate_square, generate_triangle, generate_sawtooth
+from signals import generate_sine, generate_square, generate_triangle, generate_sawtooth, generate_custom, generate_noise
 import plotter
 import player
 
@@ -28,20 +28,28 @@ while True:
         elif signal_type == 'Sawtooth':
             t, signal = generate_sawtooth(freq, amp, phase, offset, duration, fs)
         elif signal_type == 'Custom':
-            # Custom signal generation logic can be added here
-            sg.popup_error('Custom signal generation not implemented yet!')
-            continue
+            # Amplitudes of the harmonics 1, 2, 3, ... separated by commas
+            try:
+                harmonics = [float(h) for h in values['harmonics'].split(',') if h.strip()]
+            except ValueError:
+                sg.popup_error('Harmonics must be numbers separated by commas!')
+                continue
+            if not harmonics:
+                sg.popup_error('Enter at least one harmonic amplitude!')
+                continue
+            t, signal = generate_custom(freq, amp, phase, offset, duration, fs, harmonics)
         elif signal_type == 'Noise':
-            # Noise signal generation logic can be added here
-            sg.popup_error('Noise signal generation not implemented yet!')
-            continue
+            t, signal = generate_noise(amp, offset, duration, fs, values['color'].lower())
         else:
             sg.popup_error('Unsupported signal type!')
             continue
 
         plotter.plot_signal(t, signal, title=f"{signal_type} Wave")
     elif event == 'Play':
-        player.play_signal(signal, fs)
+        # Streams in the background, so the window stays responsive
+        player.play_signal(signal, fs, loop=values['loop'])
+    elif event == 'Stop':
+        player.stop_signal()
     elif event == 'Export':
         player.export_signal(signal, fs)
     elif event == 'Clear':
@@ -50,4 +58,5 @@ while True:
         sg.popup('function not implemented yet!')
     elif event == 'Exit':
         break
+player.stop_signal()
 window.close()
\ No newline at end of file
@@ -1,16 +1,134 @@
 # signal-generator-app/player.py
 # This module is responsible for playing the generated audio signal.
-# It uses the sounddevice library to play the audio signal through the default output device.
+# It streams the signal to the default output device through a callback-driven
+# sounddevice OutputStream: play_signal returns at once, the callback copies one
+# block of the signal per call, and stop_signal ends the playback at any time.
 
 # The play_signal function takes the generated signal and the sampling frequency as input parameters.
-import sounddevice as sd
-from scipy.io.wavfile import write 
+import threading
+import time
+import numpy as np
+from scipy.io.wavfile import write
 import PySimpleGUI as sg
 
-def play_signal(signal, fs):
-    sd.play(signal, fs)
-    sd.wait()
-    
+BLOCK_SIZE = 1024  # frames per callback
+
+_player = None  # the Player that is playing, if any
+
+
+class NullOutputStream:
+    # Stand-in for sd.OutputStream that discards the audio, for running without a sound card
+    def __init__(self, samplerate, blocksize, channels, callback, **kwargs):
+        self.period = blocksize / samplerate
+        self.outdata = np.zeros((blocksize, channels), dtype=np.float32)
+        self.callback = callback
+        self.active = False
+        self._thread = None
+
+    def start(self):
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self.active:
+            self.callback(self.outdata, len(self.outdata), None, None)
+            time.sleep(self.period)
+
+    def stop(self):
+        self.active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+
+class Player:
+    # Plays a signal block by block from the audio callback
+    def __init__(self, signal, fs, loop=False, null=False):
+        signal = np.asarray(signal, dtype=np.float32)
+        self.signal = signal[:, None] if signal.ndim == 1 else signal
+        self.fs = fs
+        self.loop = loop
+        self.null = null
+        self.position = 0    # next frame to play
+        self.underruns = 0   # callbacks the device reported as late
+        self.finished = threading.Event()
+        self.stream = None
+        self._stream_lock = threading.Lock()  # stop() runs on the caller's and the closer thread
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status:
+            self.underruns += 1
+        n = len(self.signal)
+        written = 0
+        while written < frames:
+            if self.position >= n:
+                if not (self.loop and n):
+                    break
+                self.position = 0
+            m = min(frames - written, n - self.position)
+            outdata[written:written + m] = self.signal[self.position:self.position + m]
+            self.position += m
+            written += m
+        if written < frames:
+            outdata[written:] = 0
+            self.finished.set()
+
+    def start(self):
+        if self.null:
+            stream_class = NullOutputStream
+        else:
+            import sounddevice as sd
+            stream_class = sd.OutputStream
+        self.stream = stream_class(samplerate=self.fs, blocksize=BLOCK_SIZE, channels=self.signal.shape[1],
+                                   dtype='float32', callback=self._callback)
+        self.stream.start()
+        # Close the stream from a helper thread once the end of the signal was played
+        threading.Thread(target=self._close_when_finished, daemon=True).start()
+
+    def _close_when_finished(self):
+        self.finished.wait()
+        self.stop()
+
+    def stop(self):
+        self.finished.set()
+        with self._stream_lock:
+            stream, self.stream = self.stream, None
+            if stream is not None:
+                stream.stop()
+                stream.close()
+
+    def seek(self, seconds):
+        self.position = int(np.clip(seconds * self.fs, 0, len(self.signal)))
+
+    @property
+    def playing(self):
+        return self.stream is not None and not self.finished.is_set()
+
+
+def play_signal(signal, fs, loop=False, null=False):
+    # Start playing and return immediately; a running playback is stopped first
+    global _player
+    stop_signal()
+    _player = Player(signal, fs, loop=loop, null=null)
+    _player.start()
+    return _player
+
+
+def stop_signal():
+    global _player
+    if _player is not None:
+        _player.stop()
+        _player = None
+
+
+def wait_signal():
+    # Block until the playback reached the end of the signal (or was stopped)
+    if _player is not None:
+        _player.finished.wait()
+
 # This function exports the generated signal to a WAV file.
 # It uses the scipy.io.wavfile module to write the signal to a file.
 def export_signal(signal, fs):
@@ -20,8 +138,8 @@ def export_signal(signal, fs):
             filename += '.wav'
         # Ensure the signal is in the correct format for writing
         signal = (signal * 32767).astype('int16')
-        # Write the signal to a WAV file    
+        # Write the signal to a WAV file
         write(filename, fs, signal)
         sg.popup('Signal exported successfully!')
     else:
-        sg.popup('Export cancelled!')
\ No newline at end of file
+        sg.popup('Export cancelled!')
@@ -1,19 +1,29 @@
-import numpy as np
+# signal-generator-app/signals.py
+# Waveform generators built on the synthesis engine in synth.py:
+# phase accumulators in float32, band-limited (PolyBLEP) square/triangle/sawtooth,
+# and a time axis that is shared instead of rebuilt for every waveform.
+from synth import Voice, render, time_axis
+
+def _generate(voice, duration, fs):
+    y = render([voice], duration, fs)[0]
+    return time_axis(len(y), fs), y
 
 def generate_sine(freq, amp, phase, offset, duration, fs):
-    t = np.linspace(0, duration, int(fs * duration), endpoint=False)
-    return t, amp * np.sin(2 * np.pi * freq * t + phase) + offset
+    return _generate(Voice('sine', freq, amp, phase, offset), duration, fs)
 
 def generate_square(freq, amp, phase, offset, duration, fs):
-    t = np.linspace(0, duration, int(fs * duration), endpoint=False)
-    return t, amp * np.sign(np.sin(2 * np.pi * freq * t + phase)) + offset
+    return _generate(Voice('square', freq, amp, phase, offset), duration, fs)
 
 def generate_triangle(freq, amp, phase, offset, duration, fs):
-    t = np.linspace(0, duration, int(fs * duration), endpoint=False)
-    t_shifted = t + phase / (2 * np.pi * freq)
-    return t, amp * (2 * np.abs(2 * (t_shifted * freq - np.floor(t_shifted * freq + 0.5))) - 1) + offset
+    return _generate(Voice('triangle', freq, amp, phase, offset), duration, fs)
 
 def generate_sawtooth(freq, amp, phase, offset, duration, fs):
-    t = np.linspace(0, duration, int(fs * duration), endpoint=False)
-    t_shifted = t + phase / (2 * np.pi * freq)
-    return t, amp * (2 * (t_shifted * freq - np.floor(t_shifted * freq + 0.5))) + offset
\ No newline at end of file
+    return _generate(Voice('sawtooth', freq, amp, phase, offset), duration, fs)
+
+# Additive signal: harmonics are the amplitudes of partials 1, 2, 3, ... (normalized to a peak of amp)
+def generate_custom(freq, amp, phase, offset, duration, fs, harmonics):
+    return _generate(Voice('custom', freq, amp, phase, offset, harmonics=harmonics), duration, fs)
+
+# color: 'white', 'pink' or 'brown'
+def generate_noise(amp, offset, duration, fs, color='white', seed=None):
+    return _generate(Voice('noise', amp=amp, offset=offset, color=color, seed=seed), duration, fs)
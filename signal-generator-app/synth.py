@@ -0,0 +1,320 @@
+# signal-generator-app/synth.py
+# Vectorized, band-limited waveform synthesis.
+#
+# Every oscillator runs from a phase accumulator: the phase (in cycles, 0..1)
+# of each block is start + n * freq / fs, computed in float32 from one shared
+# ramp buffer, while the start phase of each block is carried in float64, so
+# the phase never drifts however long the signal is. Many waveforms are
+# rendered in one call, as rows of a (K, N) float32 array, which is how large
+# calibration test sets are generated.
+#
+# Square and sawtooth are band-limited with PolyBLEP (a 2-sample polynomial
+# correction at each step), the triangle with PolyBLAMP (the same at each
+# corner). method='wavetable' renders them, and custom additive signals, from
+# single-cycle tables that only hold the harmonics below Nyquist.
+# Noise is white, pink (1/f) or brown (1/f^2), shaped in the frequency domain.
+
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence
+import numpy as np
+
+# === Constants ===
+BLOCK_SIZE = 1024    # samples per phase block (keeps float32 phase error below 1e-4 cycles)
+TABLE_SIZE = 4096    # samples per wavetable cycle
+WAVEFORMS = ('sine', 'square', 'triangle', 'sawtooth', 'custom', 'noise')
+NOISE_COLORS = ('white', 'pink', 'brown')
+
+
+class Voice(NamedTuple):
+    """
+    One waveform to render.
+    kind: one of WAVEFORMS
+    freq: frequency in Hz
+    amp: peak amplitude
+    phase: start phase in radians
+    offset: DC offset
+    harmonics: for 'custom', amplitudes of the sine partials 1, 2, 3, ...
+               (or complex coefficients, see harmonics_from_cycle)
+    color: for 'noise', one of NOISE_COLORS
+    seed: for 'noise', random seed (None for a fresh one)
+    """
+    kind: str
+    freq: float = 440.0
+    amp: float = 1.0
+    phase: float = 0.0
+    offset: float = 0.0
+    harmonics: Optional[Sequence] = None
+    color: str = 'white'
+    seed: Optional[int] = None
+
+
+# === Band-limiting corrections ===
+def _distance(p, corner, dt):
+    # Signed distance from each phase to a discontinuity, in samples
+    d = p - corner + 0.5
+    d -= np.floor(d)
+    d -= 0.5
+    return np.clip(d / dt, -1.0, 1.0)
+
+
+def _blep(t):
+    # PolyBLEP residual of a unit step at t = 0 (zero for |t| >= 1)
+    return np.where(t >= 0, -0.5 * (1 - t) ** 2, 0.5 * (1 + t) ** 2)
+
+
+def _blamp(t):
+    # PolyBLAMP residual of a unit slope change at t = 0 (the integral of _blep)
+    return np.where(t >= 0, (1 - t) ** 3, (1 + t) ** 3) / 6
+
+
+def _sawtooth(p, dt):
+    # 0 at phase 0, rising to +1 and jumping to -1 at phase 0.5 (as the original generator)
+    y = 2 * ((p + np.float32(0.5)) % np.float32(1.0)) - 1
+    y -= 2 * _blep(_distance(p, 0.5, dt))
+    return y
+
+
+def _square(p, dt):
+    y = np.where(p < 0.5, 1.0, -1.0).astype(np.float32)
+    y += 2 * _blep(_distance(p, 0.0, dt))
+    y -= 2 * _blep(_distance(p, 0.5, dt))
+    return y
+
+
+def _triangle(p, dt):
+    # -1 at phase 0, +1 at phase 0.5; the slope changes by +-8 dt per sample at the corners
+    y = 1 - 4 * np.abs(p - 0.5)
+    y += 8 * dt * (_blamp(_distance(p, 0.0, dt)) - _blamp(_distance(p, 0.5, dt)))
+    return y
+
+
+def _sine(p, dt):
+    return np.sin(np.float32(2 * np.pi) * p)
+
+
+_POLYBLEP = {'sine': _sine, 'square': _square, 'triangle': _triangle, 'sawtooth': _sawtooth}
+
+
+# === Wavetables ===
+def _shape_coefficients(kind, count):
+    # Fourier coefficients c_k (k = 1..count) of the naive shapes, cycle = sum Re(c_k e^(2 pi i k p))
+    k = np.arange(1, count + 1)
+    odd = k % 2 == 1
+    if kind == 'sawtooth':
+        # Jump at phase 0.5: the saw 2p - 1 shifted by half a cycle
+        return 2j * (-1.0) ** k / (np.pi * k)
+    if kind == 'square':
+        return np.where(odd, -4j / (np.pi * k), 0)
+    if kind == 'triangle':
+        return np.where(odd, -8 / (np.pi * k) ** 2, 0).astype(complex)
+    if kind == 'sine':
+        return np.where(k == 1, -1j, 0)
+    raise ValueError(f"No wavetable for '{kind}'")
+
+
+def harmonics_from_cycle(cycle):
+
+    """
+    Complex harmonic coefficients of one drawn cycle, for Voice(harmonics=...).
+    The DC component is dropped (use the offset instead).
+    """
+
+    cycle = np.asarray(cycle, dtype=np.float64)
+    return (np.fft.rfft(cycle) * 2 / len(cycle))[1:]
+
+
+def _coefficients(harmonics):
+    c = np.asarray(harmonics)
+    if np.iscomplexobj(c):
+        return c.astype(complex)
+    return -1j * c.astype(np.float64)  # sine partial amplitudes
+
+
+@lru_cache(maxsize=256)
+def _table(kind, count, harmonics=None):
+    # One band-limited cycle with TABLE_SIZE + 1 samples (the last repeats the first)
+    c = _coefficients(harmonics)[:count] if kind == 'custom' else _shape_coefficients(kind, count)
+    spectrum = np.zeros(TABLE_SIZE // 2 + 1, dtype=complex)
+    spectrum[1:len(c) + 1] = c * TABLE_SIZE / 2
+    table = np.fft.irfft(spectrum, TABLE_SIZE)
+    if kind == 'custom':
+        peak = np.max(np.abs(table))
+        table = table / peak if peak > 0 else table
+    table = np.append(table, table[0]).astype(np.float32)
+    table.setflags(write=False)
+    return table
+
+
+def wavetable(kind, freq, fs, harmonics=None):
+
+    """
+    Band-limited single-cycle table for a waveform at a given frequency:
+    only harmonics below fs / 2 are kept. Custom tables are normalized to a
+    peak of 1. Tables are cached.
+    """
+
+    count = int(np.ceil(fs / 2 / freq)) - 1 if freq > 0 else TABLE_SIZE // 2 - 1
+    count = max(1, min(count, TABLE_SIZE // 2 - 1))
+    if kind == 'custom':
+        if harmonics is None:
+            raise ValueError("A custom voice needs harmonics")
+        harmonics = tuple(np.asarray(harmonics).tolist())
+    return _table(kind, count, harmonics)
+
+
+def _lookup(tables, p):
+    # Linear interpolation in one table per row
+    x = p * np.float32(TABLE_SIZE)
+    i = np.minimum(x.astype(np.int64), TABLE_SIZE - 1)
+    frac = x - i
+    y0 = np.take_along_axis(tables, i, axis=1)
+    y1 = np.take_along_axis(tables, i + 1, axis=1)
+    return y0 + frac * (y1 - y0)
+
+
+# === Noise ===
+def noise(color, n, count=1, seed=None):
+
+    """
+    Noise with a peak amplitude of 1.
+    input:
+        color: 'white', 'pink' (-3 dB/octave) or 'brown' (-6 dB/octave)
+        n: samples per signal
+        count: number of independent signals
+        seed: random seed
+    output:
+        float32 array of shape (count, n)
+    """
+
+    rng = np.random.default_rng(seed)
+    if color == 'white':
+        return rng.uniform(-1, 1, (count, n)).astype(np.float32)
+    if color not in NOISE_COLORS:
+        raise ValueError(f"Unknown noise color '{color}'")
+    # Shape white noise in the frequency domain: no filter state, no random-walk drift
+    spectrum = np.fft.rfft(rng.standard_normal((count, n)), axis=1)
+    f = np.arange(spectrum.shape[1], dtype=np.float64)
+    f[0] = np.inf  # no DC
+    spectrum /= np.sqrt(f) if color == 'pink' else f
+    y = np.fft.irfft(spectrum, n, axis=1)
+    peak = np.max(np.abs(y), axis=1, keepdims=True)
+    y /= np.where(peak > 0, peak, 1)
+    return y.astype(np.float32)
+
+
+# === Engine ===
+class Synth:
+
+    """
+    Renders batches of voices, reusing its phase buffers between calls.
+    One Synth is not meant to be shared between threads.
+    input:
+        block_size: samples per phase block
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._ramp = np.arange(block_size, dtype=np.float32)
+        self._phase = np.empty((0, block_size), dtype=np.float32)
+        self._times = {}
+
+    def time_axis(self, n, fs):
+
+        """
+        Time of each sample in seconds, shared by all calls with the same n and fs.
+        float64 like the phase accumulator: float32 cannot tell neighbouring
+        samples apart in long renders (600 s at 48 kHz).
+        """
+
+        key = (n, fs)
+        if key not in self._times:
+            t = np.arange(n, dtype=np.float64) / fs
+            t.setflags(write=False)
+            self._times = {key: t}  # keep only the latest axis
+        return self._times[key]
+
+    def _phase_buffer(self, rows):
+        if self._phase.shape[0] < rows:
+            self._phase = np.empty((rows, self.block_size), dtype=np.float32)
+        return self._phase[:rows]
+
+    def render(self, voices, duration, fs, method='polyblep', out=None):
+
+        """
+        Render voices into the rows of one array.
+        input:
+            voices: sequence of Voice
+            duration: length in seconds
+            fs: sampling frequency in Hz
+            method: 'polyblep' or 'wavetable' for square, triangle and sawtooth
+            out: optional float32 array of shape (len(voices), N) to render into
+        output:
+            float32 array of shape (len(voices), N), N = int(fs * duration)
+        """
+
+        n = int(fs * duration)
+        if out is None:
+            out = np.empty((len(voices), n), dtype=np.float32)
+        kinds = {}
+        for row, voice in enumerate(voices):
+            if voice.kind not in WAVEFORMS:
+                raise ValueError(f"Unknown waveform '{voice.kind}'")
+            kinds.setdefault(voice.kind, []).append(row)
+
+        for kind, rows in kinds.items():
+            group = [voices[r] for r in rows]
+            if kind == 'noise':
+                for r, v in zip(rows, group):
+                    out[r] = noise(v.color, n, seed=v.seed)[0]
+            elif kind == 'custom' or (method == 'wavetable' and kind != 'sine'):
+                tables = np.stack([wavetable(kind, v.freq, fs, v.harmonics) for v in group])
+                self._oscillate(out, rows, group, fs, n, lambda p, dt: _lookup(tables, p))
+            elif method in ('polyblep', 'wavetable'):
+                self._oscillate(out, rows, group, fs, n, _POLYBLEP[kind])
+            else:
+                raise ValueError(f"Unknown method '{method}'")
+
+        amp = np.array([v.amp for v in voices], dtype=np.float32)[:, None]
+        offset = np.array([v.offset for v in voices], dtype=np.float32)[:, None]
+        out *= amp
+        out += offset
+        return out
+
+    def _oscillate(self, out, rows, group, fs, n, shape):
+        # Phase accumulator: float32 within a block, float64 start phase between blocks
+        inc = np.array([v.freq / fs for v in group], dtype=np.float64)
+        start = np.mod([v.phase / (2 * np.pi) for v in group], 1.0)
+        inc32 = inc.astype(np.float32)[:, None]
+        dt = np.abs(inc32) + np.float32(1e-12)
+        rows = np.asarray(rows)
+        phase = self._phase_buffer(len(rows))
+        for b0 in range(0, n, self.block_size):
+            m = min(self.block_size, n - b0)
+            p = phase[:, :m]
+            np.multiply(self._ramp[:m], inc32, out=p)
+            p += start.astype(np.float32)[:, None]
+            np.remainder(p, np.float32(1.0), out=p)
+            np.minimum(p, np.float32(1.0 - 2 ** -24), out=p)  # remainder can round up to 1.0
+            out[rows, b0:b0 + m] = shape(p, dt)
+            start = np.mod(start + m * inc, 1.0)
+
+
+_synth = Synth()
+
+
+def render(voices, duration, fs, method='polyblep', out=None):
+
+    """
+    Render voices with the shared engine, see Synth.render.
+    """
+
+    return _synth.render(voices, duration, fs, method, out)
+
+
+def time_axis(n, fs):
+
+    """
+    Shared float64 time axis, see Synth.time_axis.
+    """
+
+    return _synth.time_axis(n, fs)
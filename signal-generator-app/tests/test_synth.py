@@ -0,0 +1,43 @@
+# signal-generator-app/tests/test_synth.py
+# The band-limited generators keep the waveform conventions of the original
+# naive generators; they only differ around the discontinuities.
+import numpy as np
+import pytest
+
+import signals
+import synth
+
+FS = 48000
+
+
+def naive_sawtooth(freq, phase, t):
+    # The generator before band-limiting: 0 at phase 0, jump at phase 0.5
+    x = (t + phase / (2 * np.pi * freq)) * freq
+    return 2 * (x - np.floor(x + 0.5))
+
+
+@pytest.mark.parametrize('phase', [0.0, 0.7, 2.0, -1.0])
+@pytest.mark.parametrize('method', ['polyblep', 'wavetable'])
+def test_sawtooth_matches_naive(phase, method):
+    freq = 100.0
+    t = np.arange(FS) / FS
+    y = synth.render([synth.Voice('sawtooth', freq, 1.0, phase)], 1.0, FS, method=method)[0]
+    naive = naive_sawtooth(freq, phase, t)
+    # Away from the jumps the band-limited saw follows the naive one
+    x = (t + phase / (2 * np.pi * freq)) * freq
+    jump = np.abs((x + 0.5) - np.round(x + 0.5)) * FS / freq
+    smooth = jump > (2 if method == 'polyblep' else 200)
+    assert np.max(np.abs(y - naive)[smooth]) < 0.02
+    assert np.mean(np.abs(y - naive)) < 0.01
+
+
+def test_generate_sawtooth_starts_at_zero():
+    _, y = signals.generate_sawtooth(100, 1, 0, 0, 0.01, FS)
+    np.testing.assert_allclose(y[:3], [0, 2 * 100 / FS, 4 * 100 / FS], atol=1e-6)
+
+
+def test_time_axis_resolves_long_renders():
+    n = 600 * FS
+    t = synth.time_axis(n, FS)
+    assert t[-1] == pytest.approx((n - 1) / FS, abs=1e-9)
+    assert np.all(np.diff(t[-100000:]) > 0)